@@ -1,16 +1,30 @@
+import atexit
 import logging
 import sys
 import os
 
+from src import api, tracing
 from src.workers import Signer, Validator
+from src.workers.backfill import Backfill
+from src.workers.web import WebScanner
+from src.workers.aio import AsyncSigner, AsyncValidator, AsyncWebScanner
+from src.workers.supervisor import Supervisor
 
 
 def print_help():
     print(
-        f'Usage:\n  {sys.orig_argv[0]} {sys.argv[0]} WORKER_TYPE [WORKER_NAME]\nExample:'
+        f'Usage:\n  {sys.orig_argv[0]} {sys.argv[0]} [--async] [--backfill] [--profile] WORKER_TYPE [WORKER_NAME]'
+        f'\nExample:'
         f'\n  {sys.orig_argv[0]} {sys.argv[0]} validator'
         f'\n  {sys.orig_argv[0]} {sys.argv[0]} signer'
         f'\n  {sys.orig_argv[0]} {sys.argv[0]} signer lister'
+        f'\n  {sys.orig_argv[0]} {sys.argv[0]} signer combined'
+        f'\n  {sys.orig_argv[0]} {sys.argv[0]} --async validator'
+        f'\n  {sys.orig_argv[0]} {sys.argv[0]} --profile validator'
+        f'\n  {sys.orig_argv[0]} {sys.argv[0]} webscanner'
+        f'\n  {sys.orig_argv[0]} {sys.argv[0]} --backfill webscanner'
+        f'\n  {sys.orig_argv[0]} {sys.argv[0]} supervisor bridges.yml'
+        f'\n  {sys.orig_argv[0]} {sys.argv[0]} api'
     )
 
 
@@ -18,21 +32,36 @@ if '-h' in sys.argv or '--help' in sys.argv:
     print_help()
     sys.exit(0)
 
-if len(sys.argv) < 2:
+flags = {arg for arg in sys.argv[1:] if arg.startswith('--')}
+args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+
+if len(args) < 1:
     print_help()
     sys.exit(1)
 
 worker_name = None
-worker_type = sys.argv[1]
-if len(sys.argv) > 2:
-    worker_name = sys.argv[2]
+worker_type = args[0]
+if len(args) > 1:
+    worker_name = args[1]
 
 workers = {
     'validator': Validator,
-    'signer': Signer
+    'signer': Signer,
+    'webscanner': WebScanner
 }
+if '--async' in flags:
+    workers = {
+        'validator': AsyncValidator,
+        'signer': AsyncSigner,
+        'webscanner': AsyncWebScanner
+    }
+
+if '--async' in flags and (worker_type == 'supervisor' or flags & {'--backfill', '--profile'}):
+    # the supervisor threads, the backfill pool and the tracer run sync workers only
+    print('--async runs a single validator, signer or webscanner, without --backfill and --profile')
+    sys.exit(1)
 
-if worker_type not in workers:
+if worker_type not in ('supervisor', 'api') and worker_type not in workers:
     print(f'No worker named {worker_type}')
     sys.exit(1)
 
@@ -45,5 +74,28 @@ log.setLevel(logging.DEBUG)
 
 in_debug = os.getenv('IN_DEBUG', 'false') == 'true'
 
+if '--profile' in flags:
+    # per-event waterfalls and the slowest calls are printed when the worker stops
+    tracing.TRACER.enable()
+    atexit.register(lambda: print(tracing.TRACER.report(), file=sys.stderr))
+
+if worker_type == 'api':
+    api.serve()
+    sys.exit(0)
+
+if worker_type == 'supervisor':
+    # worker name is the path of the bridges config, every worker runs in a thread of this process
+    if worker_name is None:
+        print_help()
+        sys.exit(1)
+    Supervisor.from_file(worker_name, debug=in_debug).run()
+    sys.exit(0)
+
 worker = workers[worker_type](name=worker_name, debug=in_debug)
-worker.listen()
+if '--backfill' in flags and isinstance(worker, WebScanner):
+    # history is indexed by a process pool first, the scanner follows the chain from where it stopped
+    Backfill(worker).run()
+if '--async' in flags:
+    worker.run()
+else:
+    worker.listen()
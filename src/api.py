@@ -0,0 +1,225 @@
+import base64
+import hashlib
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+import typing
+import urllib.parse
+
+from src.models import Transfer, init_db
+
+
+__all__ = ['ApiConfig', 'TransferAPI', 'serve']
+
+
+class ApiConfig(object):
+    api_host: str = os.getenv('API_HOST', '0.0.0.0')
+    api_port: int = int(os.getenv('API_PORT', '8080'))
+    # responses are cached and may be cached by clients this long
+    api_cache_ttl: float = float(os.getenv('API_CACHE_TTL_S', '2'))
+    api_page_size: int = int(os.getenv('API_PAGE_SIZE', '50'))
+    api_max_page_size: int = int(os.getenv('API_MAX_PAGE_SIZE', '200'))
+    # Access-Control-Allow-Origin of responses: *, or comma separated origins of the frontend, empty for none
+    api_cors_origin: str = os.getenv('API_CORS_ORIGIN', '*')
+
+
+class TransferAPI(object):
+    """
+    Read API of the transfer index for the web frontend:
+
+        GET /transfers/<txHash>
+        GET /transfers?sender_chain_id=1284&receiver_chain_id=1&limit=50&cursor=...
+
+    Listings are newest listed first and paginated by keyset: the cursor is the (listed block, id) of the
+    last row, so every page is one indexed range query whatever its depth. Responses carry an ETag and are
+    cached for cache_ttl seconds, repeated polls of a status page are answered from memory or with 304. Concurrent
+    requests missing the cache wait for the one computing the page instead of each running the query.
+    """
+    FIELDS = (
+        Transfer.id, Transfer._tx_hash, Transfer.sender_chain_id, Transfer.receiver_chain_id,
+        Transfer.deposit_event_block_id, Transfer.listed_event_block_id, Transfer.validator_confirmations
+    )
+
+    class ApiError(Exception):
+        def __init__(self, status: int, message: str):
+            self.status = status
+            self.message = message
+
+    def __init__(self, config: ApiConfig = None):
+        self.config = config or ApiConfig()
+        self._lock = threading.Lock()
+        # path with query -> (expires at, status, body, etag)
+        self._cache: typing.Dict[str, typing.Tuple[float, int, bytes, str]] = {}
+        # path with query -> set once the request computing it is done
+        self._computing: typing.Dict[str, threading.Event] = {}
+        self._origins = [origin.strip() for origin in self.config.api_cors_origin.split(',') if origin.strip()]
+
+    @classmethod
+    def serialize(cls, row: dict) -> dict:
+        return {
+            'tx_hash': f'0x{row["_tx_hash"]}',
+            'sender_chain_id': row['sender_chain_id'],
+            'receiver_chain_id': row['receiver_chain_id'],
+            'deposit_event_block_id': row['deposit_event_block_id'],
+            'listed_event_block_id': row['listed_event_block_id'],
+            'validator_confirmations': row['validator_confirmations'],
+        }
+
+    @classmethod
+    def encode_cursor(cls, row: dict) -> str:
+        return base64.urlsafe_b64encode(f'{row["listed_event_block_id"]}:{row["id"]}'.encode()).decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> typing.Tuple[int, int]:
+        try:
+            block_id, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+            return int(block_id), int(row_id)
+        except ValueError:
+            raise cls.ApiError(400, 'Invalid cursor')
+
+    @classmethod
+    def int_param(cls, query: dict, name: str, default: typing.Optional[int] = None) -> typing.Optional[int]:
+        if name not in query:
+            return default
+        try:
+            return int(query[name][-1])
+        except ValueError:
+            raise cls.ApiError(400, f'Invalid {name}')
+
+    def get_transfer(self, tx_hash: str) -> dict:
+        tx_hash = Transfer.prep_tx_hash(tx_hash)
+        if len(tx_hash) != 64:
+            raise self.ApiError(400, 'Invalid txHash')
+        row = Transfer.select(*self.FIELDS).where(Transfer._tx_hash == tx_hash).dicts().first()
+        if row is None:
+            raise self.ApiError(404, 'Transfer not found')
+        return self.serialize(row)
+
+    def list_transfers(self, query: dict) -> dict:
+        sender_chain_id = self.int_param(query, 'sender_chain_id')
+        receiver_chain_id = self.int_param(query, 'receiver_chain_id')
+        if sender_chain_id is None and receiver_chain_id is None:
+            # without a chain the listing could not use an index
+            raise self.ApiError(400, 'sender_chain_id or receiver_chain_id is required')
+        limit = min(max(self.int_param(query, 'limit', self.config.api_page_size), 1), self.config.api_max_page_size)
+
+        select = Transfer.select(*self.FIELDS)
+        if sender_chain_id is not None:
+            select = select.where(Transfer.sender_chain_id == sender_chain_id)
+        if receiver_chain_id is not None:
+            select = select.where(Transfer.receiver_chain_id == receiver_chain_id)
+        if 'cursor' in query:
+            block_id, row_id = self.decode_cursor(query['cursor'][-1])
+            select = select.where(
+                (Transfer.listed_event_block_id < block_id)
+                | ((Transfer.listed_event_block_id == block_id) & (Transfer.id < row_id))
+            )
+        rows = list(select.order_by(Transfer.listed_event_block_id.desc(), Transfer.id.desc()).limit(limit + 1).dicts())
+        return {
+            'items': [self.serialize(row) for row in rows[:limit]],
+            'next': self.encode_cursor(rows[limit - 1]) if len(rows) > limit else None,
+        }
+
+    def route(self, path: str) -> typing.Tuple[int, dict]:
+        url = urllib.parse.urlsplit(path)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            if parts == ['transfers']:
+                return 200, self.list_transfers(urllib.parse.parse_qs(url.query))
+            if len(parts) == 2 and parts[0] == 'transfers':
+                return 200, self.get_transfer(parts[1])
+            raise self.ApiError(404, 'Not found')
+        except self.ApiError as e:
+            return e.status, {'error': e.message}
+
+    def compute(self, path: str) -> typing.Tuple[float, int, bytes, str]:
+        now = time.monotonic()
+        status, payload = self.route(path)
+        body = json.dumps(payload).encode('utf-8')
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        return now + self.config.api_cache_ttl, status, body, etag
+
+    def cached(self, path: str) -> typing.Tuple[float, int, bytes, str]:
+        """The response of path from the cache, computed by one request at a time"""
+        while True:
+            with self._lock:
+                cached = self._cache.get(path)
+                if cached is not None and cached[0] > time.monotonic():
+                    return cached
+                computing = self._computing.get(path)
+                if computing is None:
+                    computing = self._computing[path] = threading.Event()
+                    break
+            computing.wait()
+            with self._lock:
+                cached = self._cache.get(path)
+            # computed while waiting, else the computing request failed and this one tries
+            if cached is not None:
+                return cached
+        try:
+            cached = self.compute(path)
+            with self._lock:
+                now = time.monotonic()
+                for key in [key for key, item in self._cache.items() if item[0] <= now]:
+                    del self._cache[key]
+                self._cache[path] = cached
+            return cached
+        finally:
+            with self._lock:
+                del self._computing[path]
+            computing.set()
+
+    def cors_headers(self, origin: typing.Optional[str]) -> dict:
+        if '*' in self._origins:
+            return {'Access-Control-Allow-Origin': '*'}
+        if not self._origins:
+            return {}
+        # the allowed origin depends on the request, shared caches must keep the responses apart
+        if origin in self._origins:
+            return {'Access-Control-Allow-Origin': origin, 'Vary': 'Origin'}
+        return {'Vary': 'Origin'}
+
+    def respond(
+        self, path: str, if_none_match: typing.Optional[str] = None, origin: typing.Optional[str] = None
+    ) -> typing.Tuple[int, dict, bytes]:
+        """Returns status, headers and body of a GET request"""
+        _, status, body, etag = self.cached(path)
+        headers = {
+            'Content-Type': 'application/json', 'ETag': etag,
+            'Cache-Control': f'public, max-age={int(self.config.api_cache_ttl)}',
+            **self.cors_headers(origin),
+        }
+        if status == 200 and if_none_match == etag:
+            return 304, headers, b''
+        return status, headers, body
+
+
+class TransferRequestHandler(http.server.BaseHTTPRequestHandler):
+    api: TransferAPI
+    logger = logging.getLogger('worker.api')
+
+    def do_GET(self):
+        status, headers, body = self.api.respond(
+            self.path, self.headers.get('If-None-Match'), self.headers.get('Origin')
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.logger.debug(f'[worker.api] {self.address_string()} {format % args}')
+
+
+def serve(config: ApiConfig = None):
+    config = config or ApiConfig()
+    init_db()
+    handler = type('Handler', (TransferRequestHandler,), {'api': TransferAPI(config)})
+    server = http.server.ThreadingHTTPServer((config.api_host, config.api_port), handler)
+    logging.getLogger('worker.api').info(f'[worker.api] Serving transfers on {config.api_host}:{config.api_port}')
+    server.serve_forever()
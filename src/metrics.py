@@ -0,0 +1,182 @@
+import bisect
+import http.server
+import logging
+import threading
+import time
+import typing
+
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'Registry', 'REGISTRY', 'rpc_middleware', 'serve']
+
+
+class Metric(object):
+    TYPE = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        # label values -> value
+        self._values: typing.Dict[tuple, typing.Any] = {}
+
+    def key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} takes labels {self.label_names}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @classmethod
+    def format_labels(cls, names: typing.Sequence[str], values: typing.Sequence[str]) -> str:
+        if not names:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+        return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+    def samples(self) -> typing.List[str]:
+        with self._lock:
+            return [
+                f'{self.name}{self.format_labels(self.label_names, key)} {value}'
+                for key, value in sorted(self._values.items())
+            ]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}', *self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, name: str, documentation: str, label_names: typing.Sequence[str] = (),
+                 buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self._lock:
+            # per bucket counts (the last one is +Inf), sum
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> typing.List[str]:
+        lines = []
+        names = self.label_names + ('le',)
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip([*map(str, self.buckets), '+Inf'], counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{self.format_labels(names, key + (bound,))} {cumulative}')
+                lines.append(f'{self.name}_sum{self.format_labels(self.label_names, key)} {total}')
+                lines.append(f'{self.name}_count{self.format_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics: typing.List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: typing.Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: typing.Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: typing.Sequence[str] = (),
+                  buckets: typing.Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+RPC_LATENCY = REGISTRY.histogram(
+    'bridge_rpc_request_seconds', 'JSON-RPC request latency, batches have method "batch"', ('method', 'endpoint')
+)
+RPC_ERRORS = REGISTRY.counter('bridge_rpc_errors_total', 'Failed JSON-RPC requests', ('method', 'endpoint'))
+EVENTS = REGISTRY.counter('bridge_events_total', 'Bridge events fetched by a worker', ('worker',))
+BLOCKS = REGISTRY.counter('bridge_blocks_scanned_total', 'Blocks processed by a worker', ('worker',))
+HEAD_LAG = REGISTRY.gauge('bridge_head_lag_blocks', 'Chain head minus the last processed block', ('worker',))
+RANGE_SECONDS = REGISTRY.histogram(
+    'bridge_block_range_seconds', 'Time to process one block range', ('worker',)
+)
+TX_BATCH_ITEMS = REGISTRY.histogram(
+    'bridge_tx_batch_items', 'Items per mined batch transaction', ('chain_id', 'method'),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+TX_RECEIPT_LATENCY = REGISTRY.histogram(
+    'bridge_tx_receipt_seconds', 'Time from submission to receipt of a transaction', ('chain_id',)
+)
+TX_GAS_USED = REGISTRY.counter('bridge_tx_gas_used_total', 'Gas used by mined transactions', ('chain_id',))
+TX_FEES = REGISTRY.counter('bridge_tx_fees_wei_total', 'Fees paid by mined transactions', ('chain_id',))
+TX_BUMPS = REGISTRY.counter('bridge_tx_bumps_total', 'Stuck transactions re-sent with higher fees', ('chain_id',))
+CACHE_REQUESTS = REGISTRY.counter(
+    'bridge_cache_requests_total', 'Cache lookups by result (hit or miss)', ('cache', 'result')
+)
+
+
+def rpc_middleware(endpoint: str):
+    """web3 middleware timing every request sent to the endpoint"""
+    def middleware(make_request, w3):
+        def observe(method, params):
+            started = time.monotonic()
+            try:
+                return make_request(method, params)
+            except Exception:
+                RPC_ERRORS.inc(method=method, endpoint=endpoint)
+                raise
+            finally:
+                RPC_LATENCY.observe(time.monotonic() - started, method=method, endpoint=endpoint)
+        return observe
+    return middleware
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, host: str = '127.0.0.1') -> http.server.ThreadingHTTPServer:
+    """Serves the metrics on http://host:port/ from a daemon thread"""
+    server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.getLogger('worker.metrics').info(f'[worker.metrics] Serving metrics on {host}:{port}')
+    return server
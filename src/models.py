@@ -1,7 +1,14 @@
+import os
+import threading
+import typing
+
 import peewee
+from playhouse.db_url import connect
 from playhouse.hybrid import hybrid_property
+from playhouse.migrate import SchemaMigrator, migrate
 
 db = peewee.DatabaseProxy()
+_db_lock = threading.Lock()
 
 
 class BaseModel(peewee.Model):
@@ -15,11 +22,17 @@ class Transfer(BaseModel):
     receiver_chain_id = peewee.IntegerField(index=True)
     listed_event_block_id = peewee.IntegerField(default=0)
     validator_confirmations = peewee.IntegerField(default=0)
-    _tx_hash = peewee.CharField(max_length=64, index=True)
+    _tx_hash = peewee.CharField(max_length=64, unique=True)
 
     class Meta:
         table_name = 'transfer'
         only_save_dirty = True
+        # keyset pagination of the read API, newest listed first within a chain or a chain pair
+        indexes = (
+            (('sender_chain_id', 'listed_event_block_id', 'id'), False),
+            (('sender_chain_id', 'receiver_chain_id', 'listed_event_block_id', 'id'), False),
+            (('receiver_chain_id', 'listed_event_block_id', 'id'), False),
+        )
 
     @hybrid_property
     def tx_hash(self):
@@ -44,4 +57,142 @@ class Transfer(BaseModel):
         existed = Transfer.select().where(Transfer.tx_hash == tx_hash).first()
         if not existed:
             return Transfer(_tx_hash=tx_hash)
-        return existed
\ No newline at end of file
+        return existed
+
+    @classmethod
+    def upsert_many(cls, rows: typing.List[dict]):
+        """
+        Inserts rows or merges them into existing transfers, in one statement per 100 rows.
+        Block ids are only taken when known (non-zero), validator_confirmations is kept by count_confirmations.
+        """
+        excluded = peewee.EXCLUDED
+        update = {
+            cls.receiver_chain_id: excluded.receiver_chain_id,
+            cls.sender_chain_id: peewee.Case(
+                None, [(excluded.listed_event_block_id > 0, excluded.sender_chain_id)], cls.sender_chain_id
+            ),
+        }
+        for field in (cls.listed_event_block_id, cls.deposit_event_block_id):
+            value = getattr(excluded, field.column_name)
+            update[field] = peewee.Case(None, [(value > 0, value)], field)
+        for chunk in peewee.chunked(rows, 100):
+            cls.insert_many(chunk).on_conflict(conflict_target=[cls._tx_hash], update=update).execute()
+
+    @classmethod
+    def count_confirmations(cls, tx_hashes: typing.List[str]):
+        """Sets validator_confirmations of the transfers from their TransferConfirmation rows"""
+        count = TransferConfirmation.select(peewee.fn.COUNT(TransferConfirmation.validator_id)).where(
+            TransferConfirmation.tx_hash == cls._tx_hash
+        )
+        for chunk in peewee.chunked(tx_hashes, 100):
+            cls.update(validator_confirmations=count).where(cls._tx_hash.in_(chunk)).execute()
+
+
+class TransferConfirmation(BaseModel):
+    """Confirmed events of a transfer, one row per validator"""
+    tx_hash = peewee.CharField(max_length=64)
+    validator_id = peewee.IntegerField()
+    block_id = peewee.IntegerField()
+
+    class Meta:
+        table_name = 'transfer_confirmation'
+        primary_key = peewee.CompositeKey('tx_hash', 'validator_id')
+
+
+class TransferWriter(object):
+    """
+    Buffers Transfer changes of a block window, several events of one txHash are merged in memory,
+    and writes them with bulk upserts in one transaction instead of a SELECT and a save per event.
+    Confirmations are taken from the validatorId of Confirmed events, writing them twice changes nothing.
+    """
+    def __init__(self, receiver_chain_id: int):
+        self.receiver_chain_id = receiver_chain_id
+        self._rows: typing.Dict[str, dict] = {}
+        # (txHash, validatorId) -> block of the Confirmed event
+        self._confirmations: typing.Dict[typing.Tuple[str, int], int] = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def rows(self) -> typing.List[dict]:
+        return list(self._rows.values())
+
+    def row(self, tx_hash: str) -> dict:
+        tx_hash = Transfer.prep_tx_hash(tx_hash)
+        if tx_hash not in self._rows:
+            self._rows[tx_hash] = {
+                '_tx_hash': tx_hash, 'sender_chain_id': 0, 'receiver_chain_id': self.receiver_chain_id,
+                'listed_event_block_id': 0, 'deposit_event_block_id': 0
+            }
+        return self._rows[tx_hash]
+
+    def listed(self, tx_hash: str, sender_chain_id: int, block_id: int, deposit_block_id: int = 0):
+        row = self.row(tx_hash)
+        row['sender_chain_id'] = sender_chain_id
+        row['listed_event_block_id'] = block_id
+        row['deposit_event_block_id'] = deposit_block_id or row['deposit_event_block_id']
+
+    def confirmed(self, tx_hash: str, validator_id: int, block_id: int):
+        row = self.row(tx_hash)
+        self._confirmations.setdefault((row['_tx_hash'], validator_id), block_id)
+
+    def flush(self):
+        if not self._rows:
+            return
+        confirmations = [
+            {'tx_hash': tx_hash, 'validator_id': validator_id, 'block_id': block_id}
+            for (tx_hash, validator_id), block_id in self._confirmations.items()
+        ]
+        with db.atomic():
+            Transfer.upsert_many(self.rows())
+            for chunk in peewee.chunked(confirmations, 100):
+                TransferConfirmation.insert_many(chunk).on_conflict_ignore().execute()
+            Transfer.count_confirmations(sorted({tx_hash for tx_hash, _ in self._confirmations}))
+        self._rows.clear()
+        self._confirmations.clear()
+
+
+class BackfillShard(BaseModel):
+    """Blocks of a shard covered by the backfill, written in the transaction of the shard's transfers"""
+    bridge = peewee.CharField()
+    from_block = peewee.IntegerField()
+    covered_to = peewee.IntegerField()
+
+    class Meta:
+        table_name = 'backfill_shard'
+        primary_key = peewee.CompositeKey('bridge', 'from_block')
+
+
+def create_tables(database: peewee.Database):
+    """
+    Creates missing tables and indexes and migrates tables of older versions: create_tables(safe=True) keeps their
+    non-unique transfer._tx_hash index, the upserts of TransferWriter need it unique
+    """
+    models = [Transfer, TransferConfirmation, BackfillShard]
+    with database.bind_ctx(models):
+        database.create_tables(models, safe=True)
+        table = Transfer._meta.table_name
+        index = next((index for index in database.get_indexes(table) if index.columns == ['_tx_hash']), None)
+        if index is None or index.unique:
+            return
+        with database.atomic():
+            # Transfer.get_or_create of older versions could insert a txHash twice, its first row is kept
+            duplicates = Transfer.select(Transfer._tx_hash, peewee.fn.MIN(Transfer.id).alias('first_id')).group_by(
+                Transfer._tx_hash
+            ).having(peewee.fn.COUNT(Transfer.id) > 1)
+            for row in duplicates:
+                Transfer.delete().where((Transfer._tx_hash == row._tx_hash) & (Transfer.id != row.first_id)).execute()
+            migrator = SchemaMigrator.from_database(database)
+            migrate(migrator.drop_index(table, index.name), migrator.add_index(table, ('_tx_hash',), unique=True))
+
+
+def init_db(url: typing.Optional[str] = None):
+    """Connects the models to DATABASE_URL (peewee db_url format) once, creates missing tables and migrates them"""
+    with _db_lock:
+        if db.obj is not None:
+            return
+        url = url or os.getenv('DATABASE_URL', 'sqlite:///' + os.path.abspath(os.path.join(
+            os.path.dirname(__file__), '..', 'data', 'transfers.sqlite'
+        )))
+        db.initialize(connect(url))
+        create_tables(db.obj)
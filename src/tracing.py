@@ -0,0 +1,148 @@
+import collections
+import contextlib
+import json
+import threading
+import time
+import typing
+
+
+__all__ = ['Span', 'Tracer', 'TRACER', 'rpc_middleware']
+
+
+class Span(object):
+    __slots__ = ('name', 'attributes', 'started', 'duration', 'error', 'children')
+
+    def __init__(self, name: str, attributes: dict, started: float):
+        self.name = name
+        self.attributes = attributes
+        self.started = started
+        self.duration = 0.0
+        self.error: typing.Optional[str] = None
+        self.children: typing.List['Span'] = []
+
+
+class Tracer(object):
+    """
+    Spans of the calls made while a worker handles its events, recorded only when enabled (run.py --profile).
+    Spans opened while another one is open in the same thread become its children, so every JSON-RPC request
+    is attributed to the contract call, the event and the block range it was made for.
+    Finished root spans (the last max_roots of them) give per-event waterfalls,
+    durations of all spans are aggregated per name for the top-N slow calls.
+    """
+    def __init__(self, max_roots: int = 1000):
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.roots: typing.Deque[Span] = collections.deque(maxlen=max_roots)
+        # span name -> [count, total duration, max duration, errors]
+        self.stats: typing.Dict[str, list] = {}
+
+    def enable(self):
+        self.enabled = True
+
+    @property
+    def _stack(self) -> typing.List[Span]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        span = Span(name, attributes, time.monotonic())
+        self._stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f'{e.__class__.__name__}: {e}'
+            raise
+        finally:
+            self._stack.pop()
+            span.duration = time.monotonic() - span.started
+            self._finish(span)
+
+    def record(self, name: str, started: float, error: typing.Optional[str] = None, **attributes):
+        """Adds a finished span, for calls timed by their caller"""
+        if not self.enabled:
+            return
+        span = Span(name, attributes, started)
+        span.duration = time.monotonic() - started
+        span.error = error
+        self._finish(span)
+
+    def _finish(self, span: Span):
+        stack = self._stack
+        with self._lock:
+            if stack:
+                stack[-1].children.append(span)
+            else:
+                self.roots.append(span)
+            stats = self.stats.setdefault(span.name, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += span.duration
+            stats[2] = max(stats[2], span.duration)
+            stats[3] += span.error is not None
+
+    @classmethod
+    def describe(cls, span: Span) -> str:
+        attributes = ' '.join(f'{key}={value}' for key, value in span.attributes.items())
+        return ' '.join(part for part in (span.name, attributes, span.error and f'[{span.error}]') if part)
+
+    def waterfall(self, root: Span) -> typing.List[str]:
+        """The span tree with start offsets from the root and durations in milliseconds"""
+        lines = []
+
+        def walk(span: Span, depth: int):
+            lines.append(f'{(span.started - root.started) * 1000:>9.1f} {span.duration * 1000:>9.1f}  '
+                         f'{"  " * depth}{self.describe(span)}')
+            for child in span.children:
+                walk(child, depth + 1)
+        walk(root, 0)
+        return lines
+
+    def report(self, top: int = 20, slowest: int = 5) -> str:
+        with self._lock:
+            roots = list(self.roots)
+            stats = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        lines = [f'Top {len(stats)} spans by total time', f'{"calls":>8} {"total s":>9} {"mean ms":>9} '
+                                                         f'{"max ms":>9} {"errors":>6}  name']
+        for name, (count, total, maximum, errors) in stats:
+            lines.append(f'{count:>8} {total:>9.2f} {total / count * 1000:>9.1f} {maximum * 1000:>9.1f} '
+                         f'{errors:>6}  {name}')
+        # events are handled within block ranges or on their own
+        events = [span for root in roots for span in (root, *root.children) if span.name == 'event']
+        for span in sorted(events, key=lambda item: item.duration, reverse=True)[:slowest]:
+            lines.extend(['', f'{"start ms":>9} {"ms":>9}  span', *self.waterfall(span)])
+        return '\n'.join(lines)
+
+
+TRACER = Tracer()
+
+
+def params_size(params) -> int:
+    try:
+        return len(json.dumps(params))
+    except (TypeError, ValueError):
+        return 0
+
+
+def rpc_middleware(endpoint: str):
+    """web3 middleware adding a span for every request sent to the endpoint"""
+    def middleware(make_request, w3):
+        def trace(method, params):
+            if not TRACER.enabled:
+                return make_request(method, params)
+            started = time.monotonic()
+            try:
+                response = make_request(method, params)
+            except Exception as e:
+                TRACER.record(f'rpc {method}', started, f'{e.__class__.__name__}: {e}',
+                              endpoint=endpoint, bytes=params_size(params))
+                raise
+            error = response.get('error') if isinstance(response, dict) else None
+            TRACER.record(f'rpc {method}', started, error and str(error), endpoint=endpoint, bytes=params_size(params))
+            return response
+        return trace
+    return middleware
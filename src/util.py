@@ -1,24 +1,41 @@
 import json
+import time
 import typing
 
 import web3
-from web3.middleware.signing import construct_sign_and_send_raw_middleware
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.method_formatters import get_result_formatters
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3._utils.request import make_post_request
+from web3.middleware.signing import construct_sign_and_send_raw_middleware, async_construct_sign_and_send_raw_middleware
 import eth_account.account
 import solcx
 from substrateinterface.utils.ss58 import ss58_encode, ss58_decode
 from substrateinterface.utils.hasher import blake2_256
+from hexbytes import HexBytes
 
-from src import bridge_types as types
+from src import bridge_types as types, metrics, tracing
 
 
 __all__ = [
-    'ContractHelper', 'EthBalanceChecker', 'ContractWrapper',
-    'evm_to_address', 'address_to_evm', 'eth_add_to_auto_sign',
-    'ADDRESS_0'
+    'ContractHelper', 'EthBalanceChecker', 'ContractWrapper', 'AsyncContractWrapper', 'RPCBatch',
+    'evm_to_address', 'address_to_evm', 'eth_add_to_auto_sign', 'async_eth_add_to_auto_sign',
+    'make_batch_request', 'ADDRESS_0'
 ]
 
 ADDRESS_0 = '0x0000000000000000000000000000000000000000'
 
+MULTICALL3_ABI = [{
+    'name': 'aggregate3', 'type': 'function', 'stateMutability': 'payable',
+    'inputs': [{'name': 'calls', 'type': 'tuple[]', 'components': [
+        {'name': 'target', 'type': 'address'}, {'name': 'allowFailure', 'type': 'bool'},
+        {'name': 'callData', 'type': 'bytes'}
+    ]}],
+    'outputs': [{'name': 'returnData', 'type': 'tuple[]', 'components': [
+        {'name': 'success', 'type': 'bool'}, {'name': 'returnData', 'type': 'bytes'}
+    ]}]
+}]
+
 
 class ContractHelper(object):
     @classmethod
@@ -104,15 +121,320 @@ class ContractWrapper(object):
         return self._contract_address
 
     def call_method(self, method_name: str, arguments: tuple = ()):
-        return getattr(self.contract.functions, method_name)(*arguments).call()
+        with tracing.TRACER.span(f'call {method_name}'):
+            return getattr(self.contract.functions, method_name)(*arguments).call()
 
     def make_tx(self, method_name: str, arguments: tuple = ()):
         return getattr(self.contract.functions, method_name)(*arguments)
 
     def execute_tx(self, method_name: str, arguments: tuple = (), options: dict = None):
-        tx_hash = self.make_tx(method_name, arguments).transact(options)
-        return self.api.eth.wait_for_transaction_receipt(tx_hash, poll_latency=self.poll_latency)
+        with tracing.TRACER.span(f'tx {method_name}'):
+            tx_hash = self.make_tx(method_name, arguments).transact(options)
+            return self.api.eth.wait_for_transaction_receipt(tx_hash, poll_latency=self.poll_latency)
+
+    def estimate_gas(self, method_name: str, arguments: tuple = (), options: dict = None) -> int:
+        return self.make_tx(method_name, arguments).estimate_gas(options)
+
+    def split_batch(
+        self, method_name: str, items: list, options: dict = None,
+        batch_size: int = 50, max_gas: typing.Optional[int] = None,
+        on_revert: typing.Optional[typing.Callable[[typing.Any, Exception], None]] = None
+    ) -> typing.Iterator[typing.Tuple[list, typing.Optional[int]]]:
+        """
+        Split items of a method accepting a single array argument into chunks of at most batch_size items.
+        If max_gas is set, each chunk is estimated and halved until it fits, the estimate is yielded with the chunk.
+        If on_revert is set, reverting chunks are bisected and every reverting item is passed to on_revert.
+        """
+        for i in range(0, len(items), batch_size):
+            yield from self._fit_batch(method_name, items[i:i + batch_size], options, max_gas, on_revert)
+
+    def _fit_batch(self, method_name: str, chunk: list, options: dict = None, max_gas: typing.Optional[int] = None,
+                   on_revert: typing.Optional[typing.Callable[[typing.Any, Exception], None]] = None):
+        if max_gas is None and on_revert is None:
+            yield chunk, None
+            return
+        try:
+            gas = self.estimate_gas(method_name, (chunk,), options)
+        except web3.exceptions.ContractLogicError as e:
+            if on_revert is None:
+                raise
+            if len(chunk) == 1:
+                on_revert(chunk[0], e)
+                return
+            gas = None
+        if gas is not None and (max_gas is None or gas <= max_gas or len(chunk) == 1):
+            yield chunk, gas
+            return
+        middle = len(chunk) // 2
+        yield from self._fit_batch(method_name, chunk[:middle], options, max_gas, on_revert)
+        yield from self._fit_batch(method_name, chunk[middle:], options, max_gas, on_revert)
+
+
+def make_batch_request(api: web3.Web3, requests: typing.List[typing.Tuple[str, list]]) -> typing.List[dict]:
+    """Send requests as a single JSON-RPC batch, responses are returned in the order of requests"""
+    provider = api.provider
+    if hasattr(provider, 'make_batch_request'):
+        return provider.make_batch_request(requests)
+    if not hasattr(provider, 'endpoint_uri'):
+        # in-process providers (eth-tester) have no transport to batch over, their middlewares still apply
+        return [api.manager._make_request(method, params) for method, params in requests]
+    payload = [
+        {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+        for request_id, (method, params) in enumerate(requests)
+    ]
+    data = json.dumps(payload).encode('utf-8')
+    started = time.monotonic()
+    try:
+        raw_response = make_post_request(provider.endpoint_uri, data, **provider.get_request_kwargs())
+    except Exception as e:
+        metrics.RPC_ERRORS.inc(method='batch', endpoint=provider.endpoint_uri)
+        tracing.TRACER.record('rpc batch', started, f'{e.__class__.__name__}: {e}', endpoint=provider.endpoint_uri,
+                              requests=len(requests), bytes=len(data))
+        raise
+    finally:
+        metrics.RPC_LATENCY.observe(time.monotonic() - started, method='batch', endpoint=provider.endpoint_uri)
+    tracing.TRACER.record('rpc batch', started, endpoint=provider.endpoint_uri, requests=len(requests), bytes=len(data))
+    responses = json.loads(raw_response)
+    if not isinstance(responses, list):
+        raise ValueError(f'JSON-RPC batch rejected: {responses.get("error", responses)}')
+    return sorted(responses, key=lambda response: response['id'])
+
+
+class RPCBatch(object):
+    """
+    Collects independent reads of one chain (contract calls, transaction, receipt and block hash lookups)
+    and executes them in one round-trip: a JSON-RPC batch, with contract calls folded into one Multicall3
+    aggregate3 call when multicall_address is set.
+    Contract calls found in the optional cache (see BridgeConfigCache) are not requested at all.
+    """
+    CALL = 'call'
+    TRANSACTION = 'transaction'
+    RECEIPT = 'receipt'
+    BLOCK_HASH = 'block_hash'
+
+    def __init__(
+        self, api: web3.Web3, multicall_address: typing.Optional[types.Address] = None,
+        cache=None, chain_id: typing.Optional[int] = None
+    ):
+        self.api = api
+        self.multicall = (
+            None if multicall_address is None
+            else api.eth.contract(web3.Web3.to_checksum_address(multicall_address), abi=MULTICALL3_ABI)
+        )
+        self.cache = cache
+        self.chain_id = chain_id
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def add_call(self, contract: 'ContractWrapper', method_name: str, arguments: tuple = ()) -> 'RPCBatch':
+        self._items.append((self.CALL, contract.make_tx(method_name, arguments), (contract, method_name, arguments)))
+        return self
+
+    def add_transaction(self, tx_hash: types.TxHash) -> 'RPCBatch':
+        self._items.append((self.TRANSACTION, HexBytes(tx_hash).hex(), None))
+        return self
+
+    def add_receipt(self, tx_hash: types.TxHash) -> 'RPCBatch':
+        """Receipt of the transaction, None while it is not mined"""
+        self._items.append((self.RECEIPT, HexBytes(tx_hash).hex(), None))
+        return self
+
+    def add_block_hash(self, block_number: int) -> 'RPCBatch':
+        """Hash of the canonical block with the number, None when there is no such block yet"""
+        self._items.append((self.BLOCK_HASH, hex(block_number), None))
+        return self
+
+    def execute(self) -> list:
+        """Execute collected reads, results are returned in the order they were added"""
+        results = [None] * len(self._items)
+        pending = []
+        for index, (kind, item, call) in enumerate(self._items):
+            if kind == self.CALL and self.cache is not None:
+                found, value = self.cache.lookup(self.chain_id, *call)
+                if found:
+                    results[index] = value
+                    continue
+            pending.append(index)
+        if not pending:
+            return results
+
+        calls = [self._items[index][1] for index in pending if self._items[index][0] == self.CALL]
+        requests = []
+        if self.multicall is not None and calls:
+            requests.append(('eth_call', [{
+                'to': self.multicall.address,
+                'data': self.multicall.encodeABI('aggregate3', ([
+                    (function.address, True, function._encode_transaction_data()) for function in calls
+                ],))
+            }, 'latest']))
+        for index in pending:
+            kind, item, _ = self._items[index]
+            if kind == self.TRANSACTION:
+                requests.append(('eth_getTransactionByHash', [item]))
+            elif kind == self.RECEIPT:
+                requests.append(('eth_getTransactionReceipt', [item]))
+            elif kind == self.BLOCK_HASH:
+                requests.append(('eth_getBlockByNumber', [item, False]))
+            elif self.multicall is None:
+                requests.append(('eth_call', [{'to': item.address, 'data': item._encode_transaction_data()}, 'latest']))
+
+        with tracing.TRACER.span('batch', requests=len(requests)):
+            responses = iter(make_batch_request(self.api, requests))
+        call_results = None
+        if self.multicall is not None and calls:
+            aggregated = self._unwrap(next(responses))
+            call_results = iter(self.api.codec.decode(['(bool,bytes)[]'], HexBytes(aggregated))[0])
+
+        for index in pending:
+            kind, item, call = self._items[index]
+            if kind == self.TRANSACTION:
+                tx = self._unwrap(next(responses))
+                if tx is None:
+                    raise web3.exceptions.TransactionNotFound(f'Transaction with hash: {item} not found.')
+                results[index] = get_result_formatters('eth_getTransactionByHash', self.api.eth)(tx)
+                continue
+            if kind == self.RECEIPT:
+                receipt = self._unwrap(next(responses))
+                if receipt is not None:
+                    results[index] = get_result_formatters('eth_getTransactionReceipt', self.api.eth)(receipt)
+                continue
+            if kind == self.BLOCK_HASH:
+                block = self._unwrap(next(responses))
+                results[index] = HexBytes(block['hash']) if block is not None else None
+                continue
+            if call_results is not None:
+                success, return_data = next(call_results)
+                if not success:
+                    raise web3.exceptions.ContractLogicError(f'execution reverted: {item.fn_name}')
+                results[index] = self.decode_call_result(item, return_data)
+            else:
+                results[index] = self.decode_call_result(item, HexBytes(self._unwrap(next(responses))))
+            if self.cache is not None:
+                self.cache.store(self.chain_id, *call, results[index])
+        return results
+
+    def decode_call_result(self, function, return_data: bytes):
+        output_types = get_abi_output_types(function.abi)
+        normalized_data = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, self.api.codec.decode(
+            output_types, return_data
+        ))
+        return normalized_data[0] if len(normalized_data) == 1 else normalized_data
+
+    @classmethod
+    def _unwrap(cls, response: dict):
+        if 'error' in response:
+            error = response['error']
+            message = error.get('message', '') if isinstance(error, dict) else str(error)
+            if 'revert' in message:
+                raise web3.exceptions.ContractLogicError(message)
+            raise ValueError(error)
+        return response['result']
+
+
+class AsyncContractWrapper(object):
+    def __init__(
+        self, api: web3.AsyncWeb3, contract_address: types.Address, contract_abi: list, poll_latency: float = 1.0
+    ):
+        self.api = api
+        self._contract_address = contract_address
+        self.contract = self.api.eth.contract(contract_address, abi=contract_abi)
+        self.poll_latency = poll_latency
+
+    @property
+    def address(self):
+        return self._contract_address
+
+    async def call_method(self, method_name: str, arguments: tuple = ()):
+        return await getattr(self.contract.functions, method_name)(*arguments).call()
+
+    def make_tx(self, method_name: str, arguments: tuple = ()):
+        return getattr(self.contract.functions, method_name)(*arguments)
+
+    async def execute_tx(self, method_name: str, arguments: tuple = (), options: dict = None):
+        tx_hash = await self.make_tx(method_name, arguments).transact(options)
+        return await self.api.eth.wait_for_transaction_receipt(tx_hash, poll_latency=self.poll_latency)
+
+    async def estimate_gas(self, method_name: str, arguments: tuple = (), options: dict = None) -> int:
+        return await self.make_tx(method_name, arguments).estimate_gas(options)
+
+    async def split_batch(
+        self, method_name: str, items: list, options: dict = None,
+        batch_size: int = 50, max_gas: typing.Optional[int] = None,
+        on_revert: typing.Optional[typing.Callable[[typing.Any, Exception], None]] = None
+    ) -> typing.AsyncIterator[typing.Tuple[list, typing.Optional[int]]]:
+        """Async version of ContractWrapper.split_batch"""
+        for i in range(0, len(items), batch_size):
+            async for chunk, gas in self._fit_batch(method_name, items[i:i + batch_size], options, max_gas, on_revert):
+                yield chunk, gas
+
+    async def _fit_batch(
+        self, method_name: str, chunk: list, options: dict = None, max_gas: typing.Optional[int] = None,
+        on_revert: typing.Optional[typing.Callable[[typing.Any, Exception], None]] = None
+    ):
+        if max_gas is None and on_revert is None:
+            yield chunk, None
+            return
+        try:
+            gas = await self.estimate_gas(method_name, (chunk,), options)
+        except web3.exceptions.ContractLogicError as e:
+            if on_revert is None:
+                raise
+            if len(chunk) == 1:
+                on_revert(chunk[0], e)
+                return
+            gas = None
+        if gas is not None and (max_gas is None or gas <= max_gas or len(chunk) == 1):
+            yield chunk, gas
+            return
+        middle = len(chunk) // 2
+        for half in (chunk[:middle], chunk[middle:]):
+            async for fitted in self._fit_batch(method_name, half, options, max_gas, on_revert):
+                yield fitted
+
+    async def execute_batch_tx(
+        self, method_name: str, items: list, options: dict = None,
+        batch_size: int = 50, max_gas: typing.Optional[int] = None,
+        on_revert: typing.Optional[typing.Callable[[typing.Any, Exception], None]] = None,
+        on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.AsyncIterator[typing.Tuple[list, dict]]:
+        """
+        Execute method_name(chunk) for every chunk of items one after the other, yields chunk with its receipt.
+        A chunk reverted on-chain is bisected like in split_batch if on_revert is set, otherwise it raises.
+        on_submitted gets every chunk with its transaction hash before waiting for the receipt.
+        """
+        async for chunk, gas in self.split_batch(
+            method_name, items, options, batch_size=batch_size, max_gas=max_gas, on_revert=on_revert
+        ):
+            chunk_options = dict(options or {})
+            if gas is not None:
+                # estimated against the same state, keep a margin for the blocks in between
+                chunk_options.setdefault('gas', gas * 6 // 5)
+            tx_hash = await self.make_tx(method_name, (chunk,)).transact(chunk_options)
+            if on_submitted is not None:
+                on_submitted(chunk, tx_hash)
+            tx = await self.api.eth.wait_for_transaction_receipt(tx_hash, poll_latency=self.poll_latency)
+            if tx['status'] == 0 and on_revert is None:
+                raise web3.exceptions.ContractLogicError(f'{method_name} of ({len(chunk)}) items reverted on-chain')
+            if tx['status'] == 0:
+                if len(chunk) == 1:
+                    on_revert(chunk[0], web3.exceptions.ContractLogicError(f'{method_name} reverted on-chain'))
+                    continue
+                middle = len(chunk) // 2
+                for half in (chunk[:middle], chunk[middle:]):
+                    async for executed in self.execute_batch_tx(
+                        method_name, half, options, batch_size=batch_size, max_gas=max_gas, on_revert=on_revert,
+                        on_submitted=on_submitted
+                    ):
+                        yield executed
+                continue
+            yield chunk, tx
 
 
 def eth_add_to_auto_sign(api: web3.Web3, account: eth_account.account.LocalAccount):
     api.middleware_onion.add(construct_sign_and_send_raw_middleware(account))
+
+
+async def async_eth_add_to_auto_sign(api: web3.AsyncWeb3, account: eth_account.account.LocalAccount):
+    api.middleware_onion.add(await async_construct_sign_and_send_raw_middleware(account))
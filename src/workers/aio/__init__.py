@@ -0,0 +1,13 @@
+"""
+asyncio runtime of the validator, signer and web scanner (run.py --async), for nodes that answer many concurrent
+requests faster than batches. Shared with the sync workers: the signer and validator checks, checkpoints and
+per-event outcomes, block ranges and log fetching, finality policies and head tracking, the deposit cache,
+RPC routing and metrics.
+
+Deliberately left to the sync workers: the supervisor, the backfill, prefetching at shallow depth, the bridge
+config cache and --profile tracing. Concurrent handlers already overlap the reads these save.
+"""
+from .base import AsyncWorker
+from .signer import AsyncSigner
+from .validator import AsyncValidator
+from .web import AsyncWebScanner
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import threading
+import time
+import typing
+
+import aiohttp
+import web3
+import web3.exceptions
+from web3._utils.request import async_make_post_request
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.types import EventData
+import eth_account.account
+
+from src import bridge_types as types, metrics, util
+from ..base import WorkerConfig, LastBlockStorage, ChainPool, RPCEndpointState, RPCRouter, load_bridge_abi
+from ..block_range import BlockRangeController
+from ..deposit_cache import DepositCache
+from ..heads import FinalityPolicy, HeadTracker
+from ..log_fetcher import LogFetcher
+from ..subscription import HeadSubscription
+
+
+__all__ = ['AsyncHeadTracker', 'AsyncRPCRouter', 'AsyncWorker']
+
+
+class AsyncRPCRouter(AsyncJSONBaseProvider):
+    """Async version of RPCRouter, endpoints are ranked and failed over the same way"""
+    logger = RPCRouter.logger
+    NON_IDEMPOTENT_METHODS = RPCRouter.NON_IDEMPOTENT_METHODS
+    FAILURE_COOLDOWN = RPCRouter.FAILURE_COOLDOWN
+    HEAD_TTL = RPCRouter.HEAD_TTL
+    EXPLORE_RATE = RPCRouter.EXPLORE_RATE
+
+    RPCRouterError = RPCRouter.RPCRouterError
+
+    def __init__(self, urls: typing.Sequence[str], timeout: float = 10.0, max_head_lag: int = 3, max_attempts: int = 3):
+        super().__init__()
+        if not urls:
+            raise ValueError('AsyncRPCRouter requires at least one url')
+        self.endpoints = [RPCEndpointState(url) for url in urls]
+        self.timeout = timeout
+        self.max_head_lag = max_head_lag
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+    __str__ = RPCRouter.__str__
+    head = RPCRouter.head
+    ranked_endpoints = RPCRouter.ranked_endpoints
+
+    async def _post(self, endpoint: RPCEndpointState, data: bytes, track_head: bool = False, method: str = 'batch'):
+        started = time.monotonic()
+        try:
+            raw_response = await async_make_post_request(
+                endpoint.url, data, headers={'Content-Type': 'application/json'},
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            response = self.decode_rpc_response(raw_response)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            with self._lock:
+                endpoint.record(time.monotonic() - started, True, self.FAILURE_COOLDOWN)
+            metrics.RPC_ERRORS.inc(method=method, endpoint=endpoint.url)
+            metrics.RPC_LATENCY.observe(time.monotonic() - started, method=method, endpoint=endpoint.url)
+            raise self.RPCRouterError(f'{endpoint.url}: {e}') from e
+        metrics.RPC_LATENCY.observe(time.monotonic() - started, method=method, endpoint=endpoint.url)
+        with self._lock:
+            endpoint.record(time.monotonic() - started, False)
+            if track_head and isinstance(response, dict) and isinstance(response.get('result'), str):
+                endpoint.update_head(int(response['result'], 16))
+        return response
+
+    async def _send(self, data: bytes, idempotent: bool, track_head: bool = False, method: str = 'batch'):
+        errors = []
+        for endpoint in self.ranked_endpoints()[:self.max_attempts if idempotent else 1]:
+            try:
+                return await self._post(endpoint, data, track_head=track_head, method=method)
+            except self.RPCRouterError as e:
+                self.logger.warning(f'RPC request failed: {e}')
+                errors.append(str(e))
+        raise self.RPCRouterError(f'All RPC endpoints failed: {"; ".join(errors)}')
+
+    async def make_request(self, method, params):
+        return await self._send(
+            self.encode_rpc_request(method, params),
+            idempotent=method not in self.NON_IDEMPOTENT_METHODS,
+            track_head=method == 'eth_blockNumber', method=method
+        )
+
+
+class AsyncHeadTracker(object):
+    """Async version of HeadTracker, block tags fall back to the fixed depth and are probed again the same way"""
+    logger = HeadTracker.logger
+    TAG_RETRY_INTERVAL = HeadTracker.TAG_RETRY_INTERVAL
+    is_unsupported_tag_error = HeadTracker.is_unsupported_tag_error
+
+    def __init__(self, api: web3.AsyncWeb3, max_age: float = 3.0, fallback_depth: int = 64):
+        self.api = api
+        self.max_age = max_age
+        self.fallback_depth = fallback_depth
+        self._lock = threading.Lock()
+        self._values: typing.Dict[str, typing.Tuple[int, float]] = {}
+        self._disabled_tags: typing.Dict[str, float] = {}
+
+    observe_head = HeadTracker.observe_head
+    tag_enabled = HeadTracker.tag_enabled
+    disable_tag = HeadTracker.disable_tag
+    depth = HeadTracker.depth
+
+    async def head(self) -> int:
+        return await self._resolve('head', lambda: self.api.eth.block_number)
+
+    async def final_block(self, policy: FinalityPolicy) -> int:
+        if self.tag_enabled(policy):
+            async def fetch():
+                return (await self.api.eth.get_block(policy.kind))['number']
+            try:
+                return await self._resolve(policy.kind, fetch)
+            except (ValueError, web3.exceptions.BlockNotFound) as e:
+                self.disable_tag(policy, e)
+        return await self.head() - self.depth(policy)
+
+    async def _resolve(self, key: str, fetch: typing.Callable[[], typing.Awaitable[int]]) -> int:
+        with self._lock:
+            value, resolved_at = self._values.get(key, (None, 0.0))
+            if value is not None and time.monotonic() - resolved_at < self.max_age:
+                return value
+        value = await fetch()
+        with self._lock:
+            self._values[key] = (value, time.monotonic())
+        return value
+
+
+class AsyncWorker(LastBlockStorage):
+    LOGGER_NAME = 'worker.base'
+    WORKER_TYPE = 'base'
+
+    def __init__(self, config: WorkerConfig = None, name: typing.Optional[str] = None, debug: bool = False):
+        self.debug = debug
+        if config is None:
+            config = WorkerConfig()
+        self.config = config
+        self.account = None
+        self.api = self.construct_http_api(self.config.eth_rpc_urls, timeout=self.config.rpc_timeout)
+        if config.eth_private_key is not None:
+            self.account = eth_account.account.Account.from_key(config.eth_private_key)
+        self.log = logging.getLogger(self.LOGGER_NAME)
+        self.bridge = self.get_bridge_contract(
+            self.api, self.config.eth_contract_address, poll_latency=self.config.poll_latency
+        )
+        self.chain_id: typing.Optional[int] = None
+        self.name = self.WORKER_TYPE if name is None else name
+        self.semaphore = asyncio.Semaphore(self.config.worker_concurrency)
+        # async sessions are bound to the event loop, so every async worker keeps its own pool
+        self.pool = ChainPool()
+        self.block_range = BlockRangeController(
+            initial=self.config.block_range, maximum=self.config.max_block_range_of(self.config.eth_rpc_urls),
+            target_logs=self.config.block_range_target_logs
+        )
+        self._log_fetchers: typing.Dict[tuple, LogFetcher] = {}
+
+    @property
+    def worker_type(self) -> str:
+        # async workers share checkpoints with their sync counterparts
+        return self.WORKER_TYPE
+
+    async def setup(self):
+        if self.account is not None:
+            await util.async_eth_add_to_auto_sign(self.api, self.account)
+        self.chain_id = int(await self.api.eth.chain_id)
+
+    @classmethod
+    def construct_http_api(cls, rpc_url: typing.Union[str, typing.Sequence[str]], timeout: float = 10.0):
+        rpc_urls = [rpc_url] if isinstance(rpc_url, str) else list(rpc_url)
+        if len(rpc_urls) == 1:
+            return web3.AsyncWeb3(web3.AsyncWeb3.AsyncHTTPProvider(
+                rpc_urls[0], request_kwargs={'timeout': aiohttp.ClientTimeout(total=timeout)}
+            ))
+        return web3.AsyncWeb3(AsyncRPCRouter(rpc_urls, timeout=timeout))
+
+    @classmethod
+    def get_bridge_contract(cls, api: web3.AsyncWeb3, contract_address: types.Address, poll_latency=1.0):
+        return util.AsyncContractWrapper(
+            api, contract_address, contract_abi=load_bridge_abi(), poll_latency=poll_latency
+        )
+
+    async def get_chain_api(self, chain_id: int, sign: bool = False) -> web3.AsyncWeb3:
+        rpc_urls = tuple(self.config.rpc_urls[chain_id])
+        api = self.pool.get_or_create(
+            ('api', chain_id, rpc_urls), lambda: self.construct_http_api(rpc_urls, timeout=self.config.rpc_timeout)
+        )
+        if sign and self.account is not None and self.pool.first_use(('signer', chain_id, rpc_urls)):
+            await util.async_eth_add_to_auto_sign(api, self.account)
+        return api
+
+    async def get_chain_bridge(
+        self, chain_id: int, contract_address: types.Address, sign: bool = False
+    ) -> util.AsyncContractWrapper:
+        api = await self.get_chain_api(chain_id, sign=sign)
+        return self.pool.get_or_create(
+            ('bridge', chain_id, tuple(self.config.rpc_urls[chain_id]), contract_address),
+            lambda: self.get_bridge_contract(api, contract_address, poll_latency=self.config.poll_latency)
+        )
+
+    async def unprocessed(self, events: typing.List[EventData]) -> typing.List[EventData]:
+        """Async version of Worker.unprocessed"""
+        receipts = {}
+        for chain_id, tx_hashes in self.submitted_transactions(events).items():
+            api = self.api if chain_id == self.chain_id else await self.get_chain_api(chain_id)
+            results = await asyncio.gather(
+                *(api.eth.get_transaction_receipt(tx_hash) for tx_hash in tx_hashes), return_exceptions=True
+            )
+            for tx_hash, result in zip(tx_hashes, results):
+                if isinstance(result, web3.exceptions.TransactionNotFound):
+                    result = None
+                elif isinstance(result, BaseException):
+                    raise result
+                receipts[tx_hash] = result
+        return self.resolve_unprocessed(events, receipts)
+
+    async def gather_events(self, handler: typing.Callable[[typing.Any], typing.Awaitable], events: list) -> list:
+        """
+        Run handler for every event concurrently, at most config.worker_concurrency at a time.
+        Results (or raised exceptions) are returned in the order of events.
+        """
+        async def run(event):
+            async with self.semaphore:
+                return await handler(event)
+        return await asyncio.gather(*(run(event) for event in events), return_exceptions=True)
+
+    @property
+    def head_subscription(self) -> typing.Optional[HeadSubscription]:
+        if self.config.eth_ws_rpc is None:
+            return None
+        return self.pool.get_or_create(
+            ('heads', self.config.eth_ws_rpc), lambda: HeadSubscription(self.config.eth_ws_rpc).start()
+        )
+
+    @property
+    def head_tracker(self) -> AsyncHeadTracker:
+        return self.pool.get_or_create(
+            ('head_tracker',),
+            lambda: AsyncHeadTracker(
+                self.api, max_age=self.config.poll_latency, fallback_depth=self.config.eth_block_confirmations
+            )
+        )
+
+    @property
+    def deposit_cache(self) -> DepositCache:
+        return self.pool.get_or_create(
+            ('deposit_cache',),
+            lambda: DepositCache(self.config.deposit_cache_path, max_entries=self.config.deposit_cache_size)
+        )
+
+    async def wait_for_block(self, last_block: int) -> int:
+        policy = self.config.finality_policy(self.chain_id)
+        tracker = self.head_tracker
+        subscription = self.head_subscription
+        final_block = await tracker.final_block(policy)
+        while last_block >= final_block:
+            head = None
+            # block tags are polled, a fixed depth tells which head to wait for
+            if subscription is not None and not policy.is_tag:
+                head = await asyncio.to_thread(
+                    subscription.wait_for_head, last_block + policy.depth + 1, subscription.idle_timeout
+                )
+            if head is None:
+                await asyncio.sleep(self.config.poll_latency)
+            else:
+                tracker.observe_head(head)
+            final_block = await tracker.final_block(policy)
+        return final_block
+
+    async def fetch_logs(self, fetch: typing.Callable[[], typing.Awaitable[list]]) -> list:
+        attempt = 0
+        while True:
+            try:
+                events = await fetch()
+                break
+            except Exception as e:
+                delay = self.block_range.rate_limit_delay(e, attempt)
+                if delay is not None:
+                    self.log.warning(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
+                                     f'Rate limited, retrying in {delay:.0f}s: {e}')
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                if not self.block_range.is_range_error(e):
+                    raise
+                raise BlockRangeController.RangeError(str(e)) from e
+        self.block_range.add_logs(len(events))
+        metrics.EVENTS.inc(len(events), worker=self.worker_key)
+        return events
+
+    async def get_events(self, event_type, from_block_number: int, to_block_number: int) -> list:
+        return await self.fetch_logs(lambda: event_type.get_logs(fromBlock=from_block_number, toBlock=to_block_number))
+
+    async def get_bridge_events(
+        self, event_names: typing.Sequence[str], from_block_number: int, to_block_number: int
+    ) -> typing.List[EventData]:
+        """Bridge events of several types fetched with one eth_getLogs request, in block/log-index order"""
+        key = tuple(event_names)
+        if key not in self._log_fetchers:
+            self._log_fetchers[key] = LogFetcher(self.bridge.contract, key)
+        fetcher = self._log_fetchers[key]
+
+        async def fetch():
+            logs = await self.api.eth.get_logs(fetcher.filter_params(from_block_number, to_block_number))
+            return fetcher.decode(logs)
+        return await self.fetch_logs(fetch)
+
+    async def process_blocks(self, from_block_number: int, to_block_number: int):
+        pass
+
+    async def listen_blocks(self, last_block: int = 0) -> int:
+        current_block = await self.wait_for_block(last_block)
+        while True:
+            to_block = self.block_range.next_range(last_block, current_block)
+            started = time.monotonic()
+            try:
+                await self.process_blocks(from_block_number=last_block, to_block_number=to_block)
+            except BlockRangeController.RangeError as e:
+                if not self.block_range.shrink():
+                    raise
+                self.log.warning(f'[worker.{self.worker_type}.{self.name}] '
+                                 f'Blocks {last_block} - {to_block} refused by node, '
+                                 f'retrying with range {self.block_range.size}: {e.message}')
+                continue
+            elapsed = time.monotonic() - started
+            self.block_range.record(to_block - last_block + 1, elapsed)
+            metrics.BLOCKS.inc(to_block - last_block + 1, worker=self.worker_key)
+            metrics.RANGE_SECONDS.observe(elapsed, worker=self.worker_key)
+            return to_block
+
+    async def listen(self):
+        await self.setup()
+        last_block = self.get_last_block()
+        if self.config.metrics_port is not None:
+            port = self.config.metrics_port
+            self.pool.get_or_create(('metrics', port), lambda: metrics.serve(port))
+
+        try:
+            while True:
+                previous = last_block
+                # every event of the range is handled before returning, so the checkpoint never skips unfinished work
+                last_block = await self.listen_blocks(last_block + 1)
+                self.save_last_block(last_block)
+                metrics.HEAD_LAG.set(await self.head_tracker.head() - last_block, worker=self.worker_key)
+                speed = self.block_range.blocks_per_second
+                self.log.info(f'[worker.{self.worker_type}.{self.name}] Scanned blocks {previous + 1} - {last_block}'
+                              + (f' ({speed:.1f} blocks/s)' if speed is not None else ''))
+        finally:
+            self.checkpoints.flush()
+
+    def run(self):
+        asyncio.run(self.listen())
@@ -0,0 +1,210 @@
+import asyncio
+import typing
+
+from web3.types import EventData
+
+from .base import AsyncWorker
+from ..signer import Signer
+from src import util
+
+
+__all__ = ['AsyncSigner']
+
+
+class AsyncSigner(AsyncWorker):
+    WORKER_TYPE = 'signer'
+    TYPE_LISTER = Signer.TYPE_LISTER
+    TYPE_TRANSACTOR = Signer.TYPE_TRANSACTOR
+    TYPE_COMBINED = Signer.TYPE_COMBINED
+
+    SignerException = Signer.SignerException
+    SignerError = Signer.SignerError
+
+    check_source_bridge = Signer.check_source_bridge
+    list_arguments = Signer.list_arguments
+
+    async def check_deposit_event(self, event) -> typing.Tuple[util.AsyncContractWrapper, list]:
+        """Async version of Signer.check_deposit_event"""
+        tx_hash = event['transactionHash'].hex()
+        deposit_event = event['args']
+        has_pair, target_asset, target_bridge_address = await asyncio.gather(
+            self.bridge.call_method('hasPair', (deposit_event['token'], deposit_event['targetChainId'])),
+            self.bridge.call_method('getDestinationAddress', (deposit_event['token'], deposit_event['targetChainId'])),
+            self.bridge.call_method('links', (deposit_event['targetChainId'],))
+        )
+        self.check_source_bridge(event, has_pair, target_bridge_address)
+
+        # check backlink from targetChainId
+        target_bridge = await self.get_chain_bridge(deposit_event['targetChainId'], target_bridge_address, sign=True)
+        listed, backlink_address = await asyncio.gather(
+            target_bridge.call_method('confirmations', (tx_hash,)),
+            target_bridge.call_method('links', (self.chain_id,))
+        )
+        return target_bridge, self.list_arguments(event, target_asset, listed, backlink_address)
+
+    async def list_deposits(
+        self, target_bridge: util.AsyncContractWrapper, items: typing.List[list],
+        on_revert: typing.Optional[typing.Callable[[list, Exception], None]] = None,
+        on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.List[int]:
+        if self.debug:
+            block_number = await self.api.eth.block_number
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'DEBUG: Should list ({len(items)}) txHashes in block #{block_number}')
+            return [block_number]
+        block_numbers = []
+        async for chunk, tx in target_bridge.execute_batch_tx(
+            'list', items, {'from': self.account.address},
+            batch_size=self.config.tx_batch_size, max_gas=self.config.tx_batch_max_gas, on_revert=on_revert,
+            on_submitted=on_submitted
+        ):
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'listed ({len(chunk)}) txHashes in block #{tx["blockNumber"]}')
+            block_numbers.append(tx['blockNumber'])
+        return block_numbers
+
+    async def listen_deposits(
+        self, from_block_number: int, to_block_number: typing.Optional[int] = None,
+        events: typing.Optional[typing.List[EventData]] = None
+    ):
+        if events is None:
+            events = await self.get_events(self.bridge.contract.events.Deposit, from_block_number, to_block_number)
+        events = await self.unprocessed(events)
+        block_numbers = []
+        if events:
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'Got ({len(events)}) deposit events from users '
+                          f'in blocks #{from_block_number}-#{to_block_number}')
+        batches: typing.Dict[int, typing.Tuple[util.AsyncContractWrapper, typing.Dict[str, tuple]]] = {}
+        for event, result in zip(events, await self.gather_events(self.check_deposit_event, events)):
+            tx_hash = event['transactionHash'].hex()
+            if isinstance(result, self.SignerError):
+                self.log.error(result.message)
+                self.record_outcome(event, f'error: {result.message}')
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            target_bridge, list_args = result
+            target_chain_id = event['args']['targetChainId']
+            if target_chain_id not in batches:
+                batches[target_chain_id] = (target_bridge, {})
+            if tx_hash in batches[target_chain_id][1]:
+                self.log.error(f'txHash {tx_hash}: multiple deposits in one transaction, only first will be listed')
+                self.record_outcome(event, 'error: multiple deposits in one transaction')
+                continue
+            batches[target_chain_id][1][tx_hash] = (event, list_args)
+
+        for target_chain_id, (target_bridge, items) in batches.items():
+            by_tx_hash = {list_args[-1]: event for event, list_args in items.values()}
+            rejected = set()
+
+            def on_revert(list_args: list, error: Exception):
+                event = by_tx_hash[list_args[-1]]
+                self.log.error(f'txHash {event["transactionHash"].hex()}: listing rejected by target bridge: {error}')
+                self.record_outcome(event, f'error: listing rejected by target bridge: {error}')
+                rejected.add(list_args[-1])
+
+            def on_submitted(chunk: list, tx_hash: bytes):
+                self.record_submitted(
+                    [by_tx_hash[list_args[-1]] for list_args in chunk], target_chain_id, tx_hash, 'listed'
+                )
+            block_numbers.extend(await self.list_deposits(
+                target_bridge, [list_args for _, list_args in items.values()],
+                on_revert=on_revert, on_submitted=on_submitted
+            ))
+            for key, event in by_tx_hash.items():
+                if key not in rejected:
+                    self.record_outcome(event, 'listed')
+            self.checkpoints.flush()
+
+        return block_numbers
+
+    async def transfer(
+        self, tx_hashes: typing.List[bytes], on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.List[bytes]:
+        if self.debug:
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'DEBUG: Should confirm (Call transfer) ({len(tx_hashes)}) txHashes '
+                          f'in block #{await self.api.eth.block_number}')
+            return []
+        sent = []
+        async for chunk, tx in self.bridge.execute_batch_tx(
+            'transfer', tx_hashes, {'from': self.account.address},
+            batch_size=self.config.tx_batch_size, max_gas=self.config.tx_batch_max_gas,
+            on_revert=self.on_transfer_revert, on_submitted=on_submitted
+        ):
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'confirm (call transfer) ({len(chunk)}) txHashes in block #{tx["blockNumber"]}')
+            sent.extend(chunk)
+        return sent
+
+    def on_transfer_revert(self, tx_hash: bytes, error: Exception):
+        self.log.error(f'txHash {tx_hash.hex()}: transfer rejected by bridge: {error}')
+
+    async def is_transferable(self, tx_hash: bytes, required_confirmations: int) -> bool:
+        current_confirmations = await self.bridge.call_method('confirmedBy', (tx_hash,))
+        if len(current_confirmations) < required_confirmations:
+            return False
+        _, _, _, is_sent = await self.bridge.call_method('confirmations', (tx_hash,))
+        return not is_sent
+
+    async def listen_confirmations(
+        self, from_block_number: int, to_block_number: typing.Optional[int] = None,
+        events: typing.Optional[typing.List[EventData]] = None
+    ):
+        if events is None:
+            events = await self.get_events(self.bridge.contract.events.Confirmed, from_block_number, to_block_number)
+        events = await self.unprocessed(events)
+        if not events:
+            return
+        tx_hashes = list(dict.fromkeys(event['args']['txHash'] for event in events))
+        self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                      f'Got ({len(events)}) confirmation events for ({len(tx_hashes)}) txHashes from validators '
+                      f'in blocks #{from_block_number}-#{to_block_number}')
+        required_confirmations = await self.bridge.call_method('requiredConfirmations')
+        results = await self.gather_events(
+            lambda tx_hash: self.is_transferable(tx_hash, required_confirmations), tx_hashes
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        tx_hashes = [tx_hash for tx_hash, transferable in zip(tx_hashes, results) if transferable]
+        sent = set()
+        if tx_hashes:
+            sent = set(await self.transfer(tx_hashes, on_submitted=lambda chunk, tx_hash: self.record_submitted(
+                [event for event in events if event['args']['txHash'] in chunk], self.chain_id, tx_hash, 'transfer sent'
+            )))
+        transferable = set(tx_hashes)
+        for event in events:
+            tx_hash = event['args']['txHash']
+            self.record_outcome(event, (
+                'transfer sent' if tx_hash in sent
+                else 'transfer rejected' if tx_hash in transferable else 'not transferable'
+            ))
+        if tx_hashes:
+            self.checkpoints.flush()
+
+    async def process_blocks(self, from_block_number: int, to_block_number: int):
+        if self.debug:
+            self.log.debug(f'[worker.{self.worker_type}.{self.name}] '
+                           f'Listen events from block ${from_block_number} to block #{to_block_number}')
+
+        if self.name == self.TYPE_LISTER:
+            await self.listen_deposits(from_block_number=from_block_number, to_block_number=to_block_number)
+        if self.name == self.TYPE_TRANSACTOR:
+            await self.listen_confirmations(from_block_number=from_block_number, to_block_number=to_block_number)
+        if self.name == self.TYPE_COMBINED:
+            events = await self.get_bridge_events(('Deposit', 'Confirmed'), from_block_number, to_block_number)
+            await self.listen_deposits(
+                from_block_number, to_block_number, events=[event for event in events if event['event'] == 'Deposit']
+            )
+            await self.listen_confirmations(
+                from_block_number, to_block_number, events=[event for event in events if event['event'] == 'Confirmed']
+            )
+
+    async def listen(self):
+        if self.name not in (self.TYPE_LISTER, self.TYPE_TRANSACTOR, self.TYPE_COMBINED):
+            raise ValueError(
+                f'Signer name must be one of [{self.TYPE_LISTER}, {self.TYPE_TRANSACTOR}, {self.TYPE_COMBINED}]'
+            )
+        await super().listen()
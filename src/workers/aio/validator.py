@@ -0,0 +1,152 @@
+import asyncio
+import typing
+
+import web3.exceptions
+from web3.types import EventData
+
+from .base import AsyncWorker
+from ..validator import Validator
+from src import metrics, util
+
+
+__all__ = ['AsyncValidator']
+
+
+class AsyncValidator(AsyncWorker):
+    LOGGER_NAME = Validator.LOGGER_NAME
+    WORKER_TYPE = 'validator'
+
+    ValidatorException = Validator.ValidatorException
+    ValidatorDebug = Validator.ValidatorDebug
+    ValidatorInfo = Validator.ValidatorInfo
+    ValidatorError = Validator.ValidatorError
+
+    receipt_deposits = Validator.receipt_deposits
+    match_deposit = Validator.match_deposit
+    cached_deposits = Validator.cached_deposits
+    store_deposits = Validator.store_deposits
+    check_source_chain = Validator.check_source_chain
+    check_source_link = Validator.check_source_link
+    check_deposit = Validator.check_deposit
+    check_asset = Validator.check_asset
+
+    async def get_deposits(self, source_bridge: util.AsyncContractWrapper, source_chain_id: int, tx_hash: str) -> tuple:
+        """Async version of Validator.get_deposits"""
+        cached = self.deposit_cache.lookup(source_chain_id, tx_hash)
+        if cached is not None:
+            backlink_address, block_hash = await asyncio.gather(
+                source_bridge.call_method('links', (self.chain_id,)),
+                self.get_block_hash(source_bridge.api, cached.block_number)
+            )
+            deposits = self.cached_deposits(source_chain_id, tx_hash, cached, block_hash)
+            if deposits is not None:
+                return backlink_address, deposits
+            receipt = await self.get_receipt(source_bridge.api, tx_hash)
+        else:
+            metrics.CACHE_REQUESTS.inc(cache='deposits', result='miss')
+            backlink_address, receipt = await asyncio.gather(
+                source_bridge.call_method('links', (self.chain_id,)), self.get_receipt(source_bridge.api, tx_hash)
+            )
+        return backlink_address, self.store_deposits(source_bridge, source_chain_id, tx_hash, receipt)
+
+    @classmethod
+    async def get_block_hash(cls, api: web3.AsyncWeb3, block_number: int) -> typing.Optional[bytes]:
+        try:
+            return (await api.eth.get_block(block_number))['hash']
+        except web3.exceptions.BlockNotFound:
+            return None
+
+    @classmethod
+    async def get_receipt(cls, api: web3.AsyncWeb3, tx_hash: str) -> typing.Optional[dict]:
+        try:
+            return await api.eth.get_transaction_receipt(tx_hash)
+        except web3.exceptions.TransactionNotFound:
+            return None
+
+    async def validate_event(self, event: EventData):
+        """Async version of Validator.validate_event"""
+        listed_event = event['args']
+        tx_hash = listed_event['txHash'].hex()
+        self.check_source_chain(event)
+
+        # check link to sourceChainId, listed data is fetched alongside
+        source_bridge_address, listed = await asyncio.gather(
+            self.bridge.call_method('links', (listed_event['sourceChainId'],)),
+            self.bridge.call_method('confirmations', (listed_event['txHash'],))
+        )
+        self.check_source_link(event, source_bridge_address)
+
+        # check backlink from sourceChainId and get the deposits from other network
+        source_bridge = await self.get_chain_bridge(listed_event['sourceChainId'], source_bridge_address)
+        backlink_address, deposits = await self.get_deposits(source_bridge, listed_event['sourceChainId'], tx_hash)
+        deposit = self.check_deposit(event, listed, backlink_address, deposits)
+
+        # Check that registered asset matches the listed and mapped correctly
+        _, _, listed_token_id, _ = listed
+        has_pair, source_asset, target_asset = await asyncio.gather(
+            source_bridge.call_method('hasPair', (deposit['token'], self.chain_id)),
+            source_bridge.call_method('getDestinationAddress', (deposit['token'], self.chain_id)),
+            self.bridge.call_method('tokens', (listed_token_id - 1,))
+        )
+        self.check_asset(event, has_pair, source_asset, target_asset)
+        return listed_event['txHash']
+
+    async def confirm(
+        self, tx_hashes: typing.List[bytes], on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.List[bytes]:
+        if self.debug:
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'DEBUG: validator should approve ({len(tx_hashes)}) txHashes '
+                          f'in block #{await self.api.eth.block_number}')
+            return []
+        confirmed = []
+        async for chunk, tx in self.bridge.execute_batch_tx(
+            'confirm', tx_hashes, {'from': self.account.address},
+            batch_size=self.config.tx_batch_size, max_gas=self.config.tx_batch_max_gas,
+            on_revert=self.on_confirm_revert, on_submitted=on_submitted
+        ):
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'validator approved ({len(chunk)}) txHashes in block #{tx["blockNumber"]}')
+            confirmed.extend(chunk)
+        return confirmed
+
+    def on_confirm_revert(self, tx_hash: bytes, error: Exception):
+        self.log.error(f'txHash {tx_hash.hex()}: confirmation rejected by bridge: {error}')
+
+    async def validate(self, from_block_number: int, to_block_number: typing.Optional[int] = None):
+        events = await self.unprocessed(
+            await self.get_events(self.bridge.contract.events.Listed, from_block_number, to_block_number)
+        )
+        if events:
+            self.log.info(f'[worker.{self.worker_type}.{self.name}] '
+                          f'Got ({len(events)}) listed events from signer '
+                          f'in blocks #{from_block_number}-#{to_block_number}')
+        listed = {}
+        for event, result in zip(events, await self.gather_events(self.validate_event, events)):
+            if isinstance(result, self.ValidatorError):
+                self.log.error(result.message)
+                self.record_outcome(event, f'error: {result.message}')
+                continue
+            if isinstance(result, self.ValidatorInfo):
+                self.log.info(result.message)
+                self.record_outcome(event, f'skipped: {result.message}')
+                continue
+            if isinstance(result, self.ValidatorDebug):
+                self.log.debug(result.message)
+                self.record_outcome(event, f'skipped: {result.message}')
+                continue
+            if isinstance(result, BaseException):
+                raise result
+
+            listed[result] = event
+
+        if listed:
+            confirmed = set(await self.confirm(list(listed), on_submitted=lambda chunk, tx_hash: self.record_submitted(
+                [listed[item] for item in chunk], self.chain_id, tx_hash, 'confirmed'
+            )))
+            for tx_hash, event in listed.items():
+                self.record_outcome(event, 'confirmed' if tx_hash in confirmed else 'rejected')
+            self.checkpoints.flush()
+
+    async def process_blocks(self, from_block_number: int, to_block_number: int):
+        await self.validate(from_block_number=from_block_number, to_block_number=to_block_number)
@@ -0,0 +1,54 @@
+import asyncio
+
+from .base import AsyncWorker
+
+from src.models import TransferWriter, init_db
+
+
+__all__ = ['AsyncWebScanner']
+
+
+class AsyncWebScanner(AsyncWorker):
+    WORKER_TYPE = 'webscanner'
+
+    def __init__(self, *args, **kwargs):
+        init_db()
+        super().__init__(*args, **kwargs)
+
+    async def find_deposit_block_id(self, chain_id: int, tx_hash):
+        if chain_id not in self.config.rpc_urls:
+            raise ValueError(f'No route to chainId {chain_id}')
+        source_api = await self.get_chain_api(chain_id)
+        source_tx = await source_api.eth.get_transaction(tx_hash)
+        if source_tx is None:
+            raise ValueError(f'No transaction with txHash {tx_hash}')
+        return source_tx['blockNumber']
+
+    async def process_blocks(self, from_block_number: int, to_block_number: int):
+        events = await self.get_bridge_events(('Listed', 'Confirmed'), from_block_number, to_block_number)
+
+        async def fetch(event):
+            if event['event'] == 'Listed':
+                return await self.find_deposit_block_id(event['args']['sourceChainId'], event['args']['txHash'])
+            # Confirmed events carry the validator, no state read needed
+            return None
+        results = await self.gather_events(fetch, events)
+
+        # events of one txHash are merged in log order and written in one transaction
+        transfers = TransferWriter(self.chain_id)
+        for event, result in zip(events, results):
+            tx_hash = event['args']['txHash'].hex()
+            if event['event'] == 'Confirmed':
+                transfers.confirmed(tx_hash, event['args']['validatorId'], event['blockNumber'])
+                continue
+            deposit_block_id = 0
+            if isinstance(result, Exception):
+                self.log.warning(
+                    f'Unable to get deposit event for '
+                    f'chainId={event["args"]["sourceChainId"]} and txHash={tx_hash}: {str(result)}'
+                )
+            else:
+                deposit_block_id = result
+            transfers.listed(tx_hash, event['args']['sourceChainId'], event['blockNumber'], deposit_block_id)
+        # peewee blocks, the event loop keeps serving other tasks while the window is written
+        await asyncio.to_thread(transfers.flush)
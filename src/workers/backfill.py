@@ -0,0 +1,167 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import time
+import typing
+
+import peewee
+
+from src import util
+from src.models import db, BackfillShard, TransferWriter
+from .base import Worker, WorkerConfig, load_bridge_abi
+from .block_range import BlockRangeController
+from .log_fetcher import LogFetcher
+from .web import WebScanner
+
+
+__all__ = ['Backfill', 'fetch_shard']
+
+
+logger = logging.getLogger('worker.backfill')
+
+
+def find_deposit_blocks(config: WorkerConfig, transfers: TransferWriter):
+    """Block of the source transaction of every listed transfer, one JSON-RPC batch per source chain and 100 rows"""
+    if config.rpc_urls_file_path is None:
+        return
+    by_chain: typing.Dict[int, typing.List[str]] = {}
+    for row in transfers.rows():
+        if row['listed_event_block_id']:
+            by_chain.setdefault(row['sender_chain_id'], []).append(row['_tx_hash'])
+    for chain_id, tx_hashes in by_chain.items():
+        if chain_id not in config.rpc_urls:
+            continue
+        api = Worker.construct_http_api(config.rpc_urls[chain_id], timeout=config.rpc_timeout)
+        for chunk in peewee.chunked(tx_hashes, 100):
+            try:
+                responses = util.make_batch_request(
+                    api, [('eth_getTransactionByHash', [f'0x{tx_hash}']) for tx_hash in chunk]
+                )
+            except Exception as e:
+                logger.warning(f'[worker.backfill] Unable to get deposit transactions from chainId {chain_id}: {e}')
+                break
+            for tx_hash, response in zip(chunk, responses):
+                source_tx = response.get('result')
+                if source_tx and source_tx.get('blockNumber') is not None:
+                    block_number = source_tx['blockNumber']
+                    transfers.row(tx_hash)['deposit_event_block_id'] = (
+                        int(block_number, 16) if isinstance(block_number, str) else block_number
+                    )
+
+
+def fetch_shard(config: WorkerConfig, chain_id: int, from_block: int, to_block: int) -> TransferWriter:
+    """Runs in a pool process: Listed and Confirmed events of the blocks merged per txHash, ready to be written"""
+    api = Worker.construct_http_api(config.eth_rpc_urls, timeout=config.rpc_timeout)
+    fetcher = LogFetcher(
+        api.eth.contract(config.eth_contract_address, abi=load_bridge_abi()), ('Listed', 'Confirmed')
+    )
+    # history is read in the largest windows the node accepts
+    max_block_range = config.max_block_range_of(config.eth_rpc_urls)
+    block_range = BlockRangeController(
+        initial=max_block_range, maximum=max_block_range, target_logs=config.block_range_target_logs
+    )
+    transfers = TransferWriter(chain_id)
+    block = from_block
+    attempt = 0
+    while block <= to_block:
+        end = block_range.next_range(block, to_block)
+        started = time.monotonic()
+        try:
+            events = fetcher.fetch(api, block, end)
+        except Exception as e:
+            delay = block_range.rate_limit_delay(e, attempt)
+            if delay is not None:
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if not block_range.is_range_error(e) or not block_range.shrink():
+                raise
+            continue
+        attempt = 0
+        block_range.add_logs(len(events))
+        block_range.record(end - block + 1, time.monotonic() - started)
+        for event in events:
+            tx_hash = event['args']['txHash'].hex()
+            if event['event'] == 'Listed':
+                transfers.listed(tx_hash, event['args']['sourceChainId'], event['blockNumber'])
+            else:
+                transfers.confirmed(tx_hash, event['args']['validatorId'], event['blockNumber'])
+        block = end + 1
+    find_deposit_blocks(config, transfers)
+    return transfers
+
+
+class Backfill(object):
+    """
+    Builds the transfer index of a bridge's history in parallel before the web scanner follows the chain.
+    Blocks from the scanner's checkpoint to the final block are split into shards aligned to shard_size,
+    pool processes fetch and decode them and the results are upserted into Transfer. Every shard commits
+    its transfers and its BackfillShard checkpoint in one transaction, so a restarted backfill skips
+    finished shards. When all shards are in, the scanner's checkpoint
+    moves to the backfilled block and the scanner can listen from there.
+    """
+    def __init__(self, scanner: WebScanner, shard_size: typing.Optional[int] = None,
+                 processes: typing.Optional[int] = None):
+        self.scanner = scanner
+        self.shard_size = shard_size or scanner.config.backfill_shard_size
+        self.processes = processes or scanner.config.backfill_processes
+        self.log = logger
+
+    @property
+    def bridge_key(self) -> str:
+        return f'{self.scanner.chain_id}:{self.scanner.bridge.contract.address.lower()}'
+
+    def pending_shards(self, from_block: int, to_block: int) -> typing.List[typing.Tuple[int, int, int]]:
+        """(shard start, first pending block, last block) of every shard with blocks left to fetch"""
+        covered = {
+            row.from_block: row.covered_to
+            for row in BackfillShard.select().where(BackfillShard.bridge == self.bridge_key)
+        }
+        shards = []
+        start = from_block - from_block % self.shard_size
+        while start <= to_block:
+            first = max(from_block, start, covered.get(start, -1) + 1)
+            last = min(to_block, start + self.shard_size - 1)
+            if first <= last:
+                shards.append((start, first, last))
+            start += self.shard_size
+        return shards
+
+    def commit(self, shard_start: int, covered_to: int, transfers: TransferWriter):
+        with db.atomic():
+            transfers.flush()
+            BackfillShard.insert(
+                bridge=self.bridge_key, from_block=shard_start, covered_to=covered_to
+            ).on_conflict(
+                conflict_target=[BackfillShard.bridge, BackfillShard.from_block],
+                update={BackfillShard.covered_to: peewee.EXCLUDED.covered_to}
+            ).execute()
+
+    def run(self, to_block: typing.Optional[int] = None) -> int:
+        """Backfills up to to_block (the final block by default) and returns it"""
+        from_block = self.scanner.get_last_block() + 1
+        if to_block is None:
+            to_block = self.scanner.head_tracker.final_block(self.scanner.config.finality_policy(self.scanner.chain_id))
+        shards = self.pending_shards(from_block, to_block)
+        self.log.info(f'[worker.backfill] Backfilling blocks {from_block} - {to_block} of {self.bridge_key}: '
+                      f'{len(shards)} shards in {self.processes} processes')
+        started = time.monotonic()
+        # spawned processes do not inherit sockets and locks of the parent's RPC clients
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            futures = {
+                executor.submit(fetch_shard, self.scanner.config, self.scanner.chain_id, first, last): (start, last)
+                for start, first, last in shards
+            }
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                start, last = futures[future]
+                transfers = future.result()
+                count = len(transfers)
+                self.commit(start, last, transfers)
+                self.log.info(f'[worker.backfill] Shard {start} - {last} done ({count} transfers), '
+                              f'{done}/{len(shards)} in {time.monotonic() - started:.0f}s')
+        if to_block >= from_block:
+            self.scanner.save_last_block(to_block)
+            self.scanner.checkpoints.flush()
+        return to_block
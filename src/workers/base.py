@@ -1,30 +1,121 @@
+import functools
 import logging
 import json
 import os
+import random
+import threading
+import time
 import typing
 
+import requests
 import web3
+from web3._utils.request import make_post_request
+from web3.providers.base import JSONBaseProvider
+from web3.types import EventData
 import eth_account.account
 
-from src import bridge_types as types, util
+from src import bridge_types as types, metrics, tracing, util
+from .block_range import BlockRangeController
+from .cache import BridgeConfigCache
+from .checkpoints import CheckpointStore
+from .deposit_cache import DepositCache
+from .heads import FinalityPolicy, HeadTracker
+from .log_fetcher import LogFetcher, SharedLogFetcher
+from .prefetch import PrefetchCache
+from .subscription import HeadSubscription
+from .transactions import TransactionManager
 
 
-__all__ = ['Worker', 'WorkerConfig']
+__all__ = ['Worker', 'WorkerConfig', 'LastBlockStorage', 'ChainPool', 'RPCRouter', 'load_bridge_abi']
 
 
 class WorkerConfig(object):
+    # comma separated list of urls is routed by RPCRouter
     eth_rpc: str = os.getenv('ETH_RPC', 'http://127.0.0.1:9944')
+    # optional WebSocket endpoint, new heads wake the worker instead of eth_blockNumber polling
+    eth_ws_rpc: typing.Optional[str] = os.getenv('ETH_WS_RPC', None) or None
     eth_contract_address = os.getenv('ETH_CONTRACT_ADDRESS', util.ADDRESS_0)
     eth_private_key: typing.Optional[str] = os.getenv('ETH_PRIVATE_KEY', None) or None
     eth_block_confirmations: int = int(os.getenv('ETH_BLOCK_CONFIRMATIONS', '64'))
+    # finality policy: finalized, safe or depth:N, per chain overrides as comma separated chainId:policy pairs;
+    # ETH_BLOCK_CONFIRMATIONS is the default depth and the fallback for nodes without block tags
+    _finality: str = os.getenv('ETH_FINALITY', '')
+    _finality_policies: str = os.getenv('ETH_FINALITY_POLICIES', '')
+    # events are pre-validated at this depth while waiting for ETH_BLOCK_CONFIRMATIONS, unset disables the fast path
+    _prefetch_confirmations: str = os.getenv('ETH_PREFETCH_CONFIRMATIONS', '')
     _poll_latency: int = int(os.getenv('ETH_RPC_POLL_LATENCY_MS', '3000'))
+    tx_batch_size: int = int(os.getenv('ETH_TX_BATCH_SIZE', '50'))
+    checkpoint_db_path: str = os.getenv('ETH_CHECKPOINT_DB', os.path.abspath(os.path.join(
+        os.path.dirname(__file__), '..', '..', 'data', 'checkpoints.sqlite'
+    )))
+    # buffered checkpoint writes are committed (and fsynced) at most this often
+    checkpoint_flush_interval: float = float(os.getenv('ETH_CHECKPOINT_FLUSH_S', '1'))
+    # suffix of checkpoint keys, tells apart workers of the same type and name serving different bridges
+    checkpoint_namespace: str = os.getenv('ETH_CHECKPOINT_NAMESPACE', '')
+    # workers of a supervisor share eth_getLogs requests of overlapping ranges per bridge, see SharedLogFetcher
+    share_logs: bool = False
+    # Prometheus metrics are served on 127.0.0.1 at this port, unset disables them
+    _metrics_port: str = os.getenv('ETH_METRICS_PORT', '')
+    _tx_batch_max_gas: int = int(os.getenv('ETH_TX_BATCH_MAX_GAS', '8000000'))
     rpc_urls_file_path: str = os.getenv('ETH_RPC_URLS_FILE', None)
+    _multicall_addresses: str = os.getenv('ETH_MULTICALL_ADDRESSES', '')
+    worker_concurrency: int = int(os.getenv('ETH_WORKER_CONCURRENCY', '16'))
+    rpc_timeout: float = float(os.getenv('ETH_RPC_TIMEOUT_S', '10'))
+    # transactions not mined for this long are re-sent with fees bumped by ETH_TX_GAS_BUMP_PERCENT
+    tx_stuck_timeout: float = float(os.getenv('ETH_TX_STUCK_TIMEOUT_S', '60'))
+    tx_gas_bump_percent: int = int(os.getenv('ETH_TX_GAS_BUMP_PERCENT', '15'))
+    config_cache_ttl: float = float(os.getenv('ETH_CONFIG_CACHE_TTL_S', '60'))
+    # initial eth_getLogs window, it adapts between 1 and the provider limit of the endpoints, see max_block_range_of
+    block_range: int = int(os.getenv('ETH_BLOCK_RANGE', '10'))
+    max_block_range: int = int(os.getenv('ETH_MAX_BLOCK_RANGE', '2000'))
+    # limits of endpoints other than ETH_MAX_BLOCK_RANGE as comma separated url=blocks pairs
+    _max_block_ranges: str = os.getenv('ETH_MAX_BLOCK_RANGES', '')
+    block_range_target_logs: int = int(os.getenv('ETH_BLOCK_RANGE_TARGET_LOGS', '500'))
+    # decoded source deposits of validators, the file can be shared by the validators of a host
+    deposit_cache_path: str = os.getenv('ETH_DEPOSIT_CACHE_DB', os.path.abspath(os.path.join(
+        os.path.dirname(__file__), '..', '..', 'data', 'deposits.sqlite'
+    )))
+    deposit_cache_size: int = int(os.getenv('ETH_DEPOSIT_CACHE_SIZE', '100000'))
+    # historical backfill of the web scanner: blocks per shard and pool processes fetching shards
+    backfill_shard_size: int = int(os.getenv('ETH_BACKFILL_SHARD_BLOCKS', '100000'))
+    backfill_processes: int = int(os.getenv('ETH_BACKFILL_PROCESSES', '4'))
     _rpc_urls = None
 
+    @property
+    def eth_rpc_urls(self) -> typing.List[str]:
+        return [url.strip() for url in self.eth_rpc.split(',') if url.strip()]
+
+    def finality_policy(self, chain_id: int) -> FinalityPolicy:
+        policies = dict(item.split(':', 1) for item in self._finality_policies.split(',') if item)
+        policy = policies.get(str(chain_id), self._finality)
+        if not policy:
+            return FinalityPolicy(FinalityPolicy.DEPTH, self.eth_block_confirmations)
+        return FinalityPolicy.parse(policy)
+
+    @property
+    def prefetch_confirmations(self) -> typing.Optional[int]:
+        return int(self._prefetch_confirmations) if self._prefetch_confirmations else None
+
     @property
     def poll_latency(self):
         return self._poll_latency / 1_000
 
+    @property
+    def metrics_port(self) -> typing.Optional[int]:
+        return int(self._metrics_port) if self._metrics_port else None
+
+    @property
+    def tx_batch_max_gas(self) -> typing.Optional[int]:
+        return self._tx_batch_max_gas or None
+
+    @property
+    def multicall_addresses(self) -> typing.Dict[int, str]:
+        # comma separated chainId:address pairs of deployed Multicall3 contracts
+        return {
+            int(chain_id): address
+            for chain_id, address in (item.split(':') for item in self._multicall_addresses.split(',') if item)
+        }
+
     def load_rpc_urls(self):
         if self.rpc_urls_file_path is None:
             raise ValueError('Invalid rpc urls file')
@@ -38,9 +129,291 @@ class WorkerConfig(object):
             self.load_rpc_urls()
         return self._rpc_urls
 
+    def max_block_range_of(self, rpc_urls: typing.Iterable[str]) -> int:
+        # requests of a router may go to any of its endpoints, the window must suit all of them
+        limits = {
+            url.strip(): int(blocks)
+            for url, blocks in (item.rsplit('=', 1) for item in self._max_block_ranges.split(',') if item.strip())
+        }
+        return min((limits.get(url, self.max_block_range) for url in rpc_urls), default=self.max_block_range)
+
+
+BRIDGE_ABI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'abi', 'BridgeLinked.json')
+
+
+@functools.lru_cache(maxsize=None)
+def load_bridge_abi() -> list:
+    # parsed once per process, callers must not mutate the result
+    with open(BRIDGE_ABI_PATH, 'r') as f:
+        return json.loads(f.read())['abi']
+
+
+class RPCEndpointState(object):
+    LATENCY_WEIGHT = 0.2
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.head = 0
+        self.head_updated = 0.0
+        self.requests = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float, failed: bool, cooldown: float = 0.0):
+        self.requests += 1
+        self.latency = (
+            latency if self.requests == 1
+            else self.latency + (latency - self.latency) * self.LATENCY_WEIGHT
+        )
+        self.error_rate += ((1.0 if failed else 0.0) - self.error_rate) * self.LATENCY_WEIGHT
+        if failed:
+            self.cooldown_until = time.monotonic() + cooldown
+
+    def update_head(self, head: int):
+        self.head = max(self.head, head)
+        self.head_updated = time.monotonic()
+
+    def is_lagging(self, head: int, max_lag: int, head_ttl: float) -> bool:
+        # endpoints that have not reported their head recently are not judged by it
+        return time.monotonic() - self.head_updated < head_ttl and head - self.head > max_lag
+
+    @property
+    def score(self) -> float:
+        # lower is better, errors make an endpoint look up to 10 times slower
+        return self.latency * (1 + 10 * self.error_rate)
+
+
+class RPCRouter(JSONBaseProvider):
+    """
+    Web3 provider spreading requests over several RPC urls of one chain.
+    Tracks latency, error rate and reported head height of each endpoint and sends every request to the fastest
+    healthy one. Idempotent requests are retried on the next endpoint if one fails or times out.
+    """
+    logger = logging.getLogger('worker.rpc_router')
+    # methods with side effects are never sent twice
+    NON_IDEMPOTENT_METHODS = {'eth_sendRawTransaction', 'eth_sendTransaction'}
+    FAILURE_COOLDOWN = 30.0
+    HEAD_TTL = 60.0
+    EXPLORE_RATE = 0.05
+
+    class RPCRouterError(Exception):
+        pass
+
+    def __init__(self, urls: typing.Sequence[str], timeout: float = 10.0, max_head_lag: int = 3, max_attempts: int = 3):
+        super().__init__()
+        if not urls:
+            raise ValueError('RPCRouter requires at least one url')
+        self.endpoints = [RPCEndpointState(url) for url in urls]
+        self.timeout = timeout
+        self.max_head_lag = max_head_lag
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f'RPC router over {", ".join(endpoint.url for endpoint in self.endpoints)}'
+
+    @property
+    def head(self) -> int:
+        return max(endpoint.head for endpoint in self.endpoints)
+
+    def ranked_endpoints(self) -> typing.List[RPCEndpointState]:
+        """Endpoints in order of preference: healthy ones by score, then lagging, then cooling down after failure"""
+        now = time.monotonic()
+        head = self.head
+        with self._lock:
+            ranked = sorted(self.endpoints, key=lambda endpoint: (
+                endpoint.cooldown_until > now,
+                endpoint.is_lagging(head, self.max_head_lag, self.HEAD_TTL),
+                endpoint.score
+            ))
+            healthy = sum(
+                1 for endpoint in ranked
+                if endpoint.cooldown_until <= now and not endpoint.is_lagging(head, self.max_head_lag, self.HEAD_TTL)
+            )
+        if healthy > 1 and random.random() < self.EXPLORE_RATE:
+            # refresh the stats of a healthy backup endpoint now and then
+            ranked.insert(0, ranked.pop(random.randrange(1, healthy)))
+        return ranked
+
+    def _post(self, endpoint: RPCEndpointState, data: bytes, track_head: bool = False, method: str = 'batch'):
+        started = time.monotonic()
+        try:
+            raw_response = make_post_request(
+                endpoint.url, data, headers={'Content-Type': 'application/json'}, timeout=self.timeout
+            )
+            response = self.decode_rpc_response(raw_response)
+        except (requests.RequestException, ValueError) as e:
+            with self._lock:
+                endpoint.record(time.monotonic() - started, True, self.FAILURE_COOLDOWN)
+            metrics.RPC_ERRORS.inc(method=method, endpoint=endpoint.url)
+            metrics.RPC_LATENCY.observe(time.monotonic() - started, method=method, endpoint=endpoint.url)
+            tracing.TRACER.record(f'rpc {method}', started, str(e), endpoint=endpoint.url, bytes=len(data))
+            raise self.RPCRouterError(f'{endpoint.url}: {e}') from e
+        metrics.RPC_LATENCY.observe(time.monotonic() - started, method=method, endpoint=endpoint.url)
+        tracing.TRACER.record(f'rpc {method}', started, endpoint=endpoint.url, bytes=len(data))
+        with self._lock:
+            endpoint.record(time.monotonic() - started, False)
+            if track_head and isinstance(response, dict) and isinstance(response.get('result'), str):
+                endpoint.update_head(int(response['result'], 16))
+        return response
+
+    def _send(self, data: bytes, idempotent: bool, track_head: bool = False, method: str = 'batch'):
+        errors = []
+        for endpoint in self.ranked_endpoints()[:self.max_attempts if idempotent else 1]:
+            try:
+                return self._post(endpoint, data, track_head=track_head, method=method)
+            except self.RPCRouterError as e:
+                self.logger.warning(f'RPC request failed: {e}')
+                errors.append(str(e))
+        raise self.RPCRouterError(f'All RPC endpoints failed: {"; ".join(errors)}')
+
+    def make_request(self, method, params):
+        return self._send(
+            self.encode_rpc_request(method, params),
+            idempotent=method not in self.NON_IDEMPOTENT_METHODS,
+            track_head=method == 'eth_blockNumber', method=method
+        )
+
+    def make_batch_request(self, requests_list: typing.List[typing.Tuple[str, list]]) -> typing.List[dict]:
+        payload = [
+            {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+            for request_id, (method, params) in enumerate(requests_list)
+        ]
+        responses = self._send(
+            json.dumps(payload).encode('utf-8'),
+            idempotent=not any(method in self.NON_IDEMPOTENT_METHODS for method, _ in requests_list)
+        )
+        if not isinstance(responses, list):
+            raise ValueError(f'JSON-RPC batch rejected: {responses.get("error", responses)}')
+        return sorted(responses, key=lambda response: response['id'])
+
+
+class ChainPool(object):
+    """Registry of long-lived per-chain objects (APIs, contract wrappers), each one is created on first use"""
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._items = {}
+
+    def get_or_create(self, key: tuple, factory: typing.Callable[[], typing.Any]):
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = factory()
+            return self._items[key]
+
+    def first_use(self, key: tuple) -> bool:
+        """Returns True only for the first call with the key"""
+        with self._lock:
+            if key in self._items:
+                return False
+            self._items[key] = True
+            return True
+
+
+class LastBlockStorage(object):
+    name: str
+    config: WorkerConfig
+    debug: bool
+    _checkpoints: typing.Optional[CheckpointStore] = None
+
+    @property
+    def worker_type(self) -> str:
+        return self.__class__.__name__.lower()
+
+    @property
+    def worker_key(self) -> str:
+        """Identifies the worker in checkpoints and metrics"""
+        key = f'{self.worker_type}.{self.name}'
+        if self.config.checkpoint_namespace:
+            key = f'{key}.{self.config.checkpoint_namespace}'
+        return key
+
+    @property
+    def checkpoints(self) -> CheckpointStore:
+        if self._checkpoints is None:
+            self._checkpoints = CheckpointStore(
+                self.config.checkpoint_db_path, self.worker_key, flush_interval=self.config.checkpoint_flush_interval
+            )
+        return self._checkpoints
+
+    @property
+    def last_block_file_path(self):
+        # checkpoints of older versions, read once when the checkpoint store is still empty
+        return os.path.abspath(os.path.join(
+            os.path.dirname(__file__),
+            '..', '..', 'data', f'last_block_{self.worker_type}_{self.name}.json'
+        ))
+
+    def save_last_block(self, last_block_number: int):
+        self.checkpoints.advance(last_block_number)
+
+    def get_last_block(self):
+        if self.checkpoints.last_block is not None:
+            return self.checkpoints.last_block
+        if not os.path.exists(self.last_block_file_path):
+            return int(os.getenv('START_FROM_BLOCK', '0'))
+        with open(self.last_block_file_path, 'r', encoding='utf-8') as f:
+            return json.loads(f.read())
+
+    def record_outcome(self, event: EventData, outcome: str):
+        # nothing is sent in debug mode, a later real run must handle the event
+        if not self.debug:
+            self.checkpoints.record(event, outcome)
+
+    def record_submitted(self, events: typing.List[EventData], chain_id: int, tx_hash: bytes, outcome: str):
+        """
+        Events handled by a sent transaction, provisional until it is mined: after a restart the events
+        get outcome if the transaction was mined, otherwise they are handled again
+        """
+        for event in events:
+            self.record_outcome(event, f'submitted {chain_id} {tx_hash.hex()} {outcome}')
+        self.checkpoints.flush()
+
+    @classmethod
+    def parse_submitted(cls, outcome: typing.Optional[str]) -> typing.Optional[typing.Tuple[int, str, str]]:
+        """(chainId, transaction hash, outcome once mined) of an outcome written by record_submitted"""
+        if outcome is None or not outcome.startswith('submitted '):
+            return None
+        _, chain_id, tx_hash, mined_outcome = outcome.split(' ', 3)
+        return int(chain_id), tx_hash, mined_outcome
+
+    def submitted_transactions(self, events: typing.List[EventData]) -> typing.Dict[int, typing.List[str]]:
+        """chainId -> hashes of the transactions the events were submitted in before a restart"""
+        transactions: typing.Dict[int, typing.List[str]] = {}
+        for event in events:
+            submitted = self.parse_submitted(self.checkpoints.outcome(event))
+            if submitted is not None and submitted[1] not in transactions.get(submitted[0], []):
+                transactions.setdefault(submitted[0], []).append(submitted[1])
+        return transactions
+
+    def resolve_unprocessed(
+        self, events: typing.List[EventData], receipts: typing.Dict[str, typing.Optional[dict]]
+    ) -> typing.List[EventData]:
+        """
+        Events without a final outcome, given the receipts of submitted transactions by hash.
+        Transactions dropped, replaced or reverted are sent again, the bridge state is checked before sending
+        """
+        result = []
+        for event in events:
+            outcome = self.checkpoints.outcome(event)
+            submitted = self.parse_submitted(outcome)
+            if submitted is not None:
+                receipt = receipts.get(submitted[1])
+                if receipt is not None and receipt['status'] == 1:
+                    self.record_outcome(event, submitted[2])
+                    continue
+            elif outcome is not None:
+                continue
+            result.append(event)
+        return result
 
-class Worker(object):
+
+class Worker(LastBlockStorage):
     LOGGER_NAME = 'worker.base'
+    # shared by all workers of the process
+    pool = ChainPool()
+    # outcomes of prefetch handlers worth keeping until final depth, anything else is recomputed
+    PREFETCH_EXCEPTIONS: typing.Tuple[typing.Type[Exception], ...] = ()
 
     def __init__(self, config: WorkerConfig = None, name: typing.Optional[str] = None, debug: bool = False):
         self.debug = debug
@@ -48,28 +421,88 @@ class Worker(object):
             config = WorkerConfig()
         self.config = config
         self.account = None
-        self.api = self.construct_http_api(self.config.eth_rpc)
+        # workers of one process listening to the same chain share the connections
+        rpc_urls = tuple(self.config.eth_rpc_urls)
+        self.api = self.pool.get_or_create(
+            ('api', rpc_urls), lambda: self.construct_http_api(rpc_urls, timeout=self.config.rpc_timeout)
+        )
         if config.eth_private_key is not None:
             self.account = eth_account.account.Account.from_key(config.eth_private_key)
-            util.eth_add_to_auto_sign(self.api, self.account)
+            if self.pool.first_use(('signer', rpc_urls, self.account.address)):
+                util.eth_add_to_auto_sign(self.api, self.account)
         self.log = logging.getLogger(self.LOGGER_NAME)
         self.bridge = self.get_bridge_contract(
             self.api, self.config.eth_contract_address, poll_latency=self.config.poll_latency
         )
         self.chain_id = int(self.api.eth.chain_id)
         self.name = self.__class__.__name__.lower() if name is None else name
+        self.block_range = BlockRangeController(
+            initial=self.config.block_range, maximum=self.config.max_block_range_of(rpc_urls),
+            target_logs=self.config.block_range_target_logs
+        )
+        self._log_fetchers: typing.Dict[tuple, LogFetcher] = {}
+        self.prefetch_cache = PrefetchCache()
 
     @classmethod
-    def construct_http_api(cls, rpc_url: str):
-        return web3.Web3(web3.Web3.HTTPProvider(rpc_url))
+    def construct_http_api(cls, rpc_url: typing.Union[str, typing.Sequence[str]], timeout: float = 10.0):
+        rpc_urls = [rpc_url] if isinstance(rpc_url, str) else list(rpc_url)
+        if len(rpc_urls) == 1:
+            api = web3.Web3(web3.Web3.HTTPProvider(rpc_urls[0], request_kwargs={'timeout': timeout}))
+            # RPCRouter times and traces requests per endpoint itself
+            api.middleware_onion.add(metrics.rpc_middleware(rpc_urls[0]), 'metrics')
+            api.middleware_onion.add(tracing.rpc_middleware(rpc_urls[0]), 'tracing')
+            return api
+        return web3.Web3(RPCRouter(rpc_urls, timeout=timeout))
 
     @classmethod
     def get_bridge_contract(cls, api: web3.Web3, contract_address: types.Address, poll_latency=1.0):
-        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'abi', 'BridgeLinked.json'), 'r') as f:
-            abi = json.loads(f.read())['abi']
-            return util.ContractWrapper(
-                api, contract_address, contract_abi=abi, poll_latency=poll_latency
-            )
+        return util.ContractWrapper(
+            api, contract_address, contract_abi=load_bridge_abi(), poll_latency=poll_latency
+        )
+
+    def get_chain_api(self, chain_id: int, sign: bool = False) -> web3.Web3:
+        rpc_urls = tuple(self.config.rpc_urls[chain_id])
+        api = self.pool.get_or_create(
+            ('api', chain_id, rpc_urls), lambda: self.construct_http_api(rpc_urls, timeout=self.config.rpc_timeout)
+        )
+        # signing middleware must be added once per api and account, not per event
+        if sign and self.account is not None and self.pool.first_use(
+            ('signer', chain_id, rpc_urls, self.account.address)
+        ):
+            util.eth_add_to_auto_sign(api, self.account)
+        return api
+
+    def get_chain_bridge(
+        self, chain_id: int, contract_address: types.Address, sign: bool = False
+    ) -> util.ContractWrapper:
+        api = self.get_chain_api(chain_id, sign=sign)
+        return self.pool.get_or_create(
+            ('bridge', chain_id, tuple(self.config.rpc_urls[chain_id]), contract_address),
+            lambda: self.get_bridge_contract(api, contract_address, poll_latency=self.config.poll_latency)
+        )
+
+    @property
+    def config_cache(self) -> BridgeConfigCache:
+        return self.pool.get_or_create(
+            ('config_cache',),
+            lambda: BridgeConfigCache(ttl=self.config.config_cache_ttl)
+        )
+
+    @property
+    def deposit_cache(self) -> DepositCache:
+        return self.pool.get_or_create(
+            ('deposit_cache',),
+            lambda: DepositCache(self.config.deposit_cache_path, max_entries=self.config.deposit_cache_size)
+        )
+
+    def rpc_batch(self, api: web3.Web3, chain_id: int) -> util.RPCBatch:
+        return util.RPCBatch(
+            api, self.config.multicall_addresses.get(chain_id), cache=self.config_cache, chain_id=chain_id
+        )
+
+    def call_cached(self, chain_id: int, contract: util.ContractWrapper, method_name: str, arguments: tuple = ()):
+        """Single contract read served from the bridge config cache when possible"""
+        return self.rpc_batch(contract.api, chain_id).add_call(contract, method_name, arguments).execute()[0]
 
     @classmethod
     def check_tx_block(cls, tx_hash: types.TxHash, rpc_url: str) -> typing.Optional[int]:
@@ -80,34 +513,257 @@ class Worker(object):
             return None
         return tx_receipt['blockNumber']
 
-    def listen_blocks(self, last_block: int = 0) -> int:
-        pass
+    def fetch_logs(self, fetch: typing.Callable[[], list], count: bool = True) -> list:
+        """
+        Runs an eth_getLogs request, refused queries are reported as BlockRangeController.RangeError,
+        rate limited ones are retried after a backoff. Logs are counted towards the block range density
+        and the events metric unless count is False
+        """
+        attempt = 0
+        while True:
+            try:
+                events = fetch()
+                break
+            except Exception as e:
+                delay = self.block_range.rate_limit_delay(e, attempt)
+                if delay is not None:
+                    self.log.warning(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
+                                     f'Rate limited, retrying in {delay:.0f}s: {e}')
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                if not self.block_range.is_range_error(e):
+                    raise
+                raise BlockRangeController.RangeError(str(e)) from e
+        if count:
+            self.block_range.add_logs(len(events))
+            metrics.EVENTS.inc(len(events), worker=self.worker_key)
+        return events
 
-    def listen(self):
-        last_block = self.get_last_block()
-        class_name = self.__class__.__name__.lower()
+    def get_events(self, event_type, from_block_number: int, to_block_number: int) -> list:
+        if self.config.share_logs:
+            return self.get_bridge_events((event_type.event_name,), from_block_number, to_block_number)
+        return self.fetch_logs(lambda: event_type.get_logs(fromBlock=from_block_number, toBlock=to_block_number))
 
-        while True:
-            previous = last_block
-            last_block = self.listen_blocks(last_block + 1)
-            self.save_last_block(last_block)
-            self.log.info(f'[worker.{class_name}.{self.name}] Scanned blocks {previous + 1} - {last_block}')
+    @property
+    def shared_log_fetcher(self) -> SharedLogFetcher:
+        return self.pool.get_or_create(
+            ('logs', tuple(self.config.eth_rpc_urls), self.bridge.contract.address),
+            lambda: SharedLogFetcher(self.bridge.contract)
+        )
+
+    def get_bridge_events(
+        self, event_names: typing.Sequence[str], from_block_number: int, to_block_number: int
+    ) -> typing.List[EventData]:
+        """Bridge events of several types fetched with one eth_getLogs request, in block/log-index order"""
+        if self.config.share_logs:
+            return self.fetch_logs(
+                lambda: self.shared_log_fetcher.fetch(self.api, from_block_number, to_block_number, event_names)
+            )
+        key = tuple(event_names)
+        if key not in self._log_fetchers:
+            self._log_fetchers[key] = LogFetcher(self.bridge.contract, key)
+        fetcher = self._log_fetchers[key]
+        return self.fetch_logs(lambda: fetcher.fetch(self.api, from_block_number, to_block_number))
+
+    def get_transaction_manager(self, chain_id: int, api: web3.Web3) -> TransactionManager:
+        """Nonces are tracked per account and chain, so workers of the process sharing an account share the manager"""
+        return self.pool.get_or_create(
+            ('transactions', chain_id, self.account.address),
+            lambda: TransactionManager(
+                api, self.account, poll_latency=self.config.poll_latency, chain_id=chain_id,
+                stuck_timeout=self.config.tx_stuck_timeout, gas_bump_percent=self.config.tx_gas_bump_percent
+            )
+        )
+
+    def submit_batch_tx(
+        self, chain_id: int, contract: util.ContractWrapper, method_name: str, items: list,
+        on_revert: typing.Optional[typing.Callable[[typing.Any, Exception], None]] = None,
+        on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.List[typing.Tuple[list, dict]]:
+        """
+        Send every chunk of method_name(items) at once and wait until all of them are mined.
+        Returns mined chunks with their receipts, reverted chunks are bisected down to the items given to on_revert.
+        on_submitted gets every chunk with its transaction hash as soon as the node accepted it.
+        """
+        manager = self.get_transaction_manager(chain_id, contract.api)
+        mined = []
+
+        def on_included(chunk: list, receipt: dict):
+            metrics.TX_BATCH_ITEMS.observe(len(chunk), chain_id=chain_id, method=method_name)
+            mined.append((chunk, receipt))
+        submitted = manager.submit_batch(
+            contract, method_name, items, {'from': self.account.address},
+            batch_size=self.config.tx_batch_size, max_gas=self.config.tx_batch_max_gas,
+            on_revert=on_revert, on_included=on_included, on_submitted=on_submitted
+        )
+        # only the transactions of this call, workers sharing the account have their own
+        manager.flush(pending=submitted)
+        return mined
 
     @property
-    def last_block_file_path(self):
-        return os.path.abspath(os.path.join(
-            os.path.dirname(__file__),
-            '..', '..', 'data', f'last_block_{self.__class__.__name__.lower()}_{self.name}.json'
-        ))
+    def head_subscription(self) -> typing.Optional[HeadSubscription]:
+        if self.config.eth_ws_rpc is None:
+            return None
+        return self.pool.get_or_create(
+            ('heads', self.config.eth_ws_rpc), lambda: HeadSubscription(self.config.eth_ws_rpc).start()
+        )
 
-    def save_last_block(self, last_block_number: int):
-        copy_path = f'{self.last_block_file_path}.copy'
-        with open(copy_path, 'w', encoding='utf-8') as f:
-            f.write(json.dumps(last_block_number))
-        os.rename(copy_path, self.last_block_file_path)
+    @property
+    def head_tracker(self) -> HeadTracker:
+        return self.pool.get_or_create(
+            ('head_tracker', tuple(self.config.eth_rpc_urls)),
+            lambda: HeadTracker(
+                self.api, max_age=self.config.poll_latency, fallback_depth=self.config.eth_block_confirmations
+            )
+        )
 
-    def get_last_block(self):
-        if not os.path.exists(self.last_block_file_path):
-            return int(os.getenv('START_FROM_BLOCK', '0'))
-        with open(self.last_block_file_path, 'r', encoding='utf-8') as f:
-            return json.loads(f.read())
+    def wait_for_block(self, last_block: int) -> int:
+        """Waits until last_block is final by the chain policy, returns the last final block"""
+        policy = self.config.finality_policy(self.chain_id)
+        tracker = self.head_tracker
+        subscription = self.head_subscription
+        prefetching = self.config.prefetch_confirmations is not None and bool(self.prefetch_handlers())
+        final_block = tracker.final_block(policy)
+        while last_block >= final_block:
+            head = tracker.head()
+            if prefetching:
+                self.prefetch(last_block, head)
+            # a fixed depth tells which head makes last_block final, block tags are rechecked on every new head
+            min_head = head + 1 if prefetching or policy.is_tag else last_block + policy.depth + 1
+            new_head = None
+            if subscription is not None:
+                # returns None at once while the subscription is down
+                new_head = subscription.wait_for_head(min_head, timeout=subscription.idle_timeout)
+            if new_head is None:
+                time.sleep(self.config.poll_latency)
+            else:
+                tracker.observe_head(new_head)
+            final_block = tracker.final_block(policy)
+        return final_block
+
+    def unprocessed(self, events: typing.List[EventData]) -> typing.List[EventData]:
+        """Events without a final outcome, the rest was handled before a restart"""
+        receipts = {}
+        for chain_id, tx_hashes in self.submitted_transactions(events).items():
+            batch = self.rpc_batch(self.api if chain_id == self.chain_id else self.get_chain_api(chain_id), chain_id)
+            for tx_hash in tx_hashes:
+                batch.add_receipt(tx_hash)
+            receipts.update(zip(tx_hashes, batch.execute()))
+        return self.resolve_unprocessed(events, receipts)
+
+    def prefetch_handlers(self) -> typing.Dict[str, typing.Callable[[EventData], typing.Any]]:
+        """Bridge event name -> handler run ahead of final depth, its outcome is reused by prefetched()"""
+        return {}
+
+    def prefetch(self, last_block: int, head: int):
+        """
+        Runs prefetch handlers for events between the final and the prefetch depth.
+        Prefetching only saves time at final depth, a failure drops the prefetched results and the worker goes on
+        """
+        try:
+            self._prefetch(last_block, head)
+        except Exception as e:
+            if isinstance(e, BlockRangeController.RangeError):
+                self.block_range.shrink()
+            self.log.warning(f'[worker.{self.__class__.__name__.lower()}.{self.name}] Prefetch failed, '
+                             f'({len(self.prefetch_cache)}) prefetched results dropped: {e}')
+            self.prefetch_cache.clear()
+
+    def _prefetch(self, last_block: int, head: int):
+        handlers = self.prefetch_handlers()
+        cache = self.prefetch_cache
+        if cache.until is not None and self.api.eth.get_block(cache.until)['hash'] != cache.until_hash:
+            self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] Block #{cache.until} '
+                          f'replaced by reorg, ({len(cache)}) prefetched results dropped')
+            cache.clear()
+        from_block = last_block if cache.until is None else max(last_block, cache.until + 1)
+        to_block = min(head - self.config.prefetch_confirmations, from_block + self.block_range.size - 1)
+        if from_block > to_block:
+            return
+        until_hash = self.api.eth.get_block(to_block)['hash']
+        key = tuple(handlers)
+        if key not in self._log_fetchers:
+            self._log_fetchers[key] = LogFetcher(self.bridge.contract, key)
+        fetcher = self._log_fetchers[key]
+        # prefetched logs are fetched again at final depth, only those are counted
+        for event in self.fetch_logs(lambda: fetcher.fetch(self.api, from_block, to_block), count=False):
+            try:
+                with self.event_span(event, handlers[event['event']]):
+                    value = handlers[event['event']](event)
+                self.prefetch_cache.store(event, True, value)
+            except self.PREFETCH_EXCEPTIONS as e:
+                self.prefetch_cache.store(event, False, e)
+            except Exception as e:
+                # not cached, the event is handled again at final depth
+                self.log.debug(f'Prefetch of {event["event"]} in block #{event["blockNumber"]} failed: {e}')
+        cache.until, cache.until_hash = to_block, until_hash
+
+    def prefetched(self, event: EventData, handler: typing.Callable[[EventData], typing.Any]):
+        """Outcome of handler(event) computed ahead of final depth in the same block, or computed now"""
+        found, succeeded, value = self.prefetch_cache.pop(event)
+        metrics.CACHE_REQUESTS.inc(cache='prefetch', result='hit' if found else 'miss')
+        if not found:
+            with self.event_span(event, handler):
+                return handler(event)
+        if not succeeded:
+            raise value
+        return value
+
+    @classmethod
+    def event_span(cls, event: EventData, handler: typing.Callable[[EventData], typing.Any]):
+        """Groups the calls made for one event when profiling"""
+        tx_hash = event['args'].get('txHash')
+        return tracing.TRACER.span(
+            'event', handler=handler.__name__, event=event['event'],
+            position=f'{event["blockNumber"]}:{event["logIndex"]}',
+            **({'txHash': tx_hash.hex()} if tx_hash is not None else {})
+        )
+
+    def process_blocks(self, from_block_number: int, to_block_number: int):
+        pass
+
+    def listen_blocks(self, last_block: int = 0) -> int:
+        current_block = self.wait_for_block(last_block)
+        while True:
+            to_block = self.block_range.next_range(last_block, current_block)
+            started = time.monotonic()
+            try:
+                with tracing.TRACER.span('blocks', worker=self.worker_key, range=f'{last_block}-{to_block}'):
+                    self.process_blocks(from_block_number=last_block, to_block_number=to_block)
+            except BlockRangeController.RangeError as e:
+                if not self.block_range.shrink():
+                    raise
+                self.log.warning(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
+                                 f'Blocks {last_block} - {to_block} refused by node, '
+                                 f'retrying with range {self.block_range.size}: {e.message}')
+                continue
+            elapsed = time.monotonic() - started
+            self.block_range.record(to_block - last_block + 1, elapsed)
+            self.prefetch_cache.prune(to_block)
+            metrics.BLOCKS.inc(to_block - last_block + 1, worker=self.worker_key)
+            metrics.RANGE_SECONDS.observe(elapsed, worker=self.worker_key)
+            return to_block
+
+    def start_metrics(self):
+        if self.config.metrics_port is not None:
+            # one server per process, workers of a supervisor share it
+            port = self.config.metrics_port
+            self.pool.get_or_create(('metrics', port), lambda: metrics.serve(port))
+
+    def listen(self):
+        last_block = self.get_last_block()
+        class_name = self.__class__.__name__.lower()
+        self.start_metrics()
+
+        try:
+            while True:
+                previous = last_block
+                last_block = self.listen_blocks(last_block + 1)
+                self.save_last_block(last_block)
+                metrics.HEAD_LAG.set(self.head_tracker.head() - last_block, worker=self.worker_key)
+                speed = self.block_range.blocks_per_second
+                self.log.info(f'[worker.{class_name}.{self.name}] Scanned blocks {previous + 1} - {last_block}'
+                              + (f' ({speed:.1f} blocks/s)' if speed is not None else ''))
+        finally:
+            self.checkpoints.flush()
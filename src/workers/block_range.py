@@ -0,0 +1,107 @@
+import typing
+
+import requests
+
+
+__all__ = ['BlockRangeController']
+
+
+class BlockRangeController(object):
+    """
+    Chooses the size of the next eth_getLogs window.
+    The window doubles while ranges come back sparse, shrinks proportionally when they are dense
+    and is halved when the node refuses the query (too many results, range limit, timeout).
+    Rate limited requests say nothing about the window, they are retried as they are after a backoff.
+    """
+    # parts of provider error messages telling that the query was too heavy
+    RANGE_ERROR_MARKERS = (
+        'block range', 'blocks range', 'range is too', 'range too', 'range limit', 'max range', 'limited to a',
+        'query returned more than', 'too many results', 'exceeds max results', 'response size',
+        'logs matched by query exceeds', 'timeout', 'timed out'
+    )
+    # parts of error messages of throttled requests (HTTP 429 and JSON-RPC rate limit errors)
+    RATE_LIMIT_MARKERS = (
+        '429', 'too many requests', 'rate limit', 'rate-limit', 'ratelimit', 'request limit', 'throttl'
+    )
+    RATE_LIMIT_RETRIES = 5
+    # seconds before the first retry of a rate limited request, doubled for every next one
+    RATE_LIMIT_BACKOFF = 1.0
+    MAX_BACKOFF = 30.0
+    # consecutive sparse ranges required before the window grows
+    GROW_AFTER = 2
+    SPEED_DECAY = 0.3
+
+    class RangeError(Exception):
+        def __init__(self, message: str):
+            super().__init__(message)
+            self.message = message
+
+    def __init__(self, initial: int = 10, minimum: int = 1, maximum: int = 2000, target_logs: int = 500):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target_logs = max(1, target_logs)
+        self.size = min(max(initial, self.minimum), self.maximum)
+        self.logs = 0
+        self.blocks_per_second: typing.Optional[float] = None
+        self._sparse = 0
+
+    @classmethod
+    def is_rate_limited(cls, error: Exception) -> bool:
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None) == 429:
+            return True
+        message = str(error).lower()
+        return any(marker in message for marker in cls.RATE_LIMIT_MARKERS)
+
+    @classmethod
+    def is_range_error(cls, error: Exception) -> bool:
+        if cls.is_rate_limited(error):
+            return False
+        if isinstance(error, (requests.Timeout, TimeoutError)):
+            return True
+        message = str(error).lower()
+        return any(marker in message for marker in cls.RANGE_ERROR_MARKERS)
+
+    def rate_limit_delay(self, error: Exception, attempt: int) -> typing.Optional[float]:
+        """Seconds to wait before retrying the request of the given attempt (0 first), None if it must not be"""
+        if attempt >= self.RATE_LIMIT_RETRIES or not self.is_rate_limited(error):
+            return None
+        return min(self.MAX_BACKOFF, self.RATE_LIMIT_BACKOFF * 2 ** attempt)
+
+    def next_range(self, from_block: int, head: int) -> int:
+        """Returns the last block of the window starting at from_block, never beyond head"""
+        self.logs = 0
+        return min(from_block + self.size - 1, head)
+
+    def add_logs(self, count: int):
+        self.logs += count
+
+    def record(self, blocks: int, elapsed: float):
+        """Adjusts the window after a successfully processed range of the given number of blocks"""
+        if elapsed > 0:
+            speed = blocks / elapsed
+            if self.blocks_per_second is None:
+                self.blocks_per_second = speed
+            else:
+                self.blocks_per_second += self.SPEED_DECAY * (speed - self.blocks_per_second)
+        if blocks < self.size:
+            # the window was cut by the head, its fill says nothing about density
+            return
+        if self.logs > self.target_logs:
+            self._sparse = 0
+            self.size = max(self.minimum, self.size * self.target_logs // self.logs)
+        elif self.logs * 2 <= self.target_logs:
+            self._sparse += 1
+            if self._sparse >= self.GROW_AFTER:
+                self._sparse = 0
+                self.size = min(self.maximum, self.size * 2)
+        else:
+            self._sparse = 0
+
+    def shrink(self) -> bool:
+        """Halves the window after a refused query, returns False if it can not get any smaller"""
+        self._sparse = 0
+        if self.size <= self.minimum:
+            return False
+        self.size = max(self.minimum, self.size // 2)
+        return True
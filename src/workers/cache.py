@@ -0,0 +1,57 @@
+import threading
+import time
+import typing
+
+from src import metrics, util
+
+
+__all__ = ['BridgeConfigCache']
+
+
+class BridgeConfigCache(object):
+    """
+    Cache of rarely changing bridge settings keyed by (chainId, bridge address).
+    Write-once values (non-zero links, registered tokens) never change and are kept for the life of the process,
+    the rest expire after ttl seconds: the contract emits no events for addPair, removePair or
+    setRequiredConfirmations, so ttl is the only bound for them.
+    """
+    # method name -> predicate telling whether the returned value can never change
+    CACHED_METHODS: typing.Dict[str, typing.Callable[[typing.Any], bool]] = {
+        'links': lambda value: value != util.ADDRESS_0,
+        'tokens': lambda value: True,
+        'hasPair': lambda value: False,
+        'getDestinationAddress': lambda value: False,
+        'requiredConfirmations': lambda value: False,
+    }
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (chainId, address) -> (method name, arguments) -> (value, expires at or None)
+        self._entries: typing.Dict[tuple, typing.Dict[tuple, typing.Tuple[typing.Any, typing.Optional[float]]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(
+        self, chain_id: int, contract: util.ContractWrapper, method_name: str, arguments: tuple
+    ) -> typing.Tuple[bool, typing.Any]:
+        if method_name not in self.CACHED_METHODS:
+            return False, None
+        with self._lock:
+            value, expires_at = self._entries.get((chain_id, contract.address), {}).get(
+                (method_name, arguments), (None, 0.0)
+            )
+            if expires_at is None or expires_at > time.monotonic():
+                self.hits += 1
+                metrics.CACHE_REQUESTS.inc(cache='config', result='hit')
+                return True, value
+            self.misses += 1
+            metrics.CACHE_REQUESTS.inc(cache='config', result='miss')
+            return False, None
+
+    def store(self, chain_id: int, contract: util.ContractWrapper, method_name: str, arguments: tuple, value):
+        if method_name not in self.CACHED_METHODS:
+            return
+        expires_at = None if self.CACHED_METHODS[method_name](value) else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries.setdefault((chain_id, contract.address), {})[(method_name, arguments)] = (value, expires_at)
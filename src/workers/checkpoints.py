@@ -0,0 +1,134 @@
+import threading
+import time
+import typing
+
+import peewee
+from web3.types import EventData
+
+
+__all__ = ['CheckpointStore']
+
+
+checkpoint_db = peewee.SqliteDatabase(None)
+
+
+class CheckpointModel(peewee.Model):
+    class Meta:
+        database = checkpoint_db
+
+
+class Cursor(CheckpointModel):
+    worker = peewee.CharField(primary_key=True)
+    block_number = peewee.IntegerField()
+
+    class Meta:
+        table_name = 'cursor'
+
+
+class EventOutcome(CheckpointModel):
+    worker = peewee.CharField()
+    block_hash = peewee.CharField(max_length=64)
+    log_index = peewee.IntegerField()
+    block_number = peewee.IntegerField(index=True)
+    outcome = peewee.TextField()
+
+    class Meta:
+        table_name = 'event_outcome'
+        primary_key = peewee.CompositeKey('worker', 'block_hash', 'log_index')
+
+
+class CheckpointStore(object):
+    """
+    SQLite checkpoints of workers: the last finished block and the outcome of every event handled after it.
+    A restart resumes from the cursor and skips events with a recorded outcome, so a range interrupted
+    mid-way does not repeat its transactions. Events are identified by (blockHash, logIndex),
+    an event moved to another block by a reorg is handled again.
+    Writes are buffered and committed at most every flush_interval seconds unless flushed explicitly,
+    workers flush right after the outcome of a transaction is known.
+    """
+    SCHEMA_LOCK = threading.Lock()
+
+    def __init__(self, path: str, worker: str, flush_interval: float = 1.0):
+        self.worker = worker
+        self.flush_interval = flush_interval
+        with self.SCHEMA_LOCK:
+            if checkpoint_db.database is None:
+                # WAL keeps readers and the writer apart, commits are the only fsync points
+                checkpoint_db.init(path, pragmas={'journal_mode': 'wal', 'synchronous': 'full'})
+            elif checkpoint_db.database != path:
+                raise ValueError(f'Checkpoints are already stored in {checkpoint_db.database}')
+            checkpoint_db.create_tables([Cursor, EventOutcome], safe=True)
+        self._lock = threading.RLock()
+        self._cursor: typing.Optional[int] = None
+        self._cursor_dirty = False
+        # (blockHash, logIndex) -> (blockNumber, outcome)
+        self._outcomes: typing.Dict[typing.Tuple[str, int], typing.Tuple[int, str]] = {}
+        self._pending: typing.Dict[typing.Tuple[str, int], typing.Tuple[int, str]] = {}
+        self._flushed_at = time.monotonic()
+        row = Cursor.get_or_none(Cursor.worker == worker)
+        if row is not None:
+            self._cursor = row.block_number
+        self._outcomes = {
+            (item.block_hash, item.log_index): (item.block_number, item.outcome)
+            for item in EventOutcome.select().where(EventOutcome.worker == worker)
+        }
+
+    @property
+    def last_block(self) -> typing.Optional[int]:
+        return self._cursor
+
+    @classmethod
+    def key(cls, event: EventData) -> typing.Tuple[str, int]:
+        return bytes(event['blockHash']).hex(), event['logIndex']
+
+    def outcome(self, event: EventData) -> typing.Optional[str]:
+        with self._lock:
+            return self._outcomes.get(self.key(event), (None, None))[1]
+
+    def is_processed(self, event: EventData) -> bool:
+        with self._lock:
+            return self.key(event) in self._outcomes
+
+    def record(self, event: EventData, outcome: str):
+        with self._lock:
+            self._outcomes[self.key(event)] = (event['blockNumber'], outcome)
+            self._pending[self.key(event)] = (event['blockNumber'], outcome)
+        self.maybe_flush()
+
+    def advance(self, block_number: int):
+        """Every event up to block_number is handled"""
+        with self._lock:
+            self._cursor = block_number
+            self._cursor_dirty = True
+            for key in [key for key, (number, _) in self._outcomes.items() if number <= block_number]:
+                del self._outcomes[key]
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Commits buffered outcomes and the cursor in one transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            cursor, cursor_dirty, self._cursor_dirty = self._cursor, self._cursor_dirty, False
+            self._flushed_at = time.monotonic()
+            if not pending and not cursor_dirty:
+                return
+            with checkpoint_db.atomic():
+                rows = [
+                    {
+                        'worker': self.worker, 'block_hash': block_hash, 'log_index': log_index,
+                        'block_number': block_number, 'outcome': outcome
+                    }
+                    for (block_hash, log_index), (block_number, outcome) in pending.items()
+                ]
+                for chunk in peewee.chunked(rows, 100):
+                    EventOutcome.insert_many(chunk).on_conflict_replace().execute()
+                if cursor_dirty:
+                    Cursor.insert(worker=self.worker, block_number=cursor).on_conflict_replace().execute()
+                    # outcomes behind the cursor are covered by it
+                    EventOutcome.delete().where(
+                        (EventOutcome.worker == self.worker) & (EventOutcome.block_number <= cursor)
+                    ).execute()
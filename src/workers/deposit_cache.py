@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+import typing
+
+import peewee
+
+
+__all__ = ['DepositCache']
+
+
+deposit_cache_db = peewee.SqliteDatabase(None)
+
+
+class CachedDeposit(peewee.Model):
+    chain_id = peewee.IntegerField()
+    tx_hash = peewee.CharField(max_length=64)
+    block_hash = peewee.CharField(max_length=64)
+    block_number = peewee.IntegerField()
+    # Deposit event arguments as a JSON list
+    deposits = peewee.TextField()
+    used_at = peewee.FloatField(index=True)
+
+    class Meta:
+        database = deposit_cache_db
+        table_name = 'deposit_log'
+        primary_key = peewee.CompositeKey('chain_id', 'tx_hash', 'block_hash')
+
+
+class DepositCache(object):
+    """
+    On-disk LRU cache of Deposit events decoded from source chain receipts, keyed by (chainId, txHash, blockHash).
+    An entry is only valid while its block is canonical: callers check the hash of the block in the request
+    they send anyway and discard the entry after a reorg. The SQLite file can be shared by the validators
+    of one host, each deposit is then fetched and decoded once. At most max_entries are kept.
+    """
+    SCHEMA_LOCK = threading.Lock()
+    EVICT_EVERY = 100
+
+    class Entry(typing.NamedTuple):
+        block_number: int
+        block_hash: bytes
+        deposits: typing.List[dict]
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._stores = 0
+        with self.SCHEMA_LOCK:
+            if deposit_cache_db.database is None:
+                # losing the last writes of a cache is harmless, commits do not wait for fsync
+                deposit_cache_db.init(path, pragmas={'journal_mode': 'wal', 'synchronous': 'normal'})
+            elif deposit_cache_db.database != path:
+                raise ValueError(f'Deposits are already cached in {deposit_cache_db.database}')
+            deposit_cache_db.create_tables([CachedDeposit], safe=True)
+
+    @classmethod
+    def to_hex(cls, value: typing.Union[bytes, str]) -> str:
+        return bytes(value).hex() if not isinstance(value, str) else value.lower().removeprefix('0x')
+
+    def lookup(self, chain_id: int, tx_hash: typing.Union[bytes, str]) -> typing.Optional[Entry]:
+        """The most recently used entry of the transaction"""
+        row = CachedDeposit.select().where(
+            (CachedDeposit.chain_id == chain_id) & (CachedDeposit.tx_hash == self.to_hex(tx_hash))
+        ).order_by(CachedDeposit.used_at.desc()).first()
+        if row is None:
+            return None
+        CachedDeposit.update(used_at=time.time()).where(
+            (CachedDeposit.chain_id == chain_id) & (CachedDeposit.tx_hash == row.tx_hash)
+            & (CachedDeposit.block_hash == row.block_hash)
+        ).execute()
+        return self.Entry(row.block_number, bytes.fromhex(row.block_hash), json.loads(row.deposits))
+
+    def store(self, chain_id: int, tx_hash: typing.Union[bytes, str], block_number: int,
+              block_hash: typing.Union[bytes, str], deposits: typing.List[dict]):
+        CachedDeposit.insert(
+            chain_id=chain_id, tx_hash=self.to_hex(tx_hash), block_hash=self.to_hex(block_hash),
+            block_number=block_number, deposits=json.dumps(deposits), used_at=time.time()
+        ).on_conflict_replace().execute()
+        self._stores += 1
+        if self._stores % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def discard(self, chain_id: int, tx_hash: typing.Union[bytes, str], block_hash: typing.Union[bytes, str]):
+        CachedDeposit.delete().where(
+            (CachedDeposit.chain_id == chain_id) & (CachedDeposit.tx_hash == self.to_hex(tx_hash))
+            & (CachedDeposit.block_hash == self.to_hex(block_hash))
+        ).execute()
+
+    def evict(self):
+        """Drops the least recently used entries above max_entries"""
+        oldest_kept = CachedDeposit.select(CachedDeposit.used_at).order_by(
+            CachedDeposit.used_at.desc()
+        ).offset(self.max_entries - 1).limit(1).scalar()
+        if oldest_kept is not None:
+            CachedDeposit.delete().where(CachedDeposit.used_at < oldest_kept).execute()
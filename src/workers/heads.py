@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+import typing
+
+import web3
+import web3.exceptions
+
+
+__all__ = ['FinalityPolicy', 'HeadTracker']
+
+
+class FinalityPolicy(object):
+    """
+    When a block is final: a fixed depth below the head ("depth:64" or just "64"),
+    or the node's "finalized"/"safe" block tag.
+    """
+    DEPTH = 'depth'
+    TAGS = ('finalized', 'safe')
+
+    def __init__(self, kind: str, depth: int = 0):
+        if kind != self.DEPTH and kind not in self.TAGS:
+            raise ValueError(f'Unknown finality policy {kind}')
+        self.kind = kind
+        self.depth = depth
+
+    @classmethod
+    def parse(cls, value: str) -> 'FinalityPolicy':
+        value = value.strip()
+        if value in cls.TAGS:
+            return cls(value)
+        if value.startswith(f'{cls.DEPTH}:'):
+            value = value[len(cls.DEPTH) + 1:]
+        return cls(cls.DEPTH, int(value))
+
+    @property
+    def is_tag(self) -> bool:
+        return self.kind != self.DEPTH
+
+    def __eq__(self, other):
+        return isinstance(other, FinalityPolicy) and (self.kind, self.depth) == (other.kind, other.depth)
+
+    def __hash__(self):
+        return hash((self.kind, self.depth))
+
+    def __repr__(self):
+        return f'{self.DEPTH}:{self.depth}' if self.kind == self.DEPTH else self.kind
+
+
+class HeadTracker(object):
+    """
+    Head and final block of one chain, shared by the workers listening to it.
+    Every value is requested at most once per max_age seconds, whoever asks first refreshes it for everybody.
+    Nodes not supporting a block tag fall back to the fixed depth given by fallback_depth, other failures
+    to resolve a tag (no finalized block yet, a node restarting) fall back until the tag is probed again
+    after TAG_RETRY_INTERVAL seconds.
+    """
+    logger = logging.getLogger('worker.heads')
+    TAG_RETRY_INTERVAL = 60.0
+    # lower-cased parts of the errors of nodes that do not know the tag at all
+    UNSUPPORTED_TAG_MARKERS = (
+        'invalid block tag', 'unknown block tag', 'unsupported block tag', 'block tag not supported',
+        'invalid argument', 'cannot unmarshal', 'hex string without 0x prefix',
+    )
+
+    def __init__(self, api: web3.Web3, max_age: float = 3.0, fallback_depth: int = 64):
+        self.api = api
+        self.max_age = max_age
+        self.fallback_depth = fallback_depth
+        self._lock = threading.Lock()
+        # 'head' or block tag -> (block number, resolved at)
+        self._values: typing.Dict[str, typing.Tuple[int, float]] = {}
+        # block tag -> when to probe it again, never for tags the node does not support
+        self._disabled_tags: typing.Dict[str, float] = {}
+
+    def observe_head(self, head: int):
+        """Head announced by other means (e.g. a newHeads subscription), saves an eth_blockNumber request"""
+        with self._lock:
+            if head > self._values.get('head', (-1, 0.0))[0]:
+                self._values['head'] = (head, time.monotonic())
+
+    def head(self) -> int:
+        return self._resolve('head', lambda: self.api.eth.block_number)
+
+    def final_block(self, policy: FinalityPolicy) -> int:
+        if self.tag_enabled(policy):
+            try:
+                return self._resolve(policy.kind, lambda: self.api.eth.get_block(policy.kind)['number'])
+            except (ValueError, web3.exceptions.BlockNotFound) as e:
+                self.disable_tag(policy, e)
+        return self.head() - self.depth(policy)
+
+    def tag_enabled(self, policy: FinalityPolicy) -> bool:
+        return policy.is_tag and self._disabled_tags.get(policy.kind, 0.0) <= time.monotonic()
+
+    def disable_tag(self, policy: FinalityPolicy, error: Exception):
+        """Falls back to the fixed depth for good if the node does not know the tag, else until the next probe"""
+        if self.is_unsupported_tag_error(error):
+            self.logger.warning(f'Block tag "{policy.kind}" is not supported by the node, '
+                                f'using fixed depth {self.fallback_depth} instead: {error}')
+            self._disabled_tags[policy.kind] = float('inf')
+        else:
+            self.logger.warning(f'Block tag "{policy.kind}" not resolved, using fixed depth '
+                                f'{self.fallback_depth} for {self.TAG_RETRY_INTERVAL:.0f}s: {error}')
+            self._disabled_tags[policy.kind] = time.monotonic() + self.TAG_RETRY_INTERVAL
+
+    def depth(self, policy: FinalityPolicy) -> int:
+        return policy.depth if not policy.is_tag else self.fallback_depth
+
+    @classmethod
+    def is_unsupported_tag_error(cls, error: Exception) -> bool:
+        if isinstance(error, web3.exceptions.BlockNotFound):
+            # the node knows the tag, it has no such block yet
+            return False
+        message = str(error).lower()
+        return any(marker in message for marker in cls.UNSUPPORTED_TAG_MARKERS)
+
+    def _resolve(self, key: str, fetch: typing.Callable[[], int]) -> int:
+        with self._lock:
+            value, resolved_at = self._values.get(key, (None, 0.0))
+            if value is not None and time.monotonic() - resolved_at < self.max_age:
+                return value
+        value = fetch()
+        with self._lock:
+            self._values[key] = (value, time.monotonic())
+        return value
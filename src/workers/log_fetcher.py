@@ -0,0 +1,163 @@
+import collections
+import threading
+import typing
+
+import web3
+from eth_utils import event_abi_to_log_topic
+from web3.types import EventData, FilterParams, LogReceipt
+
+from src import metrics
+
+
+__all__ = ['LogFetcher', 'SharedLogFetcher']
+
+
+class LogFetcher(object):
+    """
+    Fetches several event types of one contract with a single eth_getLogs request (topic0 OR-list)
+    and decodes them in block/log-index order.
+    Works with both sync and async contracts: the caller sends filter_params and passes the logs to decode.
+    """
+    def __init__(self, contract: typing.Union[web3.contract.Contract, web3.contract.AsyncContract],
+                 event_names: typing.Sequence[str]):
+        self.address = contract.address
+        self.event_names = tuple(event_names)
+        # topic0 -> event used to decode the log
+        self.events = {}
+        for name in self.event_names:
+            event = getattr(contract.events, name)()
+            self.events[web3.Web3.to_hex(event_abi_to_log_topic(event.abi))] = event
+
+    def filter_params(self, from_block_number: int, to_block_number: int) -> FilterParams:
+        return {
+            'fromBlock': from_block_number, 'toBlock': to_block_number,
+            'address': self.address, 'topics': [list(self.events)]
+        }
+
+    def decode(self, logs: typing.Iterable[LogReceipt]) -> typing.List[EventData]:
+        events = []
+        for log in logs:
+            if not log['topics']:
+                continue
+            event = self.events.get(web3.Web3.to_hex(log['topics'][0]))
+            if event is not None:
+                events.append(event.process_log(log))
+        events.sort(key=lambda item: (item['blockNumber'], item['logIndex']))
+        return events
+
+    def fetch(self, api: web3.Web3, from_block_number: int, to_block_number: int) -> typing.List[EventData]:
+        return self.decode(api.eth.get_logs(self.filter_params(from_block_number, to_block_number)))
+
+
+class SharedLogFetcher(object):
+    """
+    Fetches bridge events for the workers of one process listening to the same bridge, one topic0 OR-list
+    holds the event types all of them asked for. A range fetched (or being fetched) by one worker serves
+    the blocks it shares with the ranges other workers ask for, only blocks no kept range covers are requested;
+    the last max_ranges ranges are kept. Only the sync runtime shares fetchers.
+    """
+    def __init__(self, contract: web3.contract.Contract, max_ranges: int = 16):
+        self.contract = contract
+        self.max_ranges = max_ranges
+        self._lock = threading.Lock()
+        # decodes the event types registered so far, replaced when a worker asks for a new one
+        self._fetcher: typing.Optional[LogFetcher] = None
+        # (fromBlock, toBlock) -> fetch result shared by the workers asking for blocks of the range
+        self._ranges: typing.Dict[typing.Tuple[int, int], SharedLogFetcher.Range] = collections.OrderedDict()
+
+    class Range(object):
+        def __init__(self, fetcher: LogFetcher, from_block_number: int, to_block_number: int):
+            self.fetcher = fetcher
+            self.from_block_number = from_block_number
+            self.to_block_number = to_block_number
+            self.done = threading.Event()
+            self.events: typing.List[EventData] = []
+            self.error: typing.Optional[Exception] = None
+
+        @property
+        def key(self) -> typing.Tuple[int, int]:
+            return self.from_block_number, self.to_block_number
+
+        def covers(self, event_names: typing.Set[str]) -> bool:
+            return event_names.issubset(self.fetcher.event_names)
+
+    @property
+    def event_names(self) -> typing.Tuple[str, ...]:
+        return self._fetcher.event_names if self._fetcher is not None else ()
+
+    def register(self, event_names: typing.Iterable[str]) -> LogFetcher:
+        """Adds event types to the ones requested from now on"""
+        with self._lock:
+            missing = [name for name in event_names if name not in self.event_names]
+            if self._fetcher is None or missing:
+                self._fetcher = LogFetcher(self.contract, self.event_names + tuple(missing))
+            return self._fetcher
+
+    def fetch(
+        self, api: web3.Web3, from_block_number: int, to_block_number: int, event_names: typing.Sequence[str]
+    ) -> typing.List[EventData]:
+        """Events of the given types in the range, in block/log-index order"""
+        names = set(event_names)
+        fetcher = self.register(event_names)
+        with self._lock:
+            parts, owned = self._plan(fetcher, from_block_number, to_block_number, names)
+        metrics.CACHE_REQUESTS.inc(cache='logs', result='miss' if owned else 'hit')
+        try:
+            for entry in owned:
+                entry.events = entry.fetcher.fetch(api, entry.from_block_number, entry.to_block_number)
+                entry.done.set()
+        except Exception as e:
+            # failures are not cached, the next caller retries
+            with self._lock:
+                for entry in owned:
+                    if not entry.done.is_set():
+                        entry.error = e
+                        if self._ranges.get(entry.key) is entry:
+                            del self._ranges[entry.key]
+                        entry.done.set()
+            raise
+        events = []
+        for entry, from_block, to_block in parts:
+            entry.done.wait()
+            if entry.error is not None:
+                raise entry.error
+            events.extend(
+                event for event in entry.events
+                if from_block <= event['blockNumber'] <= to_block and event['event'] in names
+            )
+        events.sort(key=lambda item: (item['blockNumber'], item['logIndex']))
+        return events
+
+    def _plan(
+        self, fetcher: LogFetcher, from_block_number: int, to_block_number: int, event_names: typing.Set[str]
+    ) -> tuple:
+        """
+        Splits the range into (kept range, from, to) parts, blocks of no kept range with the event types
+        become new ranges owned by the caller. Called with the lock held.
+        """
+        kept = [
+            entry for entry in self._ranges.values()
+            if entry.covers(event_names)
+            and entry.from_block_number <= to_block_number and entry.to_block_number >= from_block_number
+        ]
+        parts, owned = [], []
+        block = from_block_number
+        while block <= to_block_number:
+            entry = max(
+                (entry for entry in kept if entry.from_block_number <= block <= entry.to_block_number),
+                key=lambda entry: entry.to_block_number, default=None
+            )
+            if entry is None:
+                next_kept = min(
+                    (entry.from_block_number for entry in kept if entry.from_block_number > block),
+                    default=to_block_number + 1
+                )
+                entry = self.Range(fetcher, block, min(next_kept - 1, to_block_number))
+                owned.append(entry)
+            self._ranges[entry.key] = entry
+            self._ranges.move_to_end(entry.key)
+            parts.append((entry, block, min(entry.to_block_number, to_block_number)))
+            block = entry.to_block_number + 1
+        while len(self._ranges) > self.max_ranges:
+            self._ranges.popitem(last=False)
+        return parts, owned
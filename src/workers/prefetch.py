@@ -0,0 +1,46 @@
+import typing
+
+from web3.types import EventData
+
+
+__all__ = ['PrefetchCache']
+
+
+class PrefetchCache(object):
+    """
+    Outcomes of events handled ahead of final depth, keyed by (blockHash, logIndex).
+    An event reaching final depth in another block after a reorg has another block hash and misses the cache;
+    until/until_hash remember the last prefetched block, so the owner can detect a reorg and clear the cache.
+    """
+    def __init__(self):
+        # (blockHash, logIndex) -> (blockNumber, succeeded, result or raised exception)
+        self._entries: typing.Dict[tuple, typing.Tuple[int, bool, typing.Any]] = {}
+        self.until: typing.Optional[int] = None
+        self.until_hash: typing.Optional[bytes] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def key(cls, event: EventData) -> tuple:
+        return bytes(event['blockHash']), event['logIndex']
+
+    def store(self, event: EventData, succeeded: bool, value):
+        self._entries[self.key(event)] = (event['blockNumber'], succeeded, value)
+
+    def pop(self, event: EventData) -> typing.Tuple[bool, bool, typing.Any]:
+        """Returns (found, succeeded, result or exception)"""
+        entry = self._entries.pop(self.key(event), None)
+        if entry is None:
+            return False, False, None
+        return True, entry[1], entry[2]
+
+    def clear(self):
+        self._entries.clear()
+        self.until = None
+        self.until_hash = None
+
+    def prune(self, to_block: int):
+        """Drops outcomes of blocks up to to_block, they are either used or belong to abandoned forks"""
+        for key in [key for key, (block_number, _, _) in self._entries.items() if block_number <= to_block]:
+            del self._entries[key]
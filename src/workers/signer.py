@@ -1,6 +1,6 @@
-import time
 import typing
-import random
+
+from web3.types import EventData
 
 from .base import Worker
 from src import util
@@ -12,6 +12,8 @@ __all__ = ['Signer']
 class Signer(Worker):
     TYPE_LISTER = 'lister'
     TYPE_TRANSACTOR = 'transactor'
+    # lister and transactor duties in one process sharing a single log scan
+    TYPE_COMBINED = 'combined'
 
     class SignerException(Exception):
         def __init__(self, message: str):
@@ -20,124 +22,238 @@ class Signer(Worker):
     class SignerError(SignerException):
         pass
 
-    def list_by_event(self, event):
+    # final outcomes only, exceptions added for temporary states are checked again at final depth
+    PREFETCH_EXCEPTIONS = (SignerError,)
+
+    def check_deposit_event(self, event) -> typing.Tuple[util.ContractWrapper, list]:
+        """Check Deposit event against both bridges, returns target bridge and `list` arguments for the deposit"""
+        tx_hash = event['transactionHash'].hex()
+        deposit_event = event['args']
+        has_pair, target_asset, target_bridge_address = self.rpc_batch(self.api, self.chain_id).add_call(
+            self.bridge, 'hasPair', (deposit_event['token'], deposit_event['targetChainId'])
+        ).add_call(
+            self.bridge, 'getDestinationAddress', (deposit_event['token'], deposit_event['targetChainId'])
+        ).add_call(
+            self.bridge, 'links', (deposit_event['targetChainId'],)
+        ).execute()
+        self.check_source_bridge(event, has_pair, target_bridge_address)
+
+        # check backlink from targetChainId
+        target_bridge = self.get_chain_bridge(deposit_event['targetChainId'], target_bridge_address, sign=True)
+        listed, backlink_address = self.rpc_batch(target_bridge.api, deposit_event['targetChainId']).add_call(
+            target_bridge, 'confirmations', (tx_hash,)
+        ).add_call(
+            target_bridge, 'links', (self.chain_id,)
+        ).execute()
+        return target_bridge, self.list_arguments(event, target_asset, listed, backlink_address)
+
+    def check_source_bridge(self, event: EventData, has_pair: bool, target_bridge_address: str):
+        """Checks of the pair and the link to targetChainId read from the source bridge, shared with AsyncSigner"""
         tx_hash = event['transactionHash'].hex()
         deposit_event = event['args']
-        if not self.bridge.call_method('hasPair', (deposit_event['token'], deposit_event['targetChainId'],)):
+        if not has_pair:
             raise self.SignerError(f'txHash {tx_hash}: pair for token {deposit_event["token"]} not registered')
-        target_asset = self.bridge.call_method(
-            'getDestinationAddress', (deposit_event['token'], deposit_event['targetChainId'])
-        )
 
         # check link to targetChainId
-        target_bridge_address = self.bridge.call_method('links', (deposit_event['targetChainId'],))
         if target_bridge_address == util.ADDRESS_0:
             raise self.SignerError(
                 f'txHash {tx_hash}: Bridge is not linked with chainId {deposit_event["targetChainId"]}'
             )
 
-        # check backlink from targetChainId
-        target_api = self.construct_http_api(random.choice(self.config.rpc_urls[deposit_event['targetChainId']]))
-        source_bridge = self.get_bridge_contract(
-            target_api, target_bridge_address, poll_latency=self.config.poll_latency
-        )
-        listed_receiver, listed_amount, listed_token_id, is_sent = source_bridge.call_method(
-            'confirmations', (tx_hash,)
-        )
+    def list_arguments(self, event: EventData, target_asset: str, listed: tuple, backlink_address: str) -> list:
+        """
+        `list` arguments of the deposit once the confirmations and the backlink read from the target bridge
+        are checked, shared with AsyncSigner
+        """
+        tx_hash = event['transactionHash'].hex()
+        deposit_event = event['args']
+        listed_receiver, listed_amount, listed_token_id, is_sent = listed
         if listed_amount > 0:
             raise self.SignerError(f'txHash {tx_hash}: txHash already listed')
-        backlink_address = source_bridge.call_method('links', (self.chain_id,))
         if backlink_address != self.bridge.contract.address:
             raise self.SignerError(f'txHash {tx_hash}: Bridge for chainId {deposit_event["targetChainId"]} '
                                    f'not linked with target bridge')
-        util.eth_add_to_auto_sign(target_api, self.account)
 
+        return [
+            int(target_asset, 16), int(deposit_event['receiver'], 16),
+            deposit_event['amount'], self.chain_id, int(tx_hash, 16)
+        ]
+
+    def list_deposits(
+        self, target_chain_id: int, target_bridge: util.ContractWrapper, items: typing.List[list],
+        on_revert: typing.Optional[typing.Callable[[list, Exception], None]] = None,
+        on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.List[int]:
+        """
+        List deposits on target bridge with as few `list` transactions as batch limits allow,
+        reverting batches are bisected down to the deposits the target bridge rejects, these go to on_revert
+        """
         if self.debug:
-            tx = {'blockNumber': self.api.eth.block_number}
+            block_number = self.api.eth.block_number
             self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                          f'DEBUG: Should listed txHash {tx_hash} in block #{tx["blockNumber"]}')
-            return tx
-        tx = source_bridge.execute_tx(
-            'list', ([
-                         [
-                             int(target_asset, 16), int(deposit_event['receiver'], 16),
-                             deposit_event['amount'], self.chain_id, int(tx_hash, 16)
-                         ]
-                     ],),
-            {'from': self.account.address}
-        )
-        self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                      f'listed txHash {tx_hash} in block #{tx["blockNumber"]}')
-        return tx
+                          f'DEBUG: Should list ({len(items)}) txHashes in block #{block_number}')
+            return [block_number]
+        block_numbers = []
+        for chunk, tx in self.submit_batch_tx(
+            target_chain_id, target_bridge, 'list', items, on_revert=on_revert, on_submitted=on_submitted
+        ):
+            self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
+                          f'listed ({len(chunk)}) txHashes in block #{tx["blockNumber"]}')
+            block_numbers.append(tx['blockNumber'])
+        return block_numbers
 
-    def listen_deposits(self, from_block_number: int, to_block_number: typing.Optional[int] = None):
-        events = self.bridge.contract.events.Deposit.get_logs(fromBlock=from_block_number, toBlock=to_block_number)
+    def listen_deposits(
+        self, from_block_number: int, to_block_number: typing.Optional[int] = None,
+        events: typing.Optional[typing.List[EventData]] = None
+    ):
+        if events is None:
+            events = self.get_events(self.bridge.contract.events.Deposit, from_block_number, to_block_number)
+        events = self.unprocessed(events)
         block_numbers = []
         if events:
             self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
                           f'Got ({len(events)}) deposit events from users '
                           f'in blocks #{from_block_number}-#{to_block_number}')
+        # targetChainId -> (target bridge, txHash -> (Deposit event, `list` arguments))
+        batches: typing.Dict[int, typing.Tuple[util.ContractWrapper, typing.Dict[str, tuple]]] = {}
         for event in events:
-            block_numbers.append(self.list_by_event(event)['blockNumber'])
+            tx_hash = event['transactionHash'].hex()
+            try:
+                target_bridge, list_args = self.prefetched(event, self.check_deposit_event)
+            except self.SignerError as e:
+                self.log.error(e.message)
+                self.record_outcome(event, f'error: {e.message}')
+                continue
+            target_chain_id = event['args']['targetChainId']
+            if target_chain_id not in batches:
+                batches[target_chain_id] = (target_bridge, {})
+            if tx_hash in batches[target_chain_id][1]:
+                self.log.error(f'txHash {tx_hash}: multiple deposits in one transaction, only first will be listed')
+                self.record_outcome(event, 'error: multiple deposits in one transaction')
+                continue
+            batches[target_chain_id][1][tx_hash] = (event, list_args)
+
+        for target_chain_id, (target_bridge, items) in batches.items():
+            # `list` arguments end with the txHash of the deposit
+            by_tx_hash = {list_args[-1]: event for event, list_args in items.values()}
+            rejected = set()
+
+            def on_revert(list_args: list, error: Exception):
+                event = by_tx_hash[list_args[-1]]
+                self.log.error(f'txHash {event["transactionHash"].hex()}: listing rejected by target bridge: {error}')
+                self.record_outcome(event, f'error: listing rejected by target bridge: {error}')
+                rejected.add(list_args[-1])
+
+            def on_submitted(chunk: list, tx_hash: bytes):
+                self.record_submitted(
+                    [by_tx_hash[list_args[-1]] for list_args in chunk], target_chain_id, tx_hash, 'listed'
+                )
+            block_numbers.extend(self.list_deposits(
+                target_chain_id, target_bridge, [list_args for _, list_args in items.values()],
+                on_revert=on_revert, on_submitted=on_submitted
+            ))
+            # every other deposit is in a mined `list` batch
+            for key, event in by_tx_hash.items():
+                if key not in rejected:
+                    self.record_outcome(event, 'listed')
+            # listings are on-chain, a restart must not send them again
+            self.checkpoints.flush()
 
         return block_numbers
 
-    def transfer(self, tx_hash):
+    def transfer(
+        self, tx_hashes: typing.List[bytes], on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.List[bytes]:
+        """Sends `transfer` batches, returns the txHashes of mined batches, the ones the bridge rejects are not"""
         if self.debug:
-            tx = {'blockNumber': self.api.eth.block_number}
             self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                          f'DEBUG: Should confirm (Call transfer)  txHash {tx_hash} in block #{tx["blockNumber"]}')
-            return tx
-        tx = self.bridge.execute_tx('transfer', ([tx_hash],), {'from': self.account.address})
-        self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                      f'confirm (call transfer) txHash {tx_hash} in block #{tx["blockNumber"]}')
-        return tx
-
-    def confirm_by_event(self, event, required_confirmations=None):
-        required_confirmations = (
-            self.bridge.call_method('requiredConfirmations')
-            if required_confirmations is None else required_confirmations
-        )
-        tx_hash = event['args']['txHash']
-        current_confirmations = self.bridge.call_method('confirmedBy', (tx_hash,))
-        if len(current_confirmations) < required_confirmations:
-            return
-        _, _, _, is_sent = self.bridge.call_method('confirmations', (tx_hash,))
-        if is_sent:
-            return
-        self.transfer(tx_hash)
+                          f'DEBUG: Should confirm (Call transfer) ({len(tx_hashes)}) txHashes '
+                          f'in block #{self.api.eth.block_number}')
+            return []
+        sent = []
+        for chunk, tx in self.submit_batch_tx(
+            self.chain_id, self.bridge, 'transfer', tx_hashes, on_revert=self.on_transfer_revert,
+            on_submitted=on_submitted
+        ):
+            self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
+                          f'confirm (call transfer) ({len(chunk)}) txHashes in block #{tx["blockNumber"]}')
+            sent.extend(chunk)
+        return sent
 
-    def listen_confirmations(self, from_block_number: int, to_block_number: typing.Optional[int] = None):
-        events = self.bridge.contract.events.Confirmed.get_logs(fromBlock=from_block_number, toBlock=to_block_number)
+    def on_transfer_revert(self, tx_hash: bytes, error: Exception):
+        self.log.error(f'txHash {tx_hash.hex()}: transfer rejected by bridge: {error}')
+
+    def transferable(self, tx_hashes: typing.List[bytes], required_confirmations: int) -> typing.List[bytes]:
+        """txHashes with enough confirmations and not sent yet, read for the whole window in one round-trip"""
+        batch = self.rpc_batch(self.api, self.chain_id)
+        for tx_hash in tx_hashes:
+            batch.add_call(self.bridge, 'confirmedBy', (tx_hash,)).add_call(self.bridge, 'confirmations', (tx_hash,))
+        results = batch.execute() if tx_hashes else []
+        return [
+            tx_hash
+            for tx_hash, current_confirmations, (_, _, _, is_sent) in zip(tx_hashes, results[::2], results[1::2])
+            if len(current_confirmations) >= required_confirmations and not is_sent
+        ]
+
+    def listen_confirmations(
+        self, from_block_number: int, to_block_number: typing.Optional[int] = None,
+        events: typing.Optional[typing.List[EventData]] = None
+    ):
+        if events is None:
+            events = self.get_events(self.bridge.contract.events.Confirmed, from_block_number, to_block_number)
+        events = self.unprocessed(events)
         if not events:
             return
+        # every validator emits its own Confirmed event, check each txHash once
+        tx_hashes = list(dict.fromkeys(event['args']['txHash'] for event in events))
         self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                      f'Got ({len(events)}) confirmation events from validators '
+                      f'Got ({len(events)}) confirmation events for ({len(tx_hashes)}) txHashes from validators '
                       f'in blocks #{from_block_number}-#{to_block_number}')
-        required_confirmations = self.bridge.call_method('requiredConfirmations')
+        required_confirmations = self.call_cached(self.chain_id, self.bridge, 'requiredConfirmations')
+        tx_hashes = self.transferable(tx_hashes, required_confirmations)
+        sent = set()
+        if tx_hashes:
+            sent = set(self.transfer(tx_hashes, on_submitted=lambda chunk, tx_hash: self.record_submitted(
+                [event for event in events if event['args']['txHash'] in chunk], self.chain_id, tx_hash, 'transfer sent'
+            )))
+        transferable = set(tx_hashes)
         for event in events:
-            self.confirm_by_event(event, required_confirmations)
+            tx_hash = event['args']['txHash']
+            self.record_outcome(event, (
+                'transfer sent' if tx_hash in sent
+                else 'transfer rejected' if tx_hash in transferable else 'not transferable'
+            ))
+        if tx_hashes:
+            # transfers are on-chain, a restart must not send them again
+            self.checkpoints.flush()
 
-    def listen_blocks(self, last_block: int = 0) -> int:
-        current_block = self.api.eth.block_number - self.config.eth_block_confirmations
-        while last_block >= current_block:
-            time.sleep(self.config.poll_latency)
-            current_block = self.api.eth.block_number - self.config.eth_block_confirmations
-
-        to_block = min(last_block + 10, current_block)
+    def prefetch_handlers(self):
+        if self.name in (self.TYPE_LISTER, self.TYPE_COMBINED):
+            return {'Deposit': self.check_deposit_event}
+        # transfers depend on confirmations collected up to the last moment
+        return {}
 
+    def process_blocks(self, from_block_number: int, to_block_number: int):
         if self.debug:
             self.log.debug(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                           f'Listen events from block ${last_block} to block #{to_block}')
+                           f'Listen events from block ${from_block_number} to block #{to_block_number}')
 
         if self.name == self.TYPE_LISTER:
-            self.listen_deposits(from_block_number=last_block, to_block_number=to_block)
+            self.listen_deposits(from_block_number=from_block_number, to_block_number=to_block_number)
         if self.name == self.TYPE_TRANSACTOR:
-            self.listen_confirmations(from_block_number=last_block, to_block_number=to_block)
-
-        return to_block
+            self.listen_confirmations(from_block_number=from_block_number, to_block_number=to_block_number)
+        if self.name == self.TYPE_COMBINED:
+            events = self.get_bridge_events(('Deposit', 'Confirmed'), from_block_number, to_block_number)
+            self.listen_deposits(
+                from_block_number, to_block_number, events=[event for event in events if event['event'] == 'Deposit']
+            )
+            self.listen_confirmations(
+                from_block_number, to_block_number, events=[event for event in events if event['event'] == 'Confirmed']
+            )
 
     def listen(self):
-        if self.name not in (self.TYPE_LISTER, self.TYPE_TRANSACTOR):
-            raise ValueError(f'Signer name must be one of [{self.TYPE_LISTER}, {self.TYPE_TRANSACTOR}]')
+        if self.name not in (self.TYPE_LISTER, self.TYPE_TRANSACTOR, self.TYPE_COMBINED):
+            raise ValueError(
+                f'Signer name must be one of [{self.TYPE_LISTER}, {self.TYPE_TRANSACTOR}, {self.TYPE_COMBINED}]'
+            )
         super().listen()
@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+import typing
+
+from websockets.sync.client import connect
+
+
+__all__ = ['HeadSubscription']
+
+
+class HeadSubscription(object):
+    """
+    eth_subscribe("newHeads") over WebSocket in a background thread.
+    Workers block in wait_for_head instead of polling eth_blockNumber; while the subscription is down
+    wait_for_head returns None right away, so the caller can fall back to polling.
+    """
+    logger = logging.getLogger('worker.subscription')
+
+    class SubscriptionError(Exception):
+        def __init__(self, message: str):
+            super().__init__(message)
+            self.message = message
+
+    def __init__(self, url: str, reconnect_delay: float = 5.0, idle_timeout: float = 60.0):
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        # a connection without heads for this long is considered dropped
+        self.idle_timeout = idle_timeout
+        self.head: typing.Optional[int] = None
+        self._connected = False
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._connection = None
+        self._thread: typing.Optional[threading.Thread] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def start(self) -> 'HeadSubscription':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'heads-{self.url}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._connection is not None:
+            self._connection.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait_for_head(self, min_head: int, timeout: typing.Optional[float] = None) -> typing.Optional[int]:
+        """
+        Blocks until a head >= min_head is announced and returns the latest head.
+        Returns None if the subscription is down or nothing arrived before the timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self._connected or (self.head is not None and self.head >= min_head), timeout
+            )
+            if not self._connected or self.head is None or self.head < min_head:
+                return None
+            return self.head
+
+    def _set_state(self, connected: bool, head: typing.Optional[int] = None):
+        with self._condition:
+            self._connected = connected
+            if head is not None and (self.head is None or head > self.head):
+                self.head = head
+            self._condition.notify_all()
+
+    def _subscribe(self, connection):
+        connection.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+        response = json.loads(connection.recv(timeout=self.idle_timeout))
+        if 'error' in response or 'result' not in response:
+            raise self.SubscriptionError(f'eth_subscribe rejected: {response.get("error", response)}')
+        return response['result']
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                with connect(self.url, open_timeout=self.idle_timeout) as connection:
+                    self._connection = connection
+                    subscription_id = self._subscribe(connection)
+                    self._set_state(True)
+                    self.logger.info(f'Subscribed to new heads on {self.url}')
+                    while not self._stopped.is_set():
+                        message = json.loads(connection.recv(timeout=self.idle_timeout))
+                        params = message.get('params') or {}
+                        if message.get('method') != 'eth_subscription' or params.get('subscription') != subscription_id:
+                            continue
+                        self._set_state(True, int(params['result']['number'], 16))
+            except Exception as e:
+                if not self._stopped.is_set():
+                    self.logger.warning(f'Head subscription on {self.url} dropped, polling instead: {e}')
+            finally:
+                self._connection = None
+                self._set_state(False)
+            self._stopped.wait(self.reconnect_delay)
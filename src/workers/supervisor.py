@@ -0,0 +1,168 @@
+import logging
+import os
+import re
+import threading
+import time
+import typing
+
+from ruamel.yaml import YAML
+
+from .base import Worker, WorkerConfig
+from .signer import Signer
+from .validator import Validator
+from .web import WebScanner
+
+
+__all__ = ['Supervisor']
+
+
+class Supervisor(object):
+    """
+    Runs the workers of several bridges and roles in one process, one thread per worker.
+    Workers share Worker.pool, so the ones listening to the same chain share the API and its connections,
+    the head tracker (one eth_blockNumber poll per chain) and eth_getLogs requests of overlapping block ranges.
+
+    The YAML config lists bridges, each one with WorkerConfig attributes (without the leading underscore
+    of private ones) and roles. Values are converted to the types of the attributes, ${VAR} in values is taken
+    from the environment and must be set, e.g. for private keys:
+
+        defaults:
+          rpc_urls_file_path: rpc_urls.json
+        bridges:
+          - name: moonbeam
+            eth_rpc: https://rpc.api.moonbeam.network
+            eth_contract_address: '0x...'
+            eth_private_key: ${MOONBEAM_SIGNER_KEY}
+            roles: [lister, transactor, validator]
+    """
+    LOGGER_NAME = 'worker.supervisor'
+    ROLES: typing.Dict[str, typing.Tuple[typing.Type[Worker], typing.Optional[str]]] = {
+        'validator': (Validator, None),
+        'lister': (Signer, Signer.TYPE_LISTER),
+        'transactor': (Signer, Signer.TYPE_TRANSACTOR),
+        'combined': (Signer, Signer.TYPE_COMBINED),
+        'webscanner': (WebScanner, None),
+    }
+
+    class SupervisorError(Exception):
+        def __init__(self, message: str):
+            self.message = message
+
+    def __init__(self, specs: typing.List[typing.Tuple[str, str, WorkerConfig]], debug: bool = False,
+                 restart_delay: float = 10.0):
+        self.specs = specs
+        self.debug = debug
+        self.restart_delay = restart_delay
+        self.log = logging.getLogger(self.LOGGER_NAME)
+        self.threads: typing.List[threading.Thread] = []
+        self._stopped = threading.Event()
+
+    ENV_VARIABLE = re.compile(r'\$\{([A-Za-z_][A-Za-z0-9_]*)\}')
+    TRUE_VALUES = ('1', 'true', 'yes', 'on')
+    FALSE_VALUES = ('0', 'false', 'no', 'off', '')
+
+    @classmethod
+    def expand_variables(cls, key: str, value: str) -> str:
+        def variable(match: re.Match) -> str:
+            if match.group(1) not in os.environ:
+                raise cls.SupervisorError(f'Setting {key}: environment variable {match.group(1)} is not set')
+            return os.environ[match.group(1)]
+        return cls.ENV_VARIABLE.sub(variable, value)
+
+    @classmethod
+    def convert(cls, key: str, value, annotation):
+        """Value of the YAML config or the environment as the type of the WorkerConfig attribute"""
+        if typing.get_origin(annotation) is typing.Union:
+            if value is None:
+                return None
+            annotation, = [item for item in typing.get_args(annotation) if item is not type(None)]
+        if annotation is None or isinstance(value, annotation):
+            return value
+        if annotation is bool and isinstance(value, str):
+            if value.strip().lower() in cls.TRUE_VALUES + cls.FALSE_VALUES:
+                return value.strip().lower() in cls.TRUE_VALUES
+        if annotation in (int, float, str) and not isinstance(value, (bool, dict, list)):
+            try:
+                converted = annotation(value)
+            except ValueError:
+                pass
+            else:
+                if annotation is not int or converted == float(value):
+                    return converted
+        raise cls.SupervisorError(f'Setting {key}: {value!r} is not {annotation.__name__}')
+
+    @classmethod
+    def make_config(cls, values: dict) -> WorkerConfig:
+        config = WorkerConfig()
+        annotations = typing.get_type_hints(WorkerConfig)
+        for key, value in values.items():
+            if isinstance(value, str):
+                value = cls.expand_variables(key, value)
+            for attribute in (key, f'_{key}'):
+                if hasattr(WorkerConfig, attribute) and not isinstance(getattr(WorkerConfig, attribute), property):
+                    setattr(config, attribute, cls.convert(key, value, annotations.get(attribute)))
+                    break
+            else:
+                raise cls.SupervisorError(f'Unknown worker setting {key}')
+        return config
+
+    @classmethod
+    def parse_config(cls, document: dict) -> typing.List[typing.Tuple[str, str, WorkerConfig]]:
+        """Returns (bridge name, role, config) of every worker"""
+        defaults = document.get('defaults') or {}
+        specs = []
+        for index, bridge in enumerate(document.get('bridges') or []):
+            bridge = dict(bridge)
+            name = str(bridge.pop('name', index))
+            bridge_roles = bridge.pop('roles', None) or []
+            if not bridge_roles:
+                raise cls.SupervisorError(f'Bridge {name} has no roles')
+            for role in bridge_roles:
+                if role not in cls.ROLES:
+                    raise cls.SupervisorError(f'Bridge {name}: unknown role {role}')
+                config = cls.make_config({**defaults, **bridge})
+                config.checkpoint_namespace = name
+                config.share_logs = True
+                specs.append((name, role, config))
+        if not specs:
+            raise cls.SupervisorError('No bridges configured')
+        return specs
+
+    @classmethod
+    def from_file(cls, path: str, debug: bool = False) -> 'Supervisor':
+        with open(path, 'r', encoding='utf-8') as f:
+            document = YAML(typ='safe').load(f)
+        return cls(cls.parse_config(document or {}), debug=debug)
+
+    def run_worker(self, bridge: str, role: str, config: WorkerConfig):
+        worker_class, name = self.ROLES[role]
+        while not self._stopped.is_set():
+            try:
+                worker = worker_class(config=config, name=name, debug=self.debug)
+                worker.listen()
+            except Exception as e:
+                self.log.exception(f'[worker.supervisor] {role} of bridge {bridge} failed, '
+                                   f'restarting in {self.restart_delay}s: {e}')
+                self._stopped.wait(self.restart_delay)
+
+    def start(self) -> 'Supervisor':
+        for bridge, role, config in self.specs:
+            thread = threading.Thread(
+                target=self.run_worker, args=(bridge, role, config), name=f'{bridge}.{role}', daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+            self.log.info(f'[worker.supervisor] Started {role} of bridge {bridge}')
+        return self
+
+    def stop(self):
+        """Workers are not restarted anymore, the running ones end with the process"""
+        self._stopped.set()
+
+    def run(self):
+        self.start()
+        try:
+            while any(thread.is_alive() for thread in self.threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
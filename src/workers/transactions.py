@@ -0,0 +1,255 @@
+import logging
+import math
+import threading
+import time
+import typing
+
+import web3
+import web3.exceptions
+import eth_account.account
+from hexbytes import HexBytes
+
+from src import metrics, util
+
+
+__all__ = ['TransactionManager', 'PendingTransaction']
+
+
+class PendingTransaction(object):
+    def __init__(
+        self, nonce: int, tx: dict, on_receipt: typing.Optional[typing.Callable[[dict], None]] = None
+    ):
+        self.nonce = nonce
+        self.tx = tx
+        self.on_receipt = on_receipt
+        # every signed version of the transaction, any of them may be mined
+        self.tx_hashes: typing.List[HexBytes] = []
+        self.sent_at = 0.0
+        self.submitted_at = time.monotonic()
+        self.bumps = 0
+        self.receipt: typing.Optional[dict] = None
+        # set once the transaction is mined (or given up) and its callback has run
+        self.done = False
+        self.error: typing.Optional[str] = None
+
+
+class TransactionManager(object):
+    """
+    Signs and sends transactions of one account on one chain without waiting for receipts.
+    Nonces are assigned locally, receipts are tracked by a background thread with one batched request per poll,
+    transactions not mined within stuck_timeout are re-sent with the same nonce and bumped fees.
+    Callbacks run in the tracking thread; flush waits until the given transactions are mined and raises their errors,
+    so workers sharing an account do not wait for each other's transactions.
+    """
+    logger = logging.getLogger('worker.transactions')
+
+    class TransactionError(Exception):
+        def __init__(self, message: str):
+            super().__init__(message)
+            self.message = message
+
+    def __init__(
+        self, api: web3.Web3, account: eth_account.account.LocalAccount, poll_latency: float = 1.0,
+        stuck_timeout: float = 60.0, gas_bump_percent: int = 15, max_bumps: int = 5,
+        chain_id: typing.Optional[int] = None
+    ):
+        self.api = api
+        self.account = account
+        # metrics label only
+        self.chain_id = chain_id
+        self.poll_latency = poll_latency
+        self.stuck_timeout = stuck_timeout
+        # nodes accept a replacement only if both fees grow by at least 10%
+        self.gas_bump_percent = max(gas_bump_percent, 10)
+        self.max_bumps = max_bumps
+        self._condition = threading.Condition(threading.RLock())
+        self._next_nonce: typing.Optional[int] = None
+        self._pending: typing.Dict[int, PendingTransaction] = {}
+        self._thread: typing.Optional[threading.Thread] = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def _allocate_nonce(self) -> int:
+        if self._next_nonce is None or not self._pending:
+            # re-read while idle, the account may be used outside of the manager
+            self._next_nonce = self.api.eth.get_transaction_count(self.account.address, 'pending')
+        nonce = self._next_nonce
+        self._next_nonce += 1
+        return nonce
+
+    def submit(
+        self, function, options: dict = None, on_receipt: typing.Optional[typing.Callable[[dict], None]] = None
+    ) -> PendingTransaction:
+        """Builds, signs and sends the contract function call, returns as soon as the node accepted it"""
+        with self._condition:
+            nonce = self._allocate_nonce()
+            try:
+                tx = function.build_transaction({**(options or {}), 'from': self.account.address, 'nonce': nonce})
+                pending = PendingTransaction(nonce, tx, on_receipt)
+                self._send(pending)
+            except Exception:
+                # the nonce was not used, later transactions must not leave a gap
+                self._next_nonce = None
+                raise
+            self._pending[nonce] = pending
+            self._start()
+        return pending
+
+    def submit_batch(
+        self, contract: util.ContractWrapper, method_name: str, items: list, options: dict = None,
+        batch_size: int = 50, max_gas: typing.Optional[int] = None,
+        on_revert: typing.Optional[typing.Callable[[typing.Any, Exception], None]] = None,
+        on_included: typing.Optional[typing.Callable[[list, dict], None]] = None,
+        on_submitted: typing.Optional[typing.Callable[[list, HexBytes], None]] = None,
+        submitted: typing.Optional[typing.List[PendingTransaction]] = None
+    ) -> typing.List[PendingTransaction]:
+        """
+        Sends method_name(chunk) for every chunk of ContractWrapper.split_batch, every chunk is sent right away.
+        A chunk reverted on-chain is split and its halves are submitted again if on_revert is set,
+        otherwise the revert is an error of the chunk's transaction. on_submitted gets every sent chunk
+        with its transaction hash, on_included every mined one. The halves are appended to the returned list
+        before their chunk's transaction is done, so flush of the list waits for them too.
+        """
+        submitted = [] if submitted is None else submitted
+        for chunk, gas in contract.split_batch(
+            method_name, items, options, batch_size=batch_size, max_gas=max_gas, on_revert=on_revert
+        ):
+            chunk_options = dict(options or {})
+            if gas is not None:
+                chunk_options.setdefault('gas', gas * 6 // 5)
+
+            def on_receipt(receipt: dict, chunk: list = chunk):
+                if receipt['status'] == 0:
+                    if on_revert is None:
+                        raise self.TransactionError(f'{method_name} of ({len(chunk)}) items reverted on-chain')
+                    if len(chunk) == 1:
+                        on_revert(chunk[0], web3.exceptions.ContractLogicError(f'{method_name} reverted on-chain'))
+                        return
+                    middle = len(chunk) // 2
+                    for half in (chunk[:middle], chunk[middle:]):
+                        self.submit_batch(
+                            contract, method_name, half, options, batch_size=batch_size, max_gas=max_gas,
+                            on_revert=on_revert, on_included=on_included, on_submitted=on_submitted,
+                            submitted=submitted
+                        )
+                    return
+                if on_included is not None:
+                    on_included(chunk, receipt)
+            pending = self.submit(contract.make_tx(method_name, (chunk,)), chunk_options, on_receipt)
+            with self._condition:
+                submitted.append(pending)
+            if on_submitted is not None:
+                on_submitted(chunk, pending.tx_hashes[0])
+        return submitted
+
+    def flush(self, timeout: typing.Optional[float] = None,
+              pending: typing.Optional[typing.List[PendingTransaction]] = None):
+        """
+        Waits until the transactions (all submitted so far by default) are mined and their callbacks have run,
+        raises the errors of these transactions
+        """
+        with self._condition:
+            if pending is None:
+                pending = list(self._pending.values())
+            # the list may grow meanwhile, halves of reverted chunks are added by callbacks
+            if not self._condition.wait_for(lambda: all(item.done for item in pending), timeout):
+                waiting = sum(not item.done for item in pending)
+                raise self.TransactionError(f'{waiting} transactions still pending after {timeout}s')
+            errors = [item.error for item in pending if item.error is not None]
+        if errors:
+            raise self.TransactionError('; '.join(errors))
+
+    def _send(self, pending: PendingTransaction):
+        signed = self.account.sign_transaction(pending.tx)
+        tx_hash = self.api.eth.send_raw_transaction(signed.rawTransaction)
+        pending.tx_hashes.append(HexBytes(tx_hash))
+        pending.sent_at = time.monotonic()
+
+    def _bump(self, pending: PendingTransaction):
+        if pending.bumps >= self.max_bumps:
+            return
+        tx = dict(pending.tx)
+        for field in ('gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas'):
+            if field in tx:
+                tx[field] = math.ceil(tx[field] * (100 + self.gas_bump_percent) / 100)
+        replacement = PendingTransaction(pending.nonce, tx)
+        try:
+            self._send(replacement)
+        except ValueError as e:
+            # mined meanwhile ("nonce too low") or rejected by the pool, the next poll sorts it out
+            self.logger.warning(f'Unable to replace transaction with nonce {pending.nonce}: {e}')
+            pending.sent_at = time.monotonic()
+            return
+        pending.tx = tx
+        pending.tx_hashes.extend(replacement.tx_hashes)
+        pending.sent_at = replacement.sent_at
+        pending.bumps += 1
+        metrics.TX_BUMPS.inc(chain_id=self.chain_id)
+        self.logger.info(f'Transaction with nonce {pending.nonce} stuck, re-sent with {self.gas_bump_percent}% '
+                         f'higher fees as {replacement.tx_hashes[0].hex()}')
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._track, name=f'transactions-{self.account.address}', daemon=True
+            )
+            self._thread.start()
+
+    def _track(self):
+        while True:
+            with self._condition:
+                pending = list(self._pending.values())
+                if not pending:
+                    # cleared under the lock, so the next submit starts a new thread
+                    self._thread = None
+                    return
+            time.sleep(self.poll_latency)
+            try:
+                self._poll(pending)
+            except Exception as e:
+                self.logger.warning(f'Unable to check transaction receipts: {e}')
+
+    def _poll(self, pending: typing.List[PendingTransaction]):
+        batch = util.RPCBatch(self.api)
+        for item in pending:
+            for tx_hash in item.tx_hashes:
+                batch.add_receipt(tx_hash)
+        receipts = iter(batch.execute())
+        confirmed_nonce = None
+        for item in pending:
+            item.receipt = next((receipt for receipt in [next(receipts) for _ in item.tx_hashes] if receipt), None)
+            if item.receipt is not None:
+                self._complete(item)
+                continue
+            if time.monotonic() - item.sent_at < self.stuck_timeout:
+                continue
+            if confirmed_nonce is None:
+                confirmed_nonce = self.api.eth.get_transaction_count(self.account.address, 'latest')
+            if confirmed_nonce > item.nonce:
+                # the nonce was used by a transaction we do not know about, none of ours can be mined anymore
+                self._complete(item, f'nonce {item.nonce} was used by another transaction of {self.account.address}')
+                continue
+            with self._condition:
+                self._bump(item)
+
+    def _complete(self, pending: PendingTransaction, error: typing.Optional[str] = None):
+        if pending.receipt is not None:
+            metrics.TX_RECEIPT_LATENCY.observe(time.monotonic() - pending.submitted_at, chain_id=self.chain_id)
+            metrics.TX_GAS_USED.inc(pending.receipt['gasUsed'], chain_id=self.chain_id)
+            metrics.TX_FEES.inc(
+                pending.receipt['gasUsed'] * pending.receipt.get('effectiveGasPrice', 0), chain_id=self.chain_id
+            )
+        if error is None and pending.on_receipt is not None:
+            try:
+                pending.on_receipt(pending.receipt)
+            except Exception as e:
+                error = f'txHash {pending.receipt["transactionHash"].hex()}: {e}'
+        with self._condition:
+            if error is not None:
+                self.logger.error(error)
+            pending.error = error
+            pending.done = True
+            self._pending.pop(pending.nonce, None)
+            self._condition.notify_all()
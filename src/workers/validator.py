@@ -1,11 +1,12 @@
-import random
-import time
 import typing
 
+import web3
+from eth_utils import event_abi_to_log_topic
 from web3.types import EventData
 
 from .base import Worker
-from src import util
+from .deposit_cache import DepositCache
+from src import metrics, util
 
 
 __all__ = ['Validator']
@@ -27,98 +28,215 @@ class Validator(Worker):
     class ValidatorError(ValidatorException):
         pass
 
+    # final outcomes, a ValidatorDebug (source not mined, not enough confirmations yet) is checked again
+    PREFETCH_EXCEPTIONS = (ValidatorError, ValidatorInfo)
+
+    @classmethod
+    def receipt_deposits(cls, source_bridge, receipt: dict) -> typing.List[dict]:
+        """Arguments of the Deposit events emitted by the source bridge (sync or async wrapper) in the receipt"""
+        deposit_event = source_bridge.contract.events.Deposit()
+        topic = web3.Web3.to_hex(event_abi_to_log_topic(deposit_event.abi))
+        return [
+            dict(deposit_event.process_log(log)['args'])
+            for log in receipt['logs']
+            if log['address'] == source_bridge.address and log['topics']
+            and web3.Web3.to_hex(log['topics'][0]) == topic
+        ]
+
+    @classmethod
+    def match_deposit(
+        cls, deposits: typing.List[dict], chain_id: int, listed_receiver: str, listed_amount: int, tx_hash: str,
+        source_chain_id: int
+    ) -> dict:
+        """The deposit of the source transaction matching the listed data, a transaction may contain several"""
+        deposits = [deposit for deposit in deposits if deposit['targetChainId'] == chain_id]
+        if not deposits:
+            raise cls.ValidatorError(f'txHash {tx_hash}: Source transaction from chainId '
+                                      f'{source_chain_id} contains no deposit to target chainId')
+
+        deposits = [deposit for deposit in deposits if deposit['receiver'] == listed_receiver]
+        if not deposits:
+            raise cls.ValidatorError(f'txHash {tx_hash}: Wrong receiver on target chain')
+
+        deposits = [deposit for deposit in deposits if deposit['amount'] == listed_amount]
+        if not deposits:
+            raise cls.ValidatorError(f'txHash {tx_hash}: Wrong amount on target chain')
+        return deposits[0]
+
+    def get_deposits(self, source_bridge: util.ContractWrapper, source_chain_id: int, tx_hash: str) -> tuple:
+        """
+        Backlink of the source bridge and the Deposit events the source bridge emitted in the transaction,
+        read from its receipt: deposits made through routers or multisigs are found as well as direct ones.
+        Cached deposits only cost the hash of their block in the batch reading the backlink,
+        the receipt is fetched again when the block is not canonical anymore.
+        """
+        batch = self.rpc_batch(source_bridge.api, source_chain_id).add_call(source_bridge, 'links', (self.chain_id,))
+        cached = self.deposit_cache.lookup(source_chain_id, tx_hash)
+        if cached is not None:
+            backlink_address, block_hash = batch.add_block_hash(cached.block_number).execute()
+            deposits = self.cached_deposits(source_chain_id, tx_hash, cached, block_hash)
+            if deposits is not None:
+                return backlink_address, deposits
+            receipt = self.rpc_batch(source_bridge.api, source_chain_id).add_receipt(tx_hash).execute()[0]
+        else:
+            metrics.CACHE_REQUESTS.inc(cache='deposits', result='miss')
+            backlink_address, receipt = batch.add_receipt(tx_hash).execute()
+        return backlink_address, self.store_deposits(source_bridge, source_chain_id, tx_hash, receipt)
+
+    def cached_deposits(
+        self, source_chain_id: int, tx_hash: str, cached: DepositCache.Entry, block_hash: typing.Optional[bytes]
+    ) -> typing.Optional[typing.List[dict]]:
+        """Deposits of the cache entry while its block is canonical, else None and the entry is dropped"""
+        if block_hash == cached.block_hash:
+            metrics.CACHE_REQUESTS.inc(cache='deposits', result='hit')
+            return cached.deposits
+        self.deposit_cache.discard(source_chain_id, tx_hash, cached.block_hash)
+        metrics.CACHE_REQUESTS.inc(cache='deposits', result='miss')
+        return None
+
+    def store_deposits(
+        self, source_bridge, source_chain_id: int, tx_hash: str, receipt: typing.Optional[dict]
+    ) -> typing.List[dict]:
+        """Deposits of the source transaction receipt (sync or async bridge wrapper), cached for the next lookups"""
+        if receipt is None:
+            raise self.ValidatorDebug(f'txHash {tx_hash}: Source transaction is not mined')
+
+        deposits = self.receipt_deposits(source_bridge, receipt)
+        self.deposit_cache.store(source_chain_id, tx_hash, receipt['blockNumber'], receipt['blockHash'], deposits)
+        return deposits
+
     def validate_event(self, event: EventData):
         listed_event = event['args']
         tx_hash = listed_event['txHash'].hex()
+        self.check_source_chain(event)
+
+        # check link to sourceChainId, listed data is read in the same round-trip
+        source_bridge_address, listed = self.rpc_batch(self.api, self.chain_id).add_call(
+            self.bridge, 'links', (listed_event['sourceChainId'],)
+        ).add_call(
+            self.bridge, 'confirmations', (listed_event['txHash'],)
+        ).execute()
+        self.check_source_link(event, source_bridge_address)
+
+        # check backlink from sourceChainId and get the deposits from other network
+        source_bridge = self.get_chain_bridge(listed_event['sourceChainId'], source_bridge_address)
+        backlink_address, deposits = self.get_deposits(source_bridge, listed_event['sourceChainId'], tx_hash)
+        deposit = self.check_deposit(event, listed, backlink_address, deposits)
+
+        # Check that registered asset matches the listed and mapped correctly
+        has_pair, source_asset = self.rpc_batch(source_bridge.api, listed_event['sourceChainId']).add_call(
+            source_bridge, 'hasPair', (deposit['token'], self.chain_id)
+        ).add_call(
+            source_bridge, 'getDestinationAddress', (deposit['token'], self.chain_id)
+        ).execute()
+        _, _, listed_token_id, _ = listed
+        target_asset = self.call_cached(self.chain_id, self.bridge, 'tokens', (listed_token_id - 1,))
+        self.check_asset(event, has_pair, source_asset, target_asset)
+        return listed_event['txHash']
+
+    def check_source_chain(self, event: EventData):
+        listed_event = event['args']
         if listed_event['sourceChainId'] not in self.config.rpc_urls:
-            raise self.ValidatorDebug(f'Unable to validate txHash {tx_hash}, '
+            raise self.ValidatorDebug(f'Unable to validate txHash {listed_event["txHash"].hex()}, '
                                       f'network with chainId {listed_event["sourceChainId"]} unreachable')
 
-        # check link to sourceChainId
-        source_bridge_address = self.bridge.call_method('links', (listed_event['sourceChainId'],))
+    def check_source_link(self, event: EventData, source_bridge_address: str):
+        listed_event = event['args']
         if source_bridge_address == util.ADDRESS_0:
-            raise self.ValidatorError(f'txHash {tx_hash}: '
+            raise self.ValidatorError(f'txHash {listed_event["txHash"].hex()}: '
                                       f'Bridge is not linked with chainId {listed_event["sourceChainId"]}')
 
-        # check backlink from sourceChainId
-        source_api = self.construct_http_api(random.choice(self.config.rpc_urls[listed_event['sourceChainId']]))
-        source_bridge = self.get_bridge_contract(
-            source_api, source_bridge_address, poll_latency=self.config.poll_latency
-        )
-        backlink_address = source_bridge.call_method('links', (self.chain_id,))
+    def check_deposit(
+        self, event: EventData, listed: tuple, backlink_address: str, deposits: typing.List[dict]
+    ) -> dict:
+        """The deposit of the source transaction matching the listed data once the backlink is checked"""
+        listed_event = event['args']
+        tx_hash = listed_event['txHash'].hex()
+        listed_receiver, listed_amount, listed_token_id, is_sent = listed
         if backlink_address != self.bridge.contract.address:
             raise self.ValidatorError(f'txHash {tx_hash}: Bridge for chainId '
                                       f'{listed_event["sourceChainId"]} not linked with target bridge')
 
-        # Get the transaction from other network and check listed
-        source_tx = source_api.eth.get_transaction(tx_hash)
-        _, decoded_input = source_bridge.contract.decode_function_input(source_tx['input'])
-        listed_receiver, listed_amount, listed_token_id, is_sent = self.bridge.call_method(
-            'confirmations', (listed_event['txHash'],)
+        deposit = self.match_deposit(
+            deposits, self.chain_id, listed_receiver, listed_amount, tx_hash, listed_event['sourceChainId']
         )
 
-        if decoded_input['_targetChainId'] != self.chain_id:
-            raise self.ValidatorError(f'txHash {tx_hash}: Source transaction from chainId '
-                                      f'{listed_event["sourceChainId"]} contains wrong target chainId')
-
-        if decoded_input['_receiver'] != listed_receiver:
-            raise self.ValidatorError(f'txHash {tx_hash}: Wrong receiver on target chain')
-
-        if decoded_input['_amount'] != listed_amount:
-            raise self.ValidatorError(f'txHash {tx_hash}: Wrong amount on target chain')
-
         if is_sent:
             raise self.ValidatorInfo(f'txHash {tx_hash}: Tokens already sent, nothing to validate')
+        return deposit
 
-        # Check that registered asset matches the listed
-        if not source_bridge.call_method('hasPair', (decoded_input['_token'], self.chain_id)):
+    def check_asset(self, event: EventData, has_pair: bool, source_asset: str, target_asset: str):
+        tx_hash = event['args']['txHash'].hex()
+        if not has_pair:
             raise self.ValidatorError(f'txHash {tx_hash}: Source asset has not pair on target chain')
 
-        # check that asset mapped correctly
-        source_asset = source_bridge.call_method('getDestinationAddress', (decoded_input['_token'], self.chain_id))
-        target_asset = self.bridge.call_method('tokens', (listed_token_id - 1,))
         if source_asset != target_asset:
-            self.ValidatorError(f'txHash {tx_hash}: Source asset {source_asset} != {target_asset} on target chain')
-        return listed_event['txHash']
-
-    def confirm(self, tx_hash: str):
-        # Confirm the transaction onchain
-        # TODO: may fails if tokens already sent, need to handle this type of error
+            raise self.ValidatorError(
+                f'txHash {tx_hash}: Source asset {source_asset} != {target_asset} on target chain'
+            )
+
+    def confirm(
+        self, tx_hashes: typing.List[bytes], on_submitted: typing.Optional[typing.Callable[[list, bytes], None]] = None
+    ) -> typing.List[bytes]:
+        # Confirm the transactions onchain, reverting batches are bisected down to the offending txHash
         if self.debug:
             self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                          f'DEBUG: validator should approve txHash {tx_hash} in block #{self.api.eth.block_number}')
-            return
-        tx = self.bridge.execute_tx('confirm', ([tx_hash],), {'from': self.account.address})
-        self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
-                      f'validator approved txHash {tx_hash} in block #{tx["blockNumber"]}')
+                          f'DEBUG: validator should approve ({len(tx_hashes)}) txHashes '
+                          f'in block #{self.api.eth.block_number}')
+            return []
+        confirmed = []
+        for chunk, tx in self.submit_batch_tx(
+            self.chain_id, self.bridge, 'confirm', tx_hashes, on_revert=self.on_confirm_revert,
+            on_submitted=on_submitted
+        ):
+            self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
+                          f'validator approved ({len(chunk)}) txHashes in block #{tx["blockNumber"]}')
+            confirmed.extend(chunk)
+        return confirmed
+
+    def on_confirm_revert(self, tx_hash: bytes, error: Exception):
+        self.log.error(f'txHash {tx_hash.hex()}: confirmation rejected by bridge: {error}')
 
     def validate(self, from_block_number: int, to_block_number: typing.Optional[int] = None):
         # We get Listed event for validators on network
-        events = self.bridge.contract.events.Listed.get_logs(fromBlock=from_block_number, toBlock=to_block_number)
+        events = self.unprocessed(
+            self.get_events(self.bridge.contract.events.Listed, from_block_number, to_block_number)
+        )
         if events:
             self.log.info(f'[worker.{self.__class__.__name__.lower()}.{self.name}] '
                           f'Got ({len(events)}) listed events from signer '
                           f'in blocks #{from_block_number}-#{to_block_number}')
+        # txHash -> Listed event
+        listed = {}
         for event in events:
             try:
-                tx_hash = self.validate_event(event)
+                tx_hash = self.prefetched(event, self.validate_event)
             except self.ValidatorError as e:
                 self.log.error(e.message)
+                self.record_outcome(event, f'error: {e.message}')
                 continue
             except self.ValidatorInfo as e:
                 self.log.info(e.message)
+                self.record_outcome(event, f'skipped: {e.message}')
                 continue
             except self.ValidatorDebug as e:
                 self.log.debug(e.message)
+                self.record_outcome(event, f'skipped: {e.message}')
                 continue
 
-            self.confirm(tx_hash)
+            listed[tx_hash] = event
+
+        if listed:
+            confirmed = set(self.confirm(list(listed), on_submitted=lambda chunk, tx_hash: self.record_submitted(
+                [listed[item] for item in chunk], self.chain_id, tx_hash, 'confirmed'
+            )))
+            for tx_hash, event in listed.items():
+                self.record_outcome(event, 'confirmed' if tx_hash in confirmed else 'rejected')
+            # confirmations are on-chain, a restart must not send them again
+            self.checkpoints.flush()
+
+    def prefetch_handlers(self):
+        return {'Listed': self.validate_event}
 
-    def listen_blocks(self, last_block: int = 0) -> int:
-        current_block = self.api.eth.block_number - self.config.eth_block_confirmations
-        while last_block >= current_block:
-            time.sleep(self.config.poll_latency)
-            current_block = self.api.eth.block_number - self.config.eth_block_confirmations
-        to_block = min(last_block + 10, current_block)
-        self.validate(from_block_number=last_block, to_block_number=to_block)
-        return to_block
+    def process_blocks(self, from_block_number: int, to_block_number: int):
+        self.validate(from_block_number=from_block_number, to_block_number=to_block_number)
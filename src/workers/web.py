@@ -1,57 +1,49 @@
-import random
-import time
-import typing
+from web3.types import EventData
 
 from .base import Worker
 
-from src.models import Transfer
+from src.models import TransferWriter, init_db
 
 
 __all__ = ['WebScanner']
 
 
 class WebScanner(Worker):
+    def __init__(self, *args, **kwargs):
+        init_db()
+        super().__init__(*args, **kwargs)
+        # changes of a block window, written when the window is processed
+        self.transfers = TransferWriter(self.chain_id)
+
     def find_deposit_block_id(self, chain_id: int, tx_hash):
         if chain_id not in self.config.rpc_urls:
             raise ValueError(f'No route to chainId {chain_id}')
-        source_api = self.construct_http_api(random.choice(self.config.rpc_urls[chain_id]))
-        source_tx = source_api.eth.get_transaction(tx_hash)
+        source_tx = self.get_chain_api(chain_id).eth.get_transaction(tx_hash)
         if source_tx is None:
             raise ValueError(f'No transaction with txHash {tx_hash}')
         return source_tx['blockNumber']
 
-    def listen_listed(self, from_block_number: int, to_block_number: typing.Optional[int] = None):
-        events = self.bridge.contract.events.Listed.get_logs(fromBlock=from_block_number, toBlock=to_block_number)
-        for event in events:
-            listed_event = event['args']
-            transfer = Transfer.get_or_create(listed_event['txHash'].hex())
-            transfer.sender_chain_id = listed_event['sourceChainId']
-            transfer.listed_event_block_id = event['blockNumber']
-            try:
-                transfer.deposit_event_block_id = self.find_deposit_block_id(
-                    transfer.sender_chain_id, listed_event['txHash']
-                )
-            except Exception as e:
-                self.log.warning(
-                    f'Unable to get deposit event for '
-                    f'chainId={transfer.sender_chain_id} and txHash={transfer.tx_hash}: {str(e)}'
-                )
-            transfer.save()
-
-    def listen_confirmations(self, from_block_number: int, to_block_number: typing.Optional[int] = None):
-        events = self.bridge.contract.events.Confirmed.get_logs(fromBlock=from_block_number, toBlock=to_block_number)
-        for event in events:
-            confirmed_event = event['args']
-            transfer = Transfer.get_or_create(confirmed_event['txHash'].hex())
-            transfer.validator_confirmations = len(self.bridge.call_method('confirmedBy', (confirmed_event['txHash'],)))
-            transfer.save()
-
-    def listen_blocks(self, last_block: int = 0) -> int:
-        current_block = self.api.eth.block_number - self.config.eth_block_confirmations
-        while last_block >= current_block:
-            time.sleep(self.config.poll_latency)
-            current_block = self.api.eth.block_number - self.config.eth_block_confirmations
-        to_block = min(last_block + 10, current_block)
-        self.listen_listed(from_block_number=last_block, to_block_number=to_block)
-        self.listen_confirmations(from_block_number=last_block, to_block_number=to_block)
-        return to_block
+    def handle_listed(self, event: EventData):
+        listed_event = event['args']
+        tx_hash = listed_event['txHash'].hex()
+        deposit_block_id = 0
+        try:
+            deposit_block_id = self.find_deposit_block_id(listed_event['sourceChainId'], listed_event['txHash'])
+        except Exception as e:
+            self.log.warning(
+                f'Unable to get deposit event for '
+                f'chainId={listed_event["sourceChainId"]} and txHash={tx_hash}: {str(e)}'
+            )
+        self.transfers.listed(tx_hash, listed_event['sourceChainId'], event['blockNumber'], deposit_block_id)
+
+    def handle_confirmed(self, event: EventData):
+        # the validator is in the event, no state read needed
+        confirmed_event = event['args']
+        self.transfers.confirmed(confirmed_event['txHash'].hex(), confirmed_event['validatorId'], event['blockNumber'])
+
+    def process_blocks(self, from_block_number: int, to_block_number: int):
+        handlers = {'Listed': self.handle_listed, 'Confirmed': self.handle_confirmed}
+        # both event types come from one log scan and are handled in chain order
+        for event in self.get_bridge_events(tuple(handlers), from_block_number, to_block_number):
+            handlers[event['event']](event)
+        self.transfers.flush()
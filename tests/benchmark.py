@@ -0,0 +1,255 @@
+"""
+Throughput of the lister, validator and transactor on two in-process chains (eth-tester), no nodes needed.
+
+    python -m tests.benchmark --deposits 200 --latency-ms 20
+
+BridgeLinked and the test token are deployed from the tests/data compile cache, DEPOSITS deposits are made on the
+source chain and every role processes the blocks produced by the previous one. Every JSON-RPC round-trip to a fake
+chain is delayed by LATENCY_MS, a batch is one round-trip like on a real node. Reported per role: events per second,
+round-trips and JSON-RPC requests per event and gas used per event.
+"""
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import typing
+
+import web3
+from web3.providers.eth_tester import EthereumTesterProvider
+from web3.providers.eth_tester.defaults import API_ENDPOINTS, static_return
+from eth_tester import EthereumTester, PyEVMBackend
+
+from src.util import ContractHelper, ContractWrapper
+from src.workers import Signer, Validator, WorkerConfig
+from src.workers.base import Worker
+from tests.util import get_contract_cache
+
+
+__all__ = ['FakeChainProvider', 'FakeChain', 'Benchmark']
+
+
+ONE_TOKEN = 10 ** 18
+
+
+class FakeChainProvider(EthereumTesterProvider):
+    """
+    eth-tester provider with its own chain id and a fixed delay per round-trip,
+    counts round-trips and requests (requests of a batch are counted, the batch is one round-trip)
+    """
+    def __init__(self, chain_id: int, latency: float = 0.0):
+        backend = PyEVMBackend()
+        # signed transactions are checked against the chain id of the chain
+        backend.chain.chain_id = chain_id
+        api_endpoints = {**API_ENDPOINTS, 'eth': {**API_ENDPOINTS['eth'], 'chainId': static_return(chain_id)}}
+        super().__init__(EthereumTester(backend), api_endpoints=api_endpoints)
+        self.latency = latency
+        self.round_trips = 0
+        self.requests = 0
+        self.api: typing.Optional[web3.Web3] = None
+        # eth-tester is not thread safe, the transaction managers poll receipts from their own threads
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def make_request(self, method, params):
+        with self._lock:
+            if not getattr(self._local, 'in_batch', False):
+                self.round_trips += 1
+                time.sleep(self.latency)
+            self.requests += 1
+            return super().make_request(method, params)
+
+    def make_batch_request(self, requests: typing.List[typing.Tuple[str, list]]) -> typing.List[dict]:
+        """See util.make_batch_request, requests still pass the middlewares of the api"""
+        with self._lock:
+            self.round_trips += 1
+            time.sleep(self.latency)
+            self._local.in_batch = True
+            try:
+                return [self.api.manager._make_request(method, params) for method, params in requests]
+            finally:
+                self._local.in_batch = False
+
+    def counters(self) -> typing.Tuple[int, int]:
+        with self._lock:
+            return self.round_trips, self.requests
+
+
+class FakeChain(object):
+    """A FakeChainProvider registered in Worker.pool, workers reach it through config urls like a node"""
+    _ids = itertools.count()
+
+    def __init__(self, chain_id: int, latency: float = 0.0):
+        self.chain_id = chain_id
+        self.provider = FakeChainProvider(chain_id, latency)
+        self.api = web3.Web3(self.provider)
+        self.provider.api = self.api
+        # unique per chain, pooled objects of earlier chains with the same id are not reused
+        self.url = f'fake://{chain_id}/{next(self._ids)}'
+        Worker.pool.get_or_create(('api', (self.url,)), lambda: self.api)
+        Worker.pool.get_or_create(('api', chain_id, (self.url,)), lambda: self.api)
+
+    def account(self, index: int):
+        """Funded account of eth-tester, the same on every fake chain"""
+        return self.api.eth.account.from_key(self.provider.ethereum_tester.backend.account_keys[index])
+
+    def gas_used(self, from_block: int, to_block: int) -> int:
+        return sum(self.api.eth.get_block(number)['gasUsed'] for number in range(from_block, to_block + 1))
+
+
+class Benchmark(object):
+    SOURCE_CHAIN_ID = 1001
+    TARGET_CHAIN_ID = 1002
+    SOLC_VERSION = '0.8.24'
+
+    def __init__(self, deposits: int = 100, latency: float = 0.0, poll_latency: float = 0.1, batch_size: int = 50):
+        self.deposits = deposits
+        self.poll_latency = poll_latency
+        self.batch_size = batch_size
+        self.source = FakeChain(self.SOURCE_CHAIN_ID, latency)
+        self.target = FakeChain(self.TARGET_CHAIN_ID, latency)
+        self.chains = (self.source, self.target)
+        self.deployer, self.signer, self.validator, self.user = (self.source.account(index) for index in range(4))
+        self.receiver = self.target.api.eth.account.create()
+        self.data_dir = tempfile.mkdtemp(prefix='bridge-benchmark-')
+
+    def deploy(self, chain: FakeChain, code: dict, constructor_args: tuple) -> ContractWrapper:
+        deployed = ContractHelper.deploy_by_bytecode(
+            chain.api, self.deployer, constructor_args, abi=code['abi'], bytecode=code['bin']
+        )
+        return ContractWrapper(chain.api, deployed['address'], deployed['abi'], poll_latency=self.poll_latency)
+
+    def deploy_bridge(self, chain: FakeChain, code: dict, token: ContractWrapper) -> ContractWrapper:
+        bridge = self.deploy(chain, code, (self.deployer.address,))
+        options = {'from': self.deployer.address}
+        bridge.execute_tx('setSigner', (self.signer.address,), options)
+        bridge.execute_tx('addValidators', ([self.validator.address],), options)
+        bridge.execute_tx('setRequiredConfirmations', (1,), options)
+        bridge.execute_tx('registerTokens', ([token.contract.address],), options)
+        return bridge
+
+    def setup(self):
+        cached = get_contract_cache(self.SOLC_VERSION)
+        supply = self.deposits + 1_000
+        self.source_token = self.deploy(
+            self.source, cached['erc20'], ('Source BAX', 'SBAX', 18, self.deployer.address, supply)
+        )
+        self.target_token = self.deploy(
+            self.target, cached['erc20'], ('Target BAX', 'TBAX', 18, self.deployer.address, supply)
+        )
+        self.source_bridge = self.deploy_bridge(self.source, cached['bridge_linked'], self.source_token)
+        self.target_bridge = self.deploy_bridge(self.target, cached['bridge_linked'], self.target_token)
+        options = {'from': self.deployer.address}
+        self.source_bridge.execute_tx('addLink', (self.TARGET_CHAIN_ID, self.target_bridge.contract.address), options)
+        self.target_bridge.execute_tx('addLink', (self.SOURCE_CHAIN_ID, self.source_bridge.contract.address), options)
+        self.source_bridge.execute_tx(
+            'addPair', (self.source_token.contract.address, self.TARGET_CHAIN_ID, self.target_token.contract.address),
+            options
+        )
+
+        # the user's tokens and the target bridge's funds
+        amount = self.deposits * ONE_TOKEN
+        self.source_token.execute_tx('approve', (self.deployer.address, amount), options)
+        self.source_token.execute_tx('transferFrom', (self.deployer.address, self.user.address, amount), options)
+        self.source_token.execute_tx(
+            'approve', (self.source_bridge.contract.address, amount), {'from': self.user.address}
+        )
+        self.target_token.execute_tx('approve', (self.target_bridge.contract.address, amount), options)
+        self.target_bridge.execute_tx('addFunds', (self.target_token.contract.address, amount), options)
+
+    def make_deposits(self) -> int:
+        """Returns the block of the first deposit"""
+        first_block = self.source.api.eth.block_number + 1
+        for _ in range(self.deposits):
+            self.source_bridge.execute_tx(
+                'deposit', (self.receiver.address, self.source_token.contract.address, ONE_TOKEN, self.TARGET_CHAIN_ID),
+                {'from': self.user.address}
+            )
+        return first_block
+
+    def worker_config(self, chain: FakeChain, bridge: ContractWrapper, private_key) -> WorkerConfig:
+        config = WorkerConfig()
+        config.eth_rpc = chain.url
+        config.eth_contract_address = bridge.contract.address
+        config.eth_private_key = private_key
+        config._rpc_urls = {other.chain_id: [other.url] for other in self.chains}
+        config._poll_latency = int(self.poll_latency * 1_000)
+        config.tx_batch_size = self.batch_size
+        config.checkpoint_db_path = os.path.join(self.data_dir, 'checkpoints.sqlite')
+        config.deposit_cache_path = os.path.join(self.data_dir, 'deposits.sqlite')
+        return config
+
+    def measure(self, role: str, worker: Worker, event_name: str, from_block: int) -> dict:
+        """Runs process_blocks of the worker from from_block to the head of its chain"""
+        to_block = worker.api.eth.block_number
+        heads = [chain.api.eth.block_number for chain in self.chains]
+        counters = [chain.provider.counters() for chain in self.chains]
+        started = time.monotonic()
+        worker.process_blocks(from_block, to_block)
+        elapsed = time.monotonic() - started
+        round_trips, requests = (
+            sum(after[index] - before[index] for after, before in zip(
+                (chain.provider.counters() for chain in self.chains), counters
+            )) for index in (0, 1)
+        )
+        gas = sum(chain.gas_used(head + 1, chain.api.eth.block_number) for chain, head in zip(self.chains, heads))
+        event_type = getattr(worker.bridge.contract.events, event_name)
+        events = len(event_type.get_logs(fromBlock=from_block, toBlock=to_block))
+        per_event = max(events, 1)
+        return {
+            'role': role, 'events': events, 'seconds': round(elapsed, 3),
+            'events_per_second': round(events / elapsed, 2) if elapsed else None,
+            'round_trips_per_event': round(round_trips / per_event, 2),
+            'requests_per_event': round(requests / per_event, 2),
+            'gas_per_event': gas // per_event,
+        }
+
+    def run(self) -> typing.List[dict]:
+        self.setup()
+        first_deposit_block = self.make_deposits()
+        results = []
+
+        lister = Signer(self.worker_config(self.source, self.source_bridge, self.signer.key), name=Signer.TYPE_LISTER)
+        listed_from = self.target.api.eth.block_number + 1
+        results.append(self.measure('lister', lister, 'Deposit', first_deposit_block))
+
+        validator = Validator(self.worker_config(self.target, self.target_bridge, self.validator.key))
+        confirmed_from = self.target.api.eth.block_number + 1
+        results.append(self.measure('validator', validator, 'Listed', listed_from))
+
+        transactor = Signer(
+            self.worker_config(self.target, self.target_bridge, self.signer.key), name=Signer.TYPE_TRANSACTOR
+        )
+        results.append(self.measure('transactor', transactor, 'Confirmed', confirmed_from))
+        return results
+
+
+def format_results(results: typing.List[dict]) -> str:
+    columns = ('role', 'events', 'seconds', 'events_per_second', 'round_trips_per_event', 'requests_per_event',
+               'gas_per_event')
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    lines = ['  '.join(column.rjust(width) for column, width in zip(columns, widths))]
+    for result in results:
+        lines.append('  '.join(str(result[column]).rjust(width) for column, width in zip(columns, widths)))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker throughput on in-process chains')
+    parser.add_argument('--deposits', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='delay of every JSON-RPC round-trip')
+    parser.add_argument('--poll-latency-ms', type=float, default=100.0, help='receipt polling interval')
+    parser.add_argument('--batch-size', type=int, default=50, help='items per list/confirm/transfer transaction')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    results = Benchmark(
+        deposits=args.deposits, latency=args.latency_ms / 1_000, poll_latency=args.poll_latency_ms / 1_000,
+        batch_size=args.batch_size
+    ).run()
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
+
+
+if __name__ == '__main__':
+    main()
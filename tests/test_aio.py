@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import threading
+import types
+import unittest
+
+import web3.exceptions
+from hexbytes import HexBytes
+
+from src.models import Transfer, TransferConfirmation, TransferWriter, init_db
+from src.workers.aio import AsyncValidator, AsyncWebScanner
+from src.workers.base import ChainPool
+from src.workers.deposit_cache import CachedDeposit
+from tests.test_deposit_cache import CACHE_PATH
+from tests.test_signer import Outcomes, make_event
+
+
+class AsyncWebScannerTestCase(unittest.TestCase):
+    def setUp(self):
+        init_db('sqlite:///:memory:')
+        Transfer.delete().execute()
+        TransferConfirmation.delete().execute()
+        self.scanner = AsyncWebScanner.__new__(AsyncWebScanner)
+        self.scanner.chain_id = 1
+        self.scanner.semaphore = asyncio.Semaphore(4)
+        self.scanner.log = logging.getLogger('worker.test')
+
+    def test_window_written_off_the_event_loop(self):
+        tx_hash = HexBytes(b'\xab' * 32)
+        events = [
+            make_event('Listed', 1, 0, txHash=tx_hash, sourceChainId=5),
+            make_event('Confirmed', 2, 1, txHash=tx_hash, validatorId=3),
+        ]
+
+        async def get_bridge_events(event_names, from_block_number, to_block_number):
+            return events
+
+        async def find_deposit_block_id(chain_id, tx_hash):
+            return 7
+        self.scanner.get_bridge_events = get_bridge_events
+        self.scanner.find_deposit_block_id = find_deposit_block_id
+        flushed = []
+        flush = TransferWriter.flush
+        # an in-memory database is per connection, the writer is flushed again from the test thread
+        TransferWriter.flush = lambda writer: flushed.append((writer, threading.current_thread()))
+        try:
+            asyncio.run(self.scanner.process_blocks(10, 10))
+        finally:
+            TransferWriter.flush = flush
+        (writer, thread), = flushed
+        self.assertIsNot(thread, threading.main_thread())
+        writer.flush()
+        transfer = Transfer.get(Transfer._tx_hash == 'ab' * 32)
+        self.assertEqual((transfer.sender_chain_id, transfer.deposit_event_block_id), (5, 7))
+        self.assertEqual(transfer.validator_confirmations, 1)
+
+
+class AsyncValidatorTestCase(unittest.TestCase):
+    def test_outcomes_recorded_and_skipped_after_restart(self):
+        validator = AsyncValidator.__new__(AsyncValidator)
+        validator.name = 'validator'
+        validator.debug = False
+        validator.log = logging.getLogger('worker.test')
+        validator.semaphore = asyncio.Semaphore(4)
+        validator.chain_id = 1
+        validator._checkpoints = outcomes = Outcomes()
+        events = [make_event('Listed', index, index, txHash=HexBytes(bytes([index]) * 32)) for index in range(3)]
+
+        async def get_events(event_type, from_block_number, to_block_number):
+            return events
+
+        async def validate_event(event):
+            if event is events[1]:
+                raise validator.ValidatorError('not linked')
+            return event['args']['txHash']
+        confirmed = []
+
+        async def confirm(tx_hashes, on_submitted=None):
+            confirmed.append(tx_hashes)
+            on_submitted(tx_hashes, HexBytes(b'\xcc' * 32))
+            # the bridge rejects the last one
+            return tx_hashes[:1]
+        validator.get_events = get_events
+        validator.validate_event = validate_event
+        validator.confirm = confirm
+        validator.bridge = types.SimpleNamespace(
+            contract=types.SimpleNamespace(events=types.SimpleNamespace(Listed=None))
+        )
+        asyncio.run(validator.validate(10, 10))
+        self.assertEqual(
+            [outcomes.last(event) for event in events], ['confirmed', 'error: not linked', 'rejected']
+        )
+        # sent transactions are recorded before waiting for them to be mined
+        self.assertIn((events[2], f'submitted 1 0x{"cc" * 32} confirmed'), outcomes.records)
+        asyncio.run(validator.validate(10, 10))
+        self.assertEqual(len(confirmed), 1)
+
+
+    def test_deposits_served_from_cache_while_block_is_canonical(self):
+        validator = AsyncValidator.__new__(AsyncValidator)
+        validator.chain_id = 5
+        validator.pool = ChainPool()
+        validator.config = types.SimpleNamespace(deposit_cache_path=CACHE_PATH, deposit_cache_size=10)
+        cache = validator.deposit_cache
+        CachedDeposit.delete().execute()
+        deposits = [{'receiver': '0x' + '11' * 20, 'token': '0x' + '22' * 20, 'amount': 10, 'targetChainId': 5}]
+        tx_hash = '0x' + 'ab' * 32
+        cache.store(1, tx_hash, 7, b'\x01' * 32, deposits)
+        requests = []
+
+        async def get_block(block_number):
+            requests.append(('block', block_number))
+            return {'hash': HexBytes(block_hash)}
+
+        async def get_transaction_receipt(tx_hash):
+            requests.append(('receipt', tx_hash))
+            raise web3.exceptions.TransactionNotFound(tx_hash)
+
+        async def call_method(method_name, arguments=()):
+            return '0x' + '33' * 20
+        source_bridge = types.SimpleNamespace(
+            call_method=call_method,
+            api=types.SimpleNamespace(eth=types.SimpleNamespace(
+                get_block=get_block, get_transaction_receipt=get_transaction_receipt
+            ))
+        )
+        block_hash = b'\x01' * 32
+        self.assertEqual(
+            asyncio.run(validator.get_deposits(source_bridge, 1, tx_hash)), ('0x' + '33' * 20, deposits)
+        )
+        self.assertEqual(requests, [('block', 7)])
+        # after a reorg the receipt is fetched again, the transaction is not mined anymore
+        block_hash = b'\x02' * 32
+        with self.assertRaises(validator.ValidatorDebug):
+            asyncio.run(validator.get_deposits(source_bridge, 1, tx_hash))
+        self.assertEqual(requests[1:], [('block', 7), ('receipt', tx_hash)])
+        self.assertIsNone(cache.lookup(1, tx_hash))
+
+
+if __name__ == '__main__':
+    unittest.main()
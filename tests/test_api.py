@@ -0,0 +1,103 @@
+import json
+import threading
+import unittest
+
+from src.api import ApiConfig, TransferAPI
+from src.models import Transfer, init_db
+
+
+class TransferAPITestCase(unittest.TestCase):
+    def setUp(self):
+        init_db('sqlite:///:memory:')
+        Transfer.delete().execute()
+        Transfer.upsert_many([
+            {
+                '_tx_hash': f'{index:064x}', 'sender_chain_id': 1284 if index % 2 else 1, 'receiver_chain_id': 5,
+                'listed_event_block_id': 100 + index // 3, 'deposit_event_block_id': 0, 'validator_confirmations': 1
+            }
+            for index in range(20)
+        ])
+        config = ApiConfig()
+        config.api_cache_ttl = 60
+        self.api = TransferAPI(config)
+
+    def get(self, path: str, if_none_match: str = None):
+        status, headers, body = self.api.respond(path, if_none_match)
+        return status, headers, json.loads(body) if body else None
+
+    def test_lookup_by_hash(self):
+        status, _, transfer = self.get(f'/transfers/0x{3:064x}')
+        self.assertEqual(status, 200)
+        self.assertEqual((transfer['sender_chain_id'], transfer['listed_event_block_id']), (1284, 101))
+        self.assertEqual(self.get(f'/transfers/{99:064x}')[0], 404)
+        self.assertEqual(self.get('/transfers/0x12')[0], 400)
+
+    def test_keyset_pagination(self):
+        seen = []
+        path = '/transfers?sender_chain_id=1284&receiver_chain_id=5&limit=3'
+        while path:
+            status, _, page = self.get(path)
+            self.assertEqual(status, 200)
+            seen.extend(page['items'])
+            path = page['next'] and f'/transfers?sender_chain_id=1284&limit=3&cursor={page["next"]}'
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len({item['tx_hash'] for item in seen}), 10)
+        keys = [item['listed_event_block_id'] for item in seen]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_listing_requires_chain(self):
+        self.assertEqual(self.get('/transfers')[0], 400)
+        self.assertEqual(self.get('/transfers?sender_chain_id=1&cursor=bad')[0], 400)
+
+    def test_etag_and_cache(self):
+        path = f'/transfers/{3:064x}'
+        status, headers, _ = self.get(path)
+        Transfer.update(validator_confirmations=2).execute()
+        # cached until the ttl expires
+        self.assertEqual(self.get(path)[2]['validator_confirmations'], 1)
+        self.assertEqual(self.get(path, headers['ETag'])[0], 304)
+
+    def test_concurrent_misses_computed_once(self):
+        started, release = threading.Event(), threading.Event()
+        routed = []
+
+        # an in-memory database is per connection, the page is made up instead of read in the threads
+        def slow_route(path):
+            routed.append(path)
+            started.set()
+            release.wait(5)
+            return 200, {'path': path}
+        self.api.route = slow_route
+        path = f'/transfers/{3:064x}'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.api.respond(path))) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(routed, [path])
+        self.assertEqual(len({body for _, _, body in results}), 1)
+
+    def test_cors_origin(self):
+        self.assertEqual(self.get('/transfers/0x12')[1]['Access-Control-Allow-Origin'], '*')
+        config = ApiConfig()
+        config.api_cors_origin = 'https://app.example, https://beta.example'
+        api = TransferAPI(config)
+        _, headers, _ = api.respond('/transfers/0x12', origin='https://beta.example')
+        self.assertEqual((headers['Access-Control-Allow-Origin'], headers['Vary']), ('https://beta.example', 'Origin'))
+        _, headers, _ = api.respond('/transfers/0x12', origin='https://other.example')
+        self.assertNotIn('Access-Control-Allow-Origin', headers)
+        config.api_cors_origin = ''
+        self.assertNotIn('Access-Control-Allow-Origin', TransferAPI(config).respond('/transfers/0x12')[1])
+
+    def test_listing_uses_index(self):
+        query = Transfer.select().where(Transfer.sender_chain_id == 1284).order_by(
+            Transfer.listed_event_block_id.desc(), Transfer.id.desc()
+        )
+        sql, params = query.sql()
+        plan = ' '.join(str(row) for row in Transfer._meta.database.execute_sql(f'EXPLAIN QUERY PLAN {sql}', params))
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
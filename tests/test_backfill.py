@@ -0,0 +1,44 @@
+import types
+import unittest
+
+from src.models import BackfillShard, Transfer, TransferConfirmation, TransferWriter, init_db
+from src.workers.backfill import Backfill
+
+
+class BackfillTestCase(unittest.TestCase):
+    def setUp(self):
+        init_db('sqlite:///:memory:')
+        Transfer.delete().execute()
+        BackfillShard.delete().execute()
+        TransferConfirmation.delete().execute()
+        scanner = types.SimpleNamespace(
+            chain_id=1, bridge=types.SimpleNamespace(contract=types.SimpleNamespace(address='0xAB')),
+            config=types.SimpleNamespace(backfill_shard_size=100, backfill_processes=2)
+        )
+        self.backfill = Backfill(scanner)
+
+    def test_shards_are_aligned(self):
+        self.assertEqual(self.backfill.pending_shards(150, 420), [
+            (100, 150, 199), (200, 200, 299), (300, 300, 399), (400, 400, 420)
+        ])
+
+    def test_resumes_after_covered_blocks(self):
+        self.backfill.commit(100, 199, TransferWriter(1))
+        self.backfill.commit(200, 250, TransferWriter(1))
+        self.assertEqual(self.backfill.pending_shards(150, 320), [(200, 251, 299), (300, 300, 320)])
+
+    def test_shards_merge_into_transfers(self):
+        tx_hash = 'ab' * 32
+        # confirmations of the transfer are split between two shards committed out of order
+        later = TransferWriter(1)
+        later.confirmed(tx_hash, 2, 210)
+        later.confirmed(tx_hash, 3, 220)
+        self.backfill.commit(200, 299, later)
+        earlier = TransferWriter(1)
+        earlier.listed(tx_hash, 5, 150, 90)
+        earlier.confirmed(tx_hash, 1, 160)
+        self.backfill.commit(100, 199, earlier)
+        transfer = Transfer.get(Transfer._tx_hash == tx_hash)
+        self.assertEqual((transfer.sender_chain_id, transfer.receiver_chain_id), (5, 1))
+        self.assertEqual((transfer.listed_event_block_id, transfer.deposit_event_block_id), (150, 90))
+        self.assertEqual(transfer.validator_confirmations, 3)
@@ -0,0 +1,116 @@
+import asyncio
+import types
+import unittest
+
+import web3.exceptions
+
+from src.util import AsyncContractWrapper, ContractWrapper
+
+
+class BatchContract(ContractWrapper):
+    """ContractWrapper with estimate_gas answered locally, 10000 gas per item"""
+    GAS_PER_ITEM = 10_000
+
+    def __init__(self, reverting=()):
+        # items the contract rejects while estimating
+        self.reverting = set(reverting)
+        self.estimated = []
+
+    def estimate_gas(self, method_name: str, arguments: tuple = (), options: dict = None) -> int:
+        chunk, = arguments
+        self.estimated.append(chunk)
+        if self.reverting & set(chunk):
+            raise web3.exceptions.ContractLogicError('execution reverted')
+        return self.GAS_PER_ITEM * len(chunk)
+
+
+class AsyncBatchContract(AsyncContractWrapper):
+    """AsyncContractWrapper with estimate_gas and transactions answered locally, 10000 gas per item"""
+    def __init__(self, reverting_on_chain=()):
+        # items the contract rejects once mined
+        self.reverting_on_chain = set(reverting_on_chain)
+        self.executed = []
+        self.receipts = {}
+        self.poll_latency = 0.0
+        self.api = types.SimpleNamespace(eth=types.SimpleNamespace(wait_for_transaction_receipt=self.receipt))
+
+    async def estimate_gas(self, method_name: str, arguments: tuple = (), options: dict = None) -> int:
+        chunk, = arguments
+        return BatchContract.GAS_PER_ITEM * len(chunk)
+
+    def make_tx(self, method_name: str, arguments: tuple = ()):
+        async def transact(options: dict = None):
+            chunk, = arguments
+            self.executed.append((chunk, options))
+            tx_hash = len(self.executed).to_bytes(32, 'big')
+            self.receipts[tx_hash] = {
+                'status': 0 if self.reverting_on_chain & set(chunk) else 1, 'blockNumber': len(self.executed)
+            }
+            return tx_hash
+        return types.SimpleNamespace(transact=transact)
+
+    async def receipt(self, tx_hash: bytes, poll_latency: float = 0.0) -> dict:
+        return self.receipts[tx_hash]
+
+    def execute(self, *args, **kwargs) -> list:
+        async def collect():
+            return [executed async for executed in self.execute_batch_tx(*args, **kwargs)]
+        return asyncio.run(collect())
+
+
+class BatchTxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reverted = []
+
+    def on_revert(self, item, error: Exception):
+        self.reverted.append(item)
+
+    def test_split_by_size_without_estimation(self):
+        contract = BatchContract()
+        self.assertEqual(
+            list(contract.split_batch('confirm', list(range(5)), batch_size=2)),
+            [([0, 1], None), ([2, 3], None), ([4], None)]
+        )
+        self.assertEqual(contract.estimated, [])
+
+    def test_split_until_under_max_gas(self):
+        contract = BatchContract()
+        chunks = list(contract.split_batch('confirm', list(range(10)), batch_size=10, max_gas=30_000))
+        self.assertEqual([chunk for chunk, _ in chunks], [[0, 1], [2, 3, 4], [5, 6], [7, 8, 9]])
+        self.assertTrue(all(gas <= 30_000 for _, gas in chunks))
+        # a single item is sent even above max_gas, the node decides
+        self.assertEqual(list(contract.split_batch('confirm', [0], max_gas=1)), [([0], 10_000)])
+
+    def test_revert_while_estimating(self):
+        contract = BatchContract(reverting={2, 5})
+        with self.assertRaises(web3.exceptions.ContractLogicError):
+            list(contract.split_batch('confirm', list(range(8)), max_gas=100_000))
+        chunks = list(contract._fit_batch('confirm', list(range(8)), max_gas=100_000, on_revert=self.on_revert))
+        self.assertEqual([chunk for chunk, _ in chunks], [[0, 1], [3], [4], [6, 7]])
+        self.assertEqual(self.reverted, [2, 5])
+
+    def test_execute_with_gas_margin(self):
+        contract = AsyncBatchContract()
+        submitted = []
+        executed = contract.execute(
+            'confirm', list(range(4)), {'from': '0x01'}, max_gas=20_000,
+            on_submitted=lambda chunk, tx_hash: submitted.append(chunk)
+        )
+        self.assertEqual([chunk for chunk, _ in executed], [[0, 1], [2, 3]])
+        self.assertEqual(submitted, [[0, 1], [2, 3]])
+        self.assertEqual(contract.executed[0][1], {'from': '0x01', 'gas': 24_000})
+
+    def test_revert_on_chain(self):
+        with self.assertRaises(web3.exceptions.ContractLogicError):
+            AsyncBatchContract(reverting_on_chain={3}).execute('transfer', list(range(4)))
+        executed = AsyncBatchContract(reverting_on_chain={3}).execute(
+            'transfer', list(range(4)), on_revert=self.on_revert
+        )
+        # the state changed after estimation, the reverted batch is bisected down to the rejected item
+        self.assertEqual([chunk for chunk, _ in executed], [[0, 1], [2]])
+        self.assertEqual(self.reverted, [3])
+        self.assertTrue(all(tx['status'] == 1 for _, tx in executed))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from src import util
+from src.workers import Validator, WorkerConfig
+from src.workers.base import ChainPool, Worker
+from tests.benchmark import ONE_TOKEN, Benchmark, FakeChain, format_results
+from tests import test_checkpoints
+from tests.test_deposit_cache import CACHE_PATH
+
+
+class PooledChainTestCase(unittest.TestCase):
+    """FakeChain registers into the class-level Worker.pool, every test gets a fresh one"""
+    def setUp(self):
+        self.pool = Worker.pool
+        Worker.pool = ChainPool()
+
+    def tearDown(self):
+        Worker.pool = self.pool
+
+
+class ProcessStoresBenchmark(Benchmark):
+    """The checkpoint and deposit databases are process wide, the workers use the ones of the other tests"""
+    def worker_config(self, *args) -> WorkerConfig:
+        config = super().worker_config(*args)
+        config.checkpoint_db_path = test_checkpoints.CheckpointStoreTestCase.path
+        config.deposit_cache_path = CACHE_PATH
+        return config
+
+
+class FakeChainTestCase(PooledChainTestCase):
+    def test_chain_id_and_signed_transactions(self):
+        chain = FakeChain(1001)
+        self.assertEqual(chain.api.eth.chain_id, 1001)
+        account = chain.account(1)
+        util.eth_add_to_auto_sign(chain.api, account)
+        tx_hash = chain.api.eth.send_transaction({'from': account.address, 'to': account.address, 'value': 1})
+        receipt = chain.api.eth.wait_for_transaction_receipt(tx_hash)
+        self.assertEqual(receipt['status'], 1)
+        self.assertEqual(chain.gas_used(receipt['blockNumber'], receipt['blockNumber']), 21000)
+
+    def test_batch_is_one_round_trip(self):
+        chain = FakeChain(1002, latency=0.01)
+        round_trips, requests = chain.provider.counters()
+        responses = util.make_batch_request(chain.api, [('eth_blockNumber', []), ('eth_chainId', [])])
+        self.assertEqual([response['result'] for response in responses][1], 1002)
+        self.assertEqual(chain.provider.counters(), (round_trips + 1, requests + 2))
+        chain.api.eth.block_number
+        self.assertEqual(chain.provider.counters(), (round_trips + 2, requests + 3))
+
+    def test_workers_use_pooled_chain(self):
+        chain = FakeChain(1003)
+        config = WorkerConfig()
+        config.eth_rpc = chain.url
+        config.eth_contract_address = util.ADDRESS_0
+        config._rpc_urls = {chain.chain_id: [chain.url]}
+        config.checkpoint_db_path = os.path.join(tempfile.mkdtemp(), 'checkpoints.sqlite')
+        worker = Validator(config)
+        self.assertIs(worker.api, chain.api)
+        self.assertIs(worker.get_chain_api(chain.chain_id), chain.api)
+        self.assertEqual(worker.chain_id, 1003)
+
+    def test_format_results(self):
+        lines = format_results([
+            {'role': 'lister', 'events': 10, 'seconds': 1.5, 'events_per_second': 6.67, 'round_trips_per_event': 2.1,
+             'requests_per_event': 6.0, 'gas_per_event': 30123}
+        ]).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].lstrip().startswith('role'))
+        self.assertTrue(lines[1].rstrip().endswith('30123'))
+
+
+class BenchmarkTestCase(PooledChainTestCase):
+    def test_every_transfer_completes(self):
+        benchmark = ProcessStoresBenchmark(deposits=3, poll_latency=0.01, batch_size=2)
+        results = benchmark.run()
+        self.assertEqual(
+            [(result['role'], result['events']) for result in results],
+            [('lister', 3), ('validator', 3), ('transactor', 3)]
+        )
+        self.assertEqual(
+            benchmark.target_token.call_method('balanceOf', (benchmark.receiver.address,)), 3 * ONE_TOKEN
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import logging
+import unittest
+
+import requests
+
+from src.workers.base import Worker, WorkerConfig
+from src.workers.block_range import BlockRangeController
+
+
+class BlockRangeControllerTestCase(unittest.TestCase):
+    def scan(self, controller: BlockRangeController, from_block: int, logs: int, head: int = 10 ** 9) -> int:
+        to_block = controller.next_range(from_block, head)
+        controller.add_logs(logs)
+        controller.record(to_block - from_block + 1, 1.0)
+        return to_block
+
+    def test_grows_on_sparse_ranges_up_to_maximum(self):
+        controller = BlockRangeController(initial=10, maximum=100, target_logs=100)
+        block = 1
+        for _ in range(20):
+            block = self.scan(controller, block, 0) + 1
+        self.assertEqual(controller.size, 100)
+
+    def test_shrinks_on_dense_ranges(self):
+        controller = BlockRangeController(initial=1000, maximum=2000, target_logs=100)
+        self.scan(controller, 1, 400)
+        self.assertEqual(controller.size, 250)
+
+    def test_range_is_cut_by_head(self):
+        controller = BlockRangeController(initial=10)
+        self.assertEqual(self.scan(controller, 1, 0, head=5), 5)
+        self.scan(controller, 6, 0, head=7)
+        # partial windows do not grow the range
+        self.assertEqual(controller.size, 10)
+
+    def test_shrink_on_refused_query(self):
+        controller = BlockRangeController(initial=4, minimum=1)
+        self.assertTrue(controller.shrink())
+        self.assertTrue(controller.shrink())
+        self.assertEqual(controller.size, 1)
+        self.assertFalse(controller.shrink())
+
+    def test_range_errors(self):
+        self.assertTrue(BlockRangeController.is_range_error(
+            ValueError({'code': -32005, 'message': 'query returned more than 10000 results'})
+        ))
+        self.assertTrue(BlockRangeController.is_range_error(requests.ReadTimeout()))
+        self.assertFalse(BlockRangeController.is_range_error(ValueError('execution reverted')))
+        self.assertTrue(BlockRangeController.is_range_error(
+            ValueError({'code': -32000, 'message': 'exceed maximum block range: 5000'})
+        ))
+        self.assertTrue(BlockRangeController.is_range_error(
+            ValueError('Log response size exceeded. You can make eth_getLogs requests with up to a 2K block range')
+        ))
+
+    def test_rate_limits_are_not_range_errors(self):
+        response = requests.Response()
+        response.status_code = 429
+        for error in (
+            requests.HTTPError('429 Client Error: Too Many Requests for url', response=response),
+            ValueError({'code': -32005, 'message': 'rate limit exceeded'}),
+            ValueError({'code': 429, 'message': 'Too Many Requests'}),
+        ):
+            self.assertFalse(BlockRangeController.is_range_error(error))
+            self.assertTrue(BlockRangeController.is_rate_limited(error))
+
+    def test_rate_limit_backoff(self):
+        controller = BlockRangeController()
+        error = ValueError('rate limit exceeded')
+        self.assertEqual([controller.rate_limit_delay(error, attempt) for attempt in range(6)], [1, 2, 4, 8, 16, None])
+        self.assertIsNone(controller.rate_limit_delay(ValueError('execution reverted'), 0))
+
+    def test_reports_speed(self):
+        controller = BlockRangeController(initial=10)
+        self.assertIsNone(controller.blocks_per_second)
+        self.scan(controller, 1, 0)
+        self.assertEqual(controller.blocks_per_second, 10.0)
+
+    def test_limit_per_endpoint(self):
+        config = WorkerConfig()
+        config.max_block_range = 2000
+        config._max_block_ranges = 'https://a.example/?key=x=10000, http://b.example=500'
+        self.assertEqual(config.max_block_range_of(['https://a.example/?key=x']), 10000)
+        self.assertEqual(config.max_block_range_of(['http://c.example']), 2000)
+        # a router may send the request to any of its endpoints
+        self.assertEqual(config.max_block_range_of(['https://a.example/?key=x', 'http://b.example']), 500)
+        self.assertEqual(config.max_block_range_of(['https://a.example/?key=x', 'http://c.example']), 2000)
+
+    def test_worker_retries_rate_limited_logs_without_shrinking(self):
+        worker = Worker.__new__(Worker)
+        worker.name, worker.config, worker.log = 'test', WorkerConfig(), logging.getLogger('worker.test')
+        worker.block_range = BlockRangeController(initial=100)
+        worker.block_range.RATE_LIMIT_BACKOFF = 0
+        responses = [ValueError('rate limit exceeded'), ValueError('rate limit exceeded'), [{'event': 'Listed'}]]
+
+        def fetch():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        self.assertEqual(worker.fetch_logs(fetch), [{'event': 'Listed'}])
+        self.assertEqual(worker.block_range.size, 100)
+        responses.append(ValueError('query returned more than 10000 results'))
+        with self.assertRaises(BlockRangeController.RangeError):
+            worker.fetch_logs(fetch)
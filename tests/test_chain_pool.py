@@ -0,0 +1,75 @@
+import threading
+import types
+import unittest
+
+import eth_account
+
+from src.workers.base import ChainPool, Worker, load_bridge_abi
+
+
+class ChainPoolTestCase(unittest.TestCase):
+    def test_created_once(self):
+        pool = ChainPool()
+        created = []
+
+        def factory():
+            created.append(threading.current_thread())
+            return object()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(pool.get_or_create(('api', 1), factory)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertIsNot(pool.get_or_create(('api', 2), factory), results[0])
+        self.assertEqual([pool.first_use(('signer', 1)), pool.first_use(('signer', 1))], [True, False])
+
+    def test_bridge_abi_parsed_once(self):
+        self.assertIs(load_bridge_abi(), load_bridge_abi())
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = ChainPool()
+        self.config = types.SimpleNamespace(
+            rpc_urls={5: ['http://127.0.0.1:1', 'http://127.0.0.1:2'], 6: ['http://127.0.0.1:3']},
+            rpc_timeout=1.0, poll_latency=1.0
+        )
+
+    def make_worker(self, private_key: bytes) -> Worker:
+        worker = Worker.__new__(Worker)
+        worker.pool = self.pool
+        worker.config = self.config
+        worker.account = eth_account.Account.from_key(private_key)
+        return worker
+
+    def test_chain_objects_shared_by_workers(self):
+        first, second = self.make_worker(b'\x01' * 32), self.make_worker(b'\x01' * 32)
+        api = first.get_chain_api(5)
+        self.assertIs(second.get_chain_api(5), api)
+        self.assertIsNot(first.get_chain_api(6), api)
+        bridge = first.get_chain_bridge(5, '0x' + '11' * 20)
+        self.assertIs(second.get_chain_bridge(5, '0x' + '11' * 20), bridge)
+        self.assertIs(bridge.api, api)
+        self.assertIsNot(first.get_chain_bridge(5, '0x' + '22' * 20), bridge)
+
+    def test_signing_middleware_added_once_per_account(self):
+        first, second = self.make_worker(b'\x01' * 32), self.make_worker(b'\x01' * 32)
+        api = first.get_chain_api(5)
+        middlewares = len(api.middleware_onion)
+        for _ in range(3):
+            first.get_chain_api(5, sign=True)
+            second.get_chain_bridge(5, '0x' + '11' * 20, sign=True)
+        self.assertEqual(len(api.middleware_onion), middlewares + 1)
+        # another key signs its own transactions
+        self.make_worker(b'\x02' * 32).get_chain_api(5, sign=True)
+        self.assertEqual(len(api.middleware_onion), middlewares + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
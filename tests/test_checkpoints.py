@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+from hexbytes import HexBytes
+
+from src.workers.checkpoints import CheckpointStore
+
+
+def make_event(block_number: int, log_index: int = 0, block_hash: bytes = None) -> dict:
+    block_hash = block_hash or block_number.to_bytes(32, 'big')
+    return {'blockNumber': block_number, 'logIndex': log_index, 'blockHash': HexBytes(block_hash)}
+
+
+class CheckpointStoreTestCase(unittest.TestCase):
+    # the checkpoint database is process wide, every test uses its own worker key
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, 'checkpoints.sqlite')
+
+    def make_store(self, flush_interval: float = 60.0) -> CheckpointStore:
+        return CheckpointStore(self.path, self.id(), flush_interval=flush_interval)
+
+    def test_outcomes_survive_restart(self):
+        store = self.make_store()
+        store.advance(9)
+        store.record(make_event(10, 0), 'confirmed')
+        store.record(make_event(10, 1), 'error: not linked')
+        store.flush()
+
+        restarted = self.make_store()
+        self.assertEqual(restarted.last_block, 9)
+        self.assertTrue(restarted.is_processed(make_event(10, 0)))
+        self.assertEqual(restarted.outcome(make_event(10, 1)), 'error: not linked')
+        self.assertFalse(restarted.is_processed(make_event(10, 2)))
+        # same position in a block of another fork
+        self.assertFalse(restarted.is_processed(make_event(10, 0, block_hash=b'\xff' * 32)))
+
+    def test_writes_are_buffered(self):
+        store = self.make_store()
+        store.record(make_event(5), 'listed')
+        store.advance(5)
+        self.assertIsNone(self.make_store().last_block)
+        store.flush()
+        self.assertEqual(self.make_store().last_block, 5)
+
+    def test_cursor_prunes_outcomes(self):
+        store = self.make_store(flush_interval=0)
+        store.record(make_event(5), 'listed')
+        store.record(make_event(6), 'listed')
+        store.advance(5)
+
+        restarted = self.make_store()
+        self.assertFalse(restarted.is_processed(make_event(5)))
+        self.assertTrue(restarted.is_processed(make_event(6)))
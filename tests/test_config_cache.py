@@ -0,0 +1,57 @@
+import unittest
+
+import web3
+
+from src import util
+from src.workers.cache import BridgeConfigCache
+
+
+class Bridge(object):
+    """Stands for the bridge ContractWrapper, the cache reads only its address and makes no requests"""
+    address = web3.Web3.to_checksum_address('0x' + '11' * 20)
+
+
+class BridgeConfigCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bridge = Bridge()
+
+    def test_values_expire_after_ttl(self):
+        cache = BridgeConfigCache(ttl=60.0)
+        cache.store(1, self.bridge, 'requiredConfirmations', (), 2)
+        self.assertEqual(cache.lookup(1, self.bridge, 'requiredConfirmations', ()), (True, 2))
+        # another chain, other arguments and uncached methods miss
+        self.assertFalse(cache.lookup(2, self.bridge, 'requiredConfirmations', ())[0])
+        self.assertFalse(cache.lookup(1, self.bridge, 'hasPair', ('0x01', 2))[0])
+        cache.store(1, self.bridge, 'confirmations', (b'\x01',), (0, 1, 1, False))
+        self.assertFalse(cache.lookup(1, self.bridge, 'confirmations', (b'\x01',))[0])
+
+        cache = BridgeConfigCache(ttl=0.0)
+        cache.store(1, self.bridge, 'requiredConfirmations', (), 2)
+        cache.store(1, self.bridge, 'hasPair', ('0x01', 2), True)
+        self.assertFalse(cache.lookup(1, self.bridge, 'requiredConfirmations', ())[0])
+        self.assertFalse(cache.lookup(1, self.bridge, 'hasPair', ('0x01', 2))[0])
+
+    def test_links_and_tokens_are_write_once(self):
+        cache = BridgeConfigCache(ttl=0.0)
+        link = '0x' + '22' * 20
+        cache.store(1, self.bridge, 'links', (2,), link)
+        cache.store(1, self.bridge, 'tokens', (0,), '0x' + '33' * 20)
+        self.assertEqual(cache.lookup(1, self.bridge, 'links', (2,)), (True, link))
+        self.assertTrue(cache.lookup(1, self.bridge, 'tokens', (0,))[0])
+        # a missing link may be added later
+        cache.store(1, self.bridge, 'links', (3,), util.ADDRESS_0)
+        self.assertFalse(cache.lookup(1, self.bridge, 'links', (3,))[0])
+
+    def test_bridges_cached_apart(self):
+        cache = BridgeConfigCache(ttl=60.0)
+        other = Bridge()
+        other.address = web3.Web3.to_checksum_address('0x' + '44' * 20)
+        cache.store(1, self.bridge, 'requiredConfirmations', (), 2)
+        cache.store(1, other, 'requiredConfirmations', (), 3)
+        self.assertEqual(cache.lookup(1, self.bridge, 'requiredConfirmations', ()), (True, 2))
+        self.assertEqual(cache.lookup(1, other, 'requiredConfirmations', ()), (True, 3))
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+import web3
+
+from src import util
+from src.workers.deposit_cache import CachedDeposit, DepositCache
+
+
+CACHE_PATH = os.path.join(tempfile.mkdtemp(), 'deposits.sqlite')
+
+
+class DepositCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = DepositCache(CACHE_PATH, max_entries=2)
+        CachedDeposit.delete().execute()
+        self.deposits = [{'receiver': '0x' + '11' * 20, 'token': '0x' + '22' * 20, 'amount': 10, 'targetChainId': 5}]
+
+    def test_lookup_by_transaction(self):
+        self.assertIsNone(self.cache.lookup(1, '0x' + 'aa' * 32))
+        self.cache.store(1, '0x' + 'AA' * 32, 10, b'\x01' * 32, self.deposits)
+        entry = self.cache.lookup(1, bytes.fromhex('aa' * 32))
+        self.assertEqual((entry.block_number, entry.block_hash, entry.deposits), (10, b'\x01' * 32, self.deposits))
+        self.assertIsNone(self.cache.lookup(2, '0x' + 'aa' * 32))
+
+        self.cache.discard(1, '0x' + 'aa' * 32, b'\x01' * 32)
+        self.assertIsNone(self.cache.lookup(1, '0x' + 'aa' * 32))
+
+    def test_evicts_least_recently_used(self):
+        for index in range(3):
+            self.cache.store(1, f'{index:064x}', index, b'\x01' * 32, self.deposits)
+        self.cache.lookup(1, f'{0:064x}')
+        self.cache.evict()
+        self.assertIsNotNone(self.cache.lookup(1, f'{0:064x}'))
+        self.assertIsNone(self.cache.lookup(1, f'{1:064x}'))
+        self.assertIsNotNone(self.cache.lookup(1, f'{2:064x}'))
+
+
+class BlockHashBatchTestCase(unittest.TestCase):
+    def test_block_hash(self):
+        api = web3.Web3(web3.EthereumTesterProvider())
+        block = api.eth.get_block('latest')
+        block_hash, missing = util.RPCBatch(api).add_block_hash(block['number']).add_block_hash(10 ** 6).execute()
+        self.assertEqual(block_hash, block['hash'])
+        self.assertIsNone(missing)
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+
+import web3
+
+from src.workers.aio.base import AsyncHeadTracker
+from src.workers.base import WorkerConfig
+from src.workers.heads import FinalityPolicy, HeadTracker
+
+from .test_rpc_router import StubRPCServer
+
+
+class FinalityPolicyTestCase(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(FinalityPolicy.parse('finalized'), FinalityPolicy('finalized'))
+        self.assertEqual(FinalityPolicy.parse('depth:12'), FinalityPolicy(FinalityPolicy.DEPTH, 12))
+        self.assertEqual(FinalityPolicy.parse('12'), FinalityPolicy(FinalityPolicy.DEPTH, 12))
+        with self.assertRaises(ValueError):
+            FinalityPolicy.parse('latest')
+
+    def test_per_chain_config(self):
+        config = WorkerConfig()
+        config.eth_block_confirmations = 64
+        config._finality = ''
+        config._finality_policies = '1:finalized,1284:depth:2'
+        self.assertEqual(config.finality_policy(1), FinalityPolicy('finalized'))
+        self.assertEqual(config.finality_policy(1284), FinalityPolicy(FinalityPolicy.DEPTH, 2))
+        self.assertEqual(config.finality_policy(56), FinalityPolicy(FinalityPolicy.DEPTH, 64))
+        config._finality = 'safe'
+        self.assertEqual(config.finality_policy(56), FinalityPolicy('safe'))
+
+
+class FinalizedStubRPCServer(StubRPCServer):
+    def __init__(self, finalized=None, error: str = 'invalid block tag', **kwargs):
+        self.finalized = finalized
+        self.error = error
+        super().__init__(**kwargs)
+
+    def respond(self, request: dict) -> dict:
+        if request['method'] != 'eth_getBlockByNumber':
+            return super().respond(request)
+        self.calls.append(request['method'])
+        if self.finalized is None:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32602, 'message': self.error}}
+        block = {'number': hex(self.finalized), 'hash': '0x' + '11' * 32}
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': block}
+
+
+class HeadTrackerTestCase(unittest.TestCase):
+    def make_tracker(self, **kwargs) -> HeadTracker:
+        self.server = FinalizedStubRPCServer(**kwargs)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        return HeadTracker(web3.Web3(web3.Web3.HTTPProvider(self.server.url)), max_age=60, fallback_depth=10)
+
+    def test_depth_resolved_once_per_poll(self):
+        tracker = self.make_tracker(head=100)
+        for _ in range(3):
+            self.assertEqual(tracker.final_block(FinalityPolicy(FinalityPolicy.DEPTH, 5)), 95)
+        self.assertEqual(self.server.calls, ['eth_blockNumber'])
+        tracker.observe_head(103)
+        self.assertEqual(tracker.final_block(FinalityPolicy(FinalityPolicy.DEPTH, 5)), 98)
+
+    def test_finalized_tag(self):
+        tracker = self.make_tracker(head=100, finalized=70)
+        self.assertEqual(tracker.final_block(FinalityPolicy('finalized')), 70)
+        self.assertEqual(tracker.final_block(FinalityPolicy('finalized')), 70)
+        self.assertEqual(self.server.calls, ['eth_getBlockByNumber'])
+
+    def test_unsupported_tag_falls_back_to_depth(self):
+        tracker = self.make_tracker(head=100)
+        self.assertEqual(tracker.final_block(FinalityPolicy('safe')), 90)
+        self.assertEqual(tracker.final_block(FinalityPolicy('safe')), 90)
+        self.assertEqual(self.server.calls.count('eth_getBlockByNumber'), 1)
+
+    def test_unresolved_tag_is_probed_again(self):
+        tracker = self.make_tracker(head=100, error='finalized block not found')
+        tracker.TAG_RETRY_INTERVAL = 0.0
+        self.assertEqual(tracker.final_block(FinalityPolicy('finalized')), 90)
+        self.server.finalized = 70
+        self.assertEqual(tracker.final_block(FinalityPolicy('finalized')), 70)
+        self.assertEqual(self.server.calls.count('eth_getBlockByNumber'), 2)
+
+    def test_async_tracker_falls_back_like_the_sync_one(self):
+        self.make_tracker(head=100)
+        tracker = AsyncHeadTracker(
+            web3.AsyncWeb3(web3.AsyncWeb3.AsyncHTTPProvider(self.server.url)), max_age=60, fallback_depth=10
+        )
+
+        async def poll():
+            return [await tracker.final_block(FinalityPolicy('safe')) for _ in range(3)]
+        self.assertEqual(asyncio.run(poll()), [90, 90, 90])
+        # the unsupported tag is probed once, the head is requested once per max_age
+        self.assertEqual(self.server.calls, ['eth_getBlockByNumber', 'eth_blockNumber'])
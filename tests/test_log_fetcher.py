@@ -0,0 +1,149 @@
+import threading
+import unittest
+
+import web3
+from eth_abi import encode
+from hexbytes import HexBytes
+
+from src.workers.base import load_bridge_abi
+from src.workers.log_fetcher import LogFetcher, SharedLogFetcher
+
+
+BRIDGE_ADDRESS = '0x1111111111111111111111111111111111111111'
+OTHER_TOPIC = HexBytes(b'\x22' * 32)
+
+
+def make_log(
+    topics: dict, event_name: str, tx_hash: bytes, value: int, block_number: int, log_index: int
+) -> dict:
+    data_type = {'Listed': 'uint256', 'Confirmed': 'uint16'}.get(event_name, 'uint256')
+    return {
+        'address': BRIDGE_ADDRESS,
+        'topics': [topics.get(event_name, OTHER_TOPIC), HexBytes(tx_hash)],
+        'data': HexBytes(encode([data_type], [value])),
+        'blockNumber': block_number, 'logIndex': log_index, 'transactionIndex': 0,
+        'transactionHash': HexBytes(b'\x33' * 32), 'blockHash': HexBytes(b'\x44' * 32),
+    }
+
+
+class LogFetcherTestCase(unittest.TestCase):
+    def setUp(self):
+        contract = web3.Web3().eth.contract(BRIDGE_ADDRESS, abi=load_bridge_abi())
+        self.fetcher = LogFetcher(contract, ('Listed', 'Confirmed'))
+        self.topics = {event.event_name: HexBytes(topic) for topic, event in self.fetcher.events.items()}
+
+    def make_log(self, event_name: str, tx_hash: bytes, value: int, block_number: int, log_index: int) -> dict:
+        return make_log(self.topics, event_name, tx_hash, value, block_number, log_index)
+
+    def test_filter_params(self):
+        params = self.fetcher.filter_params(10, 20)
+        self.assertEqual(params['address'], BRIDGE_ADDRESS)
+        self.assertEqual((params['fromBlock'], params['toBlock']), (10, 20))
+        # one topic0 OR-list with every event type
+        self.assertEqual(len(params['topics']), 1)
+        self.assertEqual(sorted(params['topics'][0]), sorted(topic.hex() for topic in self.topics.values()))
+
+    def test_decode_in_chain_order(self):
+        tx_hash = b'\x01' * 32
+        events = self.fetcher.decode([
+            self.make_log('Confirmed', tx_hash, 3, block_number=6, log_index=0),
+            self.make_log('Confirmed', tx_hash, 2, block_number=5, log_index=4),
+            self.make_log('Listed', tx_hash, 1284, block_number=5, log_index=1),
+            self.make_log('Other', tx_hash, 0, block_number=5, log_index=2),
+        ])
+        self.assertEqual([event['event'] for event in events], ['Listed', 'Confirmed', 'Confirmed'])
+        self.assertEqual(events[0]['args']['sourceChainId'], 1284)
+        self.assertEqual(events[0]['args']['txHash'], tx_hash)
+        self.assertEqual([event['args']['validatorId'] for event in events[1:]], [2, 3])
+
+
+class CountingEth(object):
+    """Answers eth_getLogs from logs, one per block, whose topic0 is requested"""
+    def __init__(self, logs: list = ()):
+        self.logs = list(logs)
+        self.calls = []
+        self.release = threading.Event()
+
+    def get_logs(self, params):
+        self.calls.append(params)
+        self.release.wait(5)
+        return [
+            log for log in self.logs
+            if params['fromBlock'] <= log['blockNumber'] <= params['toBlock']
+            and log['topics'][0].hex() in params['topics'][0]
+        ]
+
+
+class CountingApi(object):
+    def __init__(self, logs: list = ()):
+        self.eth = CountingEth(logs)
+
+
+class SharedLogFetcherTestCase(unittest.TestCase):
+    def setUp(self):
+        contract = web3.Web3().eth.contract(BRIDGE_ADDRESS, abi=load_bridge_abi())
+        self.fetcher = SharedLogFetcher(contract, max_ranges=2)
+        # a Listed and a Confirmed event in every block
+        topics = {
+            event.event_name: HexBytes(topic)
+            for topic, event in LogFetcher(contract, ('Listed', 'Confirmed')).events.items()
+        }
+        self.api = CountingApi([
+            make_log(topics, name, bytes([block_number]) * 32, 1, block_number, log_index)
+            for block_number in range(1, 60) for log_index, name in enumerate(('Listed', 'Confirmed'))
+        ])
+
+    def test_topics_of_registered_event_types(self):
+        self.api.eth.release.set()
+        events = self.fetcher.fetch(self.api, 10, 20, ('Listed',))
+        self.assertEqual({event['event'] for event in events}, {'Listed'})
+        self.assertEqual(len(self.api.eth.calls[0]['topics'][0]), 1)
+        # a new event type is requested from then on, cached ranges without it are fetched again
+        events = self.fetcher.fetch(self.api, 10, 20, ('Confirmed',))
+        self.assertEqual([event['event'] for event in events], ['Confirmed'] * 11)
+        self.assertEqual(len(self.api.eth.calls[1]['topics'][0]), 2)
+        self.assertEqual(len(self.fetcher.fetch(self.api, 10, 20, ('Listed',))), 11)
+        self.assertEqual(len(self.api.eth.calls), 2)
+
+    def test_concurrent_workers_share_request(self):
+        threads = [
+            threading.Thread(target=self.fetcher.fetch, args=(self.api, 10, 20, ('Listed',))) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        self.api.eth.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(self.api.eth.calls), 1)
+
+    def test_overlapping_ranges_fetch_missing_blocks(self):
+        self.api.eth.release.set()
+        self.fetcher.fetch(self.api, 10, 20, ('Listed',))
+        events = self.fetcher.fetch(self.api, 15, 30, ('Listed',))
+        self.assertEqual([event['blockNumber'] for event in events], list(range(15, 31)))
+        self.assertEqual(
+            [(params['fromBlock'], params['toBlock']) for params in self.api.eth.calls], [(10, 20), (21, 30)]
+        )
+        # a range within the kept ones is served without a request
+        self.assertEqual(len(self.fetcher.fetch(self.api, 12, 25, ('Listed',))), 14)
+        self.assertEqual(len(self.api.eth.calls), 2)
+
+    def test_keeps_last_ranges(self):
+        self.api.eth.release.set()
+        for from_block in (10, 21, 32, 10):
+            self.fetcher.fetch(self.api, from_block, from_block + 10, ('Listed',))
+        self.assertEqual([params['fromBlock'] for params in self.api.eth.calls], [10, 21, 32, 10])
+
+    def test_failures_not_kept(self):
+        calls = []
+
+        def get_logs(params):
+            calls.append(params)
+            if len(calls) == 1:
+                raise ValueError('query timeout exceeded')
+            return []
+        self.api.eth.get_logs = get_logs
+        with self.assertRaises(ValueError):
+            self.fetcher.fetch(self.api, 10, 20, ('Listed',))
+        self.assertEqual(self.fetcher.fetch(self.api, 10, 20, ('Listed',)), [])
+        self.assertEqual(len(calls), 2)
@@ -0,0 +1,47 @@
+import unittest
+import urllib.request
+
+import web3
+
+from src import metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter_and_gauge(self):
+        counter = self.registry.counter('test_events_total', 'Events', ('worker',))
+        gauge = self.registry.gauge('test_lag_blocks', 'Lag')
+        counter.inc(worker='validator')
+        counter.inc(3, worker='validator')
+        gauge.set(7)
+        text = self.registry.render()
+        self.assertIn('# TYPE test_events_total counter\n', text)
+        self.assertIn('test_events_total{worker="validator"} 4\n', text)
+        self.assertIn('test_lag_blocks 7\n', text)
+        with self.assertRaises(ValueError):
+            counter.inc(chain='1')
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('test_seconds', 'Latency', ('method',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value, method='eth_call')
+        lines = self.registry.render().splitlines()
+        self.assertIn('test_seconds_bucket{method="eth_call",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{method="eth_call",le="1"} 3', lines)
+        self.assertIn('test_seconds_bucket{method="eth_call",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum{method="eth_call"} 3.65', lines)
+        self.assertIn('test_seconds_count{method="eth_call"} 4', lines)
+
+    def test_rpc_middleware_and_endpoint(self):
+        api = web3.Web3(web3.EthereumTesterProvider())
+        api.middleware_onion.add(metrics.rpc_middleware('tester'), 'metrics')
+        api.eth.block_number
+        server = metrics.serve(0)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+                text = response.read().decode()
+        finally:
+            server.shutdown()
+        self.assertIn('bridge_rpc_request_seconds_count{method="eth_blockNumber",endpoint="tester"}', text)
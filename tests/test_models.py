@@ -0,0 +1,92 @@
+import unittest
+
+import peewee
+
+from src.models import Transfer, TransferConfirmation, TransferWriter, create_tables, init_db
+
+
+# transfer table of the first release, before the unique txHash and the pagination indexes
+BASELINE_SCHEMA = (
+    'CREATE TABLE "transfer" ("id" INTEGER NOT NULL PRIMARY KEY, "sender_chain_id" INTEGER NOT NULL, '
+    '"deposit_event_block_id" INTEGER NOT NULL, "receiver_chain_id" INTEGER NOT NULL, '
+    '"listed_event_block_id" INTEGER NOT NULL, "validator_confirmations" INTEGER NOT NULL, '
+    '"_tx_hash" VARCHAR(64) NOT NULL)',
+    'CREATE INDEX "transfer_sender_chain_id" ON "transfer" ("sender_chain_id")',
+    'CREATE INDEX "transfer_receiver_chain_id" ON "transfer" ("receiver_chain_id")',
+    'CREATE INDEX "transfer__tx_hash" ON "transfer" ("_tx_hash")',
+)
+
+
+class TransferWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        init_db('sqlite:///:memory:')
+        Transfer.delete().execute()
+        TransferConfirmation.delete().execute()
+        self.writer = TransferWriter(receiver_chain_id=1)
+
+    def test_merges_events_of_one_hash(self):
+        tx_hash = '0x' + 'AB' * 32
+        self.writer.listed(tx_hash, 5, block_id=100, deposit_block_id=90)
+        self.writer.confirmed(tx_hash, 1, 101)
+        self.writer.confirmed(tx_hash, 2, 102)
+        # the same Confirmed event seen again
+        self.writer.confirmed(tx_hash, 2, 102)
+        self.assertEqual(len(self.writer), 1)
+        self.writer.flush()
+        self.assertEqual(len(self.writer), 0)
+
+        transfer = Transfer.get(Transfer._tx_hash == 'ab' * 32)
+        self.assertEqual((transfer.sender_chain_id, transfer.receiver_chain_id), (5, 1))
+        self.assertEqual((transfer.listed_event_block_id, transfer.deposit_event_block_id), (100, 90))
+        self.assertEqual(transfer.validator_confirmations, 2)
+
+    def test_later_windows_keep_known_values(self):
+        tx_hash = 'cd' * 32
+        self.writer.listed(tx_hash, 5, block_id=100, deposit_block_id=90)
+        self.writer.flush()
+        for validator_id in (1, 2, 3):
+            self.writer.confirmed(tx_hash, validator_id, 101)
+        self.writer.flush()
+        # a window handled again after a restart
+        self.writer.confirmed(tx_hash, 3, 101)
+        self.writer.flush()
+
+        transfer = Transfer.get(Transfer._tx_hash == tx_hash)
+        self.assertEqual((transfer.sender_chain_id, transfer.listed_event_block_id), (5, 100))
+        self.assertEqual(transfer.validator_confirmations, 3)
+        self.assertEqual(Transfer.select().count(), 1)
+        self.assertEqual(
+            [row.validator_id for row in TransferConfirmation.select().order_by(TransferConfirmation.validator_id)],
+            [1, 2, 3]
+        )
+
+
+class MigrationTestCase(unittest.TestCase):
+    def test_baseline_schema_migrated(self):
+        database = peewee.SqliteDatabase(':memory:')
+        for statement in BASELINE_SCHEMA:
+            database.execute_sql(statement)
+        # a txHash inserted twice by the get_or_create of the first release
+        for listed_block_id in (100, 0):
+            database.execute_sql(
+                'INSERT INTO "transfer" ("sender_chain_id", "deposit_event_block_id", "receiver_chain_id", '
+                '"listed_event_block_id", "validator_confirmations", "_tx_hash") VALUES (5, 0, 1, ?, 0, ?)',
+                (listed_block_id, 'ab' * 32)
+            )
+        create_tables(database)
+        indexes = {tuple(index.columns): index.unique for index in database.get_indexes('transfer')}
+        self.assertTrue(indexes[('_tx_hash',)])
+        self.assertIn(('sender_chain_id', 'listed_event_block_id', 'id'), indexes)
+        self.assertIn(('receiver_chain_id', 'listed_event_block_id', 'id'), indexes)
+        # the upsert needs the unique index as its conflict target
+        with database.bind_ctx([Transfer, TransferConfirmation]):
+            self.assertEqual([row.listed_event_block_id for row in Transfer.select()], [100])
+            Transfer.upsert_many([{
+                '_tx_hash': 'ab' * 32, 'sender_chain_id': 5, 'receiver_chain_id': 1,
+                'listed_event_block_id': 0, 'deposit_event_block_id': 90
+            }])
+            transfer = Transfer.get()
+            self.assertEqual((transfer.listed_event_block_id, transfer.deposit_event_block_id), (100, 90))
+        # migrated tables are left alone
+        create_tables(database)
+        self.assertEqual(len(database.get_indexes('transfer')), len(indexes))
@@ -0,0 +1,120 @@
+import logging
+import types
+import unittest
+
+from hexbytes import HexBytes
+
+from src.workers import Signer, Validator
+from src.workers.base import Worker
+from src.workers.block_range import BlockRangeController
+from src.workers.prefetch import PrefetchCache
+
+
+def make_event(block_number: int, block_hash: bytes, log_index: int = 0) -> dict:
+    return {'event': 'Listed', 'blockNumber': block_number, 'blockHash': HexBytes(block_hash), 'logIndex': log_index}
+
+
+class PrefetchCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = PrefetchCache()
+
+    def test_reused_in_same_block(self):
+        self.cache.store(make_event(10, b'\x01' * 32), True, 'validated')
+        self.assertEqual(self.cache.pop(make_event(10, b'\x01' * 32)), (True, True, 'validated'))
+        # every outcome is used once
+        self.assertEqual(self.cache.pop(make_event(10, b'\x01' * 32))[0], False)
+
+    def test_reorged_block_misses(self):
+        self.cache.store(make_event(10, b'\x01' * 32), True, 'validated')
+        self.assertFalse(self.cache.pop(make_event(10, b'\x02' * 32))[0])
+        self.assertFalse(self.cache.pop(make_event(10, b'\x01' * 32, log_index=1))[0])
+
+    def test_failures_are_kept(self):
+        error = ValueError('not linked')
+        self.cache.store(make_event(10, b'\x01' * 32), False, error)
+        self.assertEqual(self.cache.pop(make_event(10, b'\x01' * 32)), (True, False, error))
+
+    def test_prune_and_clear(self):
+        self.cache.store(make_event(10, b'\x01' * 32), True, 1)
+        self.cache.store(make_event(11, b'\x02' * 32), True, 2)
+        self.cache.until, self.cache.until_hash = 11, b'\x02' * 32
+        self.cache.prune(10)
+        self.assertEqual(len(self.cache), 1)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertIsNone(self.cache.until)
+
+    def test_only_final_outcomes_are_cached(self):
+        self.assertTrue(issubclass(Validator.ValidatorError, Validator.PREFETCH_EXCEPTIONS))
+        self.assertTrue(issubclass(Validator.ValidatorInfo, Validator.PREFETCH_EXCEPTIONS))
+        # not mined or not confirmed yet at prefetch depth, it may be at final depth
+        self.assertFalse(issubclass(Validator.ValidatorDebug, Validator.PREFETCH_EXCEPTIONS))
+        self.assertTrue(issubclass(Signer.SignerError, Signer.PREFETCH_EXCEPTIONS))
+        self.assertFalse(issubclass(Signer.SignerException, Signer.PREFETCH_EXCEPTIONS))
+
+
+class Chain(object):
+    """Stands for api.eth and the log fetcher, one Listed event per block"""
+    def __init__(self):
+        self.hashes = {number: bytes([number]) * 32 for number in range(1, 100)}
+        self.error = None
+        self.fetched = []
+
+    def get_block(self, number: int) -> dict:
+        return {'hash': self.hashes[number]}
+
+    def fetch(self, api, from_block: int, to_block: int) -> list:
+        if self.error is not None:
+            raise self.error
+        self.fetched.append((from_block, to_block))
+        return [
+            {'event': 'Listed', 'args': {}, 'blockNumber': number, 'blockHash': HexBytes(self.hashes[number]),
+             'logIndex': 0}
+            for number in range(from_block, to_block + 1)
+        ]
+
+
+class WorkerPrefetchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.chain = Chain()
+        self.worker = Worker.__new__(Worker)
+        self.worker.name = 'test'
+        self.worker.log = logging.getLogger('worker.test')
+        self.worker.api = types.SimpleNamespace(eth=self.chain)
+        self.worker.config = types.SimpleNamespace(prefetch_confirmations=2)
+        self.worker.block_range = BlockRangeController(initial=4)
+        self.worker.prefetch_cache = PrefetchCache()
+        self.worker.prefetch_handlers = lambda: {'Listed': self.handle}
+        self.worker._log_fetchers = {('Listed',): self.chain}
+
+    def handle(self, event) -> int:
+        return event['blockNumber']
+
+    def test_prefetched_until_reorg(self):
+        self.worker.prefetch(10, 20)
+        self.worker.prefetch(10, 20)
+        self.assertEqual(self.chain.fetched, [(10, 13), (14, 17)])
+        self.assertEqual(self.worker.prefetched(make_event(12, self.chain.hashes[12]), self.handle), 12)
+        # logs of a shallow range do not count towards the density of final ranges
+        self.assertEqual(self.worker.block_range.logs, 0)
+
+        self.chain.hashes[17] = b'\xff' * 32
+        self.worker.prefetch(10, 20)
+        self.assertEqual(self.chain.fetched[-1], (10, 13))
+        self.assertEqual(len(self.worker.prefetch_cache), 4)
+
+    def test_failures_drop_prefetched_results(self):
+        self.worker.prefetch(10, 20)
+        self.chain.error = ConnectionError('node restarting')
+        self.worker.prefetch(10, 20)
+        self.assertEqual(len(self.worker.prefetch_cache), 0)
+        self.assertIsNone(self.worker.prefetch_cache.until)
+
+        # a refused range shrinks the window like at final depth
+        self.chain.error = ValueError('query returned more than 10000 results')
+        self.worker.prefetch(10, 20)
+        self.assertEqual(self.worker.block_range.size, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import types
+import unittest
+
+import web3
+from eth_abi import encode
+from eth_utils import event_abi_to_log_topic
+from hexbytes import HexBytes
+
+from src.workers.base import load_bridge_abi
+from src.workers.validator import Validator
+
+
+BRIDGE_ADDRESS = '0x1111111111111111111111111111111111111111'
+ROUTER_ADDRESS = '0x2222222222222222222222222222222222222222'
+TOKEN = '0x3333333333333333333333333333333333333333'
+RECEIVER = '0x4444444444444444444444444444444444444444'
+
+
+class ReceiptDepositsTestCase(unittest.TestCase):
+    def setUp(self):
+        contract = web3.Web3().eth.contract(BRIDGE_ADDRESS, abi=load_bridge_abi())
+        self.bridge = types.SimpleNamespace(contract=contract, address=BRIDGE_ADDRESS)
+        self.topic = HexBytes(event_abi_to_log_topic(contract.events.Deposit().abi))
+
+    def make_log(self, address: str, amount: int, target_chain_id: int, log_index: int) -> dict:
+        return {
+            'address': address,
+            'topics': [self.topic, HexBytes(encode(['address'], [TOKEN])), HexBytes(encode(['address'], [RECEIVER]))],
+            'data': HexBytes(encode(['uint256', 'uint256'], [amount, target_chain_id])),
+            'blockNumber': 5, 'logIndex': log_index, 'transactionIndex': 0,
+            'transactionHash': HexBytes(b'\x33' * 32), 'blockHash': HexBytes(b'\x44' * 32),
+        }
+
+    def test_deposits_of_source_bridge(self):
+        # a router forwarding two deposits, its own log has the same signature
+        receipt = {'logs': [
+            self.make_log(ROUTER_ADDRESS, 10, 1284, 0),
+            self.make_log(BRIDGE_ADDRESS, 10, 1, 1),
+            self.make_log(BRIDGE_ADDRESS, 20, 1284, 2),
+        ]}
+        deposits = Validator.receipt_deposits(self.bridge, receipt)
+        self.assertEqual([(deposit['amount'], deposit['targetChainId']) for deposit in deposits], [(10, 1), (20, 1284)])
+        self.assertEqual((deposits[0]['token'], deposits[0]['receiver']), (TOKEN, RECEIVER))
+
+        deposit = Validator.match_deposit(deposits, 1284, RECEIVER, 20, '0x01', 1)
+        self.assertEqual(deposit['amount'], 20)
+        with self.assertRaises(Validator.ValidatorError):
+            Validator.match_deposit(deposits, 1284, RECEIVER, 10, '0x01', 1)
+        with self.assertRaises(Validator.ValidatorError):
+            Validator.match_deposit(deposits, 5, RECEIVER, 20, '0x01', 1)
@@ -0,0 +1,112 @@
+import unittest
+
+import web3
+import web3.exceptions
+from hexbytes import HexBytes
+from web3.providers.eth_tester import EthereumTesterProvider
+
+from src.util import MULTICALL3_ABI, ContractWrapper, RPCBatch
+
+
+# init code of contracts answering every call with 7 or 42, and of one reverting every call
+RETURNS_7 = '0x600a80600b6000396000f3600760005260206000f3'
+RETURNS_42 = '0x600a80600b6000396000f3602a60005260206000f3'
+REVERTING = '0x600580600b6000396000f360006000fd'
+VALUE_ABI = [{
+    'name': 'value', 'type': 'function', 'stateMutability': 'view', 'inputs': [],
+    'outputs': [{'name': '', 'type': 'uint256'}]
+}]
+MULTICALL_ADDRESS = '0x' + 'ca' * 20
+
+
+class BatchProvider(EthereumTesterProvider):
+    """
+    eth-tester answering batches like a node: failures become JSON-RPC errors of the response and
+    aggregate3 calls to MULTICALL_ADDRESS are executed as Multicall3 would
+    """
+    def __init__(self):
+        super().__init__()
+        self.api = web3.Web3(self)
+        self.multicall = self.api.eth.contract(web3.Web3.to_checksum_address(MULTICALL_ADDRESS), abi=MULTICALL3_ABI)
+        self.batches = []
+
+    def make_batch_request(self, requests: list) -> list:
+        self.batches.append([method for method, _ in requests])
+        responses = []
+        for request_id, (method, params) in enumerate(requests):
+            try:
+                if method == 'eth_call' and params[0]['to'] == self.multicall.address:
+                    result = self.aggregate3(params[0]['data'])
+                else:
+                    result = self.api.manager._make_request(method, params)['result']
+                response = {'result': result}
+            except Exception as e:
+                response = {'error': {'code': 3, 'message': str(e)}}
+            responses.append({'jsonrpc': '2.0', 'id': request_id, **response})
+        return responses
+
+    def aggregate3(self, data: str) -> str:
+        _, arguments = self.multicall.decode_function_input(data)
+        results = []
+        for call in arguments['calls']:
+            try:
+                results.append((True, self.api.eth.call({'to': call['target'], 'data': call['callData']})))
+            except Exception:
+                results.append((False, b''))
+        return HexBytes(self.api.codec.encode(['(bool,bytes)[]'], [results])).hex()
+
+
+class RPCBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.provider = BatchProvider()
+        self.api = self.provider.api
+        self.account = self.api.eth.accounts[0]
+        self.seven, self.forty_two, self.reverting = (
+            ContractWrapper(self.api, self.deploy(code), VALUE_ABI) for code in (RETURNS_7, RETURNS_42, REVERTING)
+        )
+
+    def deploy(self, code: str) -> str:
+        tx_hash = self.api.eth.send_transaction({'from': self.account, 'data': code})
+        return self.api.eth.wait_for_transaction_receipt(tx_hash)['contractAddress']
+
+    def test_results_in_order_of_adding(self):
+        tx_hash = self.api.eth.send_transaction({'from': self.account, 'to': self.account, 'value': 1})
+        batch = RPCBatch(self.api)
+        batch.add_call(self.seven, 'value').add_receipt(tx_hash).add_call(self.forty_two, 'value')
+        batch.add_transaction(tx_hash).add_block_hash(1).add_block_hash(1_000)
+        seven, receipt, forty_two, tx, block_hash, missing_block = batch.execute()
+        self.assertEqual((seven, forty_two), (7, 42))
+        self.assertEqual((receipt['transactionHash'], tx['hash']), (tx_hash, tx_hash))
+        self.assertEqual(block_hash, self.api.eth.get_block(1)['hash'])
+        self.assertIsNone(missing_block)
+        # one round-trip
+        self.assertEqual(len(self.provider.batches), 1)
+
+    def test_calls_folded_into_aggregate3(self):
+        batch = RPCBatch(self.api, MULTICALL_ADDRESS)
+        batch.add_call(self.forty_two, 'value').add_block_hash(1).add_call(self.seven, 'value')
+        self.assertEqual(batch.execute()[::2], [42, 7])
+        self.assertEqual(self.provider.batches, [['eth_call', 'eth_getBlockByNumber']])
+
+        batch = RPCBatch(self.api, MULTICALL_ADDRESS).add_call(self.seven, 'value').add_call(self.reverting, 'value')
+        with self.assertRaises(web3.exceptions.ContractLogicError):
+            batch.execute()
+
+    def test_reverts_and_errors_unwrapped(self):
+        batch = RPCBatch(self.api).add_call(self.seven, 'value').add_call(self.reverting, 'value')
+        with self.assertRaises(web3.exceptions.ContractLogicError):
+            batch.execute()
+        with self.assertRaises(ValueError) as raised:
+            RPCBatch._unwrap({'jsonrpc': '2.0', 'id': 0, 'error': {'code': -32000, 'message': 'header not found'}})
+        self.assertNotIsInstance(raised.exception, web3.exceptions.ContractLogicError)
+        self.assertEqual(RPCBatch._unwrap({'jsonrpc': '2.0', 'id': 0, 'result': None}), None)
+
+    def test_unknown_transaction_and_pending_receipt(self):
+        unknown = HexBytes(b'\x01' * 32)
+        self.assertEqual(RPCBatch(self.api).add_receipt(unknown).execute(), [None])
+        with self.assertRaises(web3.exceptions.TransactionNotFound):
+            RPCBatch(self.api).add_transaction(unknown).execute()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import web3
+
+from src.workers.aio import AsyncWorker
+from src.workers.aio.base import AsyncRPCRouter
+from src.workers.base import RPCRouter
+from src.util import make_batch_request
+
+
+class StubRPCServer(ThreadingHTTPServer):
+    def __init__(self, head: int = 100, delay: float = 0.0, fail: bool = False):
+        self.head = head
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.hits = 0
+        super().__init__(('127.0.0.1', 0), StubRPCHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def respond(self, request: dict) -> dict:
+        self.calls.append(request['method'])
+        result = {'eth_blockNumber': hex(self.head), 'eth_chainId': hex(1)}.get(request['method'], None)
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+
+class StubRPCHandler(BaseHTTPRequestHandler):
+    server: StubRPCServer
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.hits += 1
+        time.sleep(self.server.delay)
+        if self.server.fail:
+            self.send_response(502)
+            self.end_headers()
+            return
+        if isinstance(request, list):
+            response = [self.server.respond(item) for item in request]
+        else:
+            response = self.server.respond(request)
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RPCRouterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def make_server(self, **kwargs) -> StubRPCServer:
+        server = StubRPCServer(**kwargs)
+        self.servers.append(server)
+        return server
+
+    def make_router(self, *servers: StubRPCServer, **kwargs) -> RPCRouter:
+        router = RPCRouter([server.url for server in servers], timeout=1.0, **kwargs)
+        router.EXPLORE_RATE = 0
+        return router
+
+    def test_failover_to_healthy_endpoint(self):
+        dead = self.make_server(fail=True)
+        alive = self.make_server(head=42)
+        api = web3.Web3(self.make_router(dead, alive))
+
+        for _ in range(3):
+            self.assertEqual(api.eth.block_number, 42)
+        # dead endpoint is tried once and then cools down
+        self.assertEqual(dead.hits, 1)
+        self.assertEqual(alive.calls.count('eth_blockNumber'), 3)
+
+    def test_prefers_fastest_endpoint(self):
+        slow = self.make_server(delay=0.2)
+        fast = self.make_server()
+        router = self.make_router(slow, fast)
+        api = web3.Web3(router)
+
+        # every endpoint is measured once, then the fast one takes the traffic
+        for _ in range(10):
+            api.eth.block_number
+        self.assertLessEqual(slow.hits, 1)
+        self.assertGreaterEqual(len(fast.calls), 9)
+        self.assertLess(router.endpoints[1].score, router.endpoints[0].score)
+
+    def test_lagging_endpoint_is_deprioritized(self):
+        behind = self.make_server(head=10)
+        synced = self.make_server(head=100, delay=0.05)
+        router = self.make_router(behind, synced)
+        api = web3.Web3(router)
+
+        api.eth.block_number
+        api.eth.block_number
+        self.assertEqual(router.head, 100)
+        # faster, but too far behind the best known head
+        self.assertEqual(router.ranked_endpoints()[0].url, synced.url)
+        self.assertEqual(api.eth.block_number, 100)
+
+    def test_transaction_is_not_retried(self):
+        dead = self.make_server(fail=True)
+        alive = self.make_server()
+        router = self.make_router(dead, alive)
+
+        with self.assertRaises(RPCRouter.RPCRouterError):
+            router.make_request('eth_sendRawTransaction', ['0x00'])
+        self.assertEqual(dead.hits + alive.hits, 1)
+
+    def test_all_endpoints_failed(self):
+        router = self.make_router(self.make_server(fail=True), self.make_server(fail=True))
+        with self.assertRaises(RPCRouter.RPCRouterError):
+            web3.Web3(router).eth.block_number
+
+    def test_batch_request(self):
+        dead = self.make_server(fail=True)
+        alive = self.make_server(head=7)
+        api = web3.Web3(self.make_router(dead, alive))
+
+        responses = make_batch_request(api, [('eth_chainId', []), ('eth_blockNumber', [])])
+        self.assertEqual([response['result'] for response in responses], ['0x1', '0x7'])
+
+    def test_async_failover_to_healthy_endpoint(self):
+        dead = self.make_server(fail=True)
+        alive = self.make_server(head=42)
+        router = AsyncRPCRouter([dead.url, alive.url], timeout=1.0)
+        router.EXPLORE_RATE = 0
+
+        async def block_numbers():
+            api = web3.AsyncWeb3(router)
+            return [await api.eth.block_number for _ in range(3)]
+        self.assertEqual(asyncio.run(block_numbers()), [42] * 3)
+        self.assertEqual(dead.hits, 1)
+        self.assertEqual(router.head, 42)
+        # a fresh router tries the dead endpoint first, transactions are not sent twice
+        with self.assertRaises(AsyncRPCRouter.RPCRouterError):
+            asyncio.run(AsyncRPCRouter([dead.url, alive.url]).make_request('eth_sendRawTransaction', ['0x00']))
+        self.assertEqual((dead.hits, alive.calls.count('eth_sendRawTransaction')), (2, 0))
+
+    def test_async_api_routes_comma_separated_urls(self):
+        urls = ['http://127.0.0.1:1', 'http://127.0.0.1:2']
+        self.assertIsInstance(AsyncWorker.construct_http_api(urls).provider, AsyncRPCRouter)
+        self.assertEqual(AsyncWorker.construct_http_api(urls[:1]).provider.endpoint_uri, urls[0])
@@ -0,0 +1,160 @@
+import logging
+import unittest
+
+from hexbytes import HexBytes
+
+from src.workers import Signer
+from src.workers.prefetch import PrefetchCache
+
+
+class Outcomes(object):
+    """Stands for CheckpointStore, outcomes in the order they were recorded"""
+    def __init__(self):
+        self.records = []
+
+    def is_processed(self, event) -> bool:
+        return any(recorded is event for recorded, _ in self.records)
+
+    def outcome(self, event):
+        return self.last(event) if self.is_processed(event) else None
+
+    def record(self, event, outcome: str):
+        self.records.append((event, outcome))
+
+    def flush(self):
+        pass
+
+    def last(self, event) -> str:
+        return [outcome for recorded, outcome in self.records if recorded is event][-1]
+
+
+class Batch(object):
+    """Stands for RPCBatch, answers calls from a (method, arguments) -> result map"""
+    def __init__(self, results: dict, executed: list):
+        self.results = results
+        self.executed = executed
+        self.calls = []
+
+    def add_call(self, contract, method_name: str, arguments: tuple = ()):
+        self.calls.append((method_name, arguments))
+        return self
+
+    def add_receipt(self, tx_hash: str):
+        self.calls.append(('receipt', tx_hash))
+        return self
+
+    def execute(self) -> list:
+        self.executed.append(self.calls)
+        return [self.results[call] for call in self.calls]
+
+
+class Bridge(object):
+    """Stands for the bridge ContractWrapper, only read through Batch"""
+    api = None
+
+
+def make_event(name: str, tx_hash: int, log_index: int, **args) -> dict:
+    return {
+        'event': name, 'args': args, 'transactionHash': HexBytes(tx_hash.to_bytes(32, 'big')),
+        'blockHash': HexBytes(b'\x01' * 32), 'blockNumber': 10, 'logIndex': log_index
+    }
+
+
+class SignerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.signer = Signer.__new__(Signer)
+        self.signer.name = Signer.TYPE_LISTER
+        self.signer.debug = False
+        self.signer.log = logging.getLogger('worker.test')
+        self.signer.chain_id = 1
+        self.signer.prefetch_cache = PrefetchCache()
+        self.signer._checkpoints = self.outcomes = Outcomes()
+        self.batches = []
+
+    def check_deposit_event(self, event):
+        return event['args']['targetChainId'], [0, 0, 1, 1, int(event['transactionHash'].hex(), 16)]
+
+    def submit_batch_tx(self, chain_id, contract, method_name, items, on_revert=None, on_submitted=None):
+        """Rejects items with a txHash above 100, mines the rest in one batch"""
+        self.batches.append((chain_id, method_name, items))
+        on_submitted(items, HexBytes(b'\x02' * 32))
+        for item in items:
+            if item[-1] > 100:
+                on_revert(item, ValueError('token not registered'))
+        return [([item for item in items if item[-1] <= 100], {'blockNumber': 11})]
+
+    def test_list_deposits_grouped_deduped_and_isolated(self):
+        self.signer.check_deposit_event = self.check_deposit_event
+        self.signer.submit_batch_tx = self.submit_batch_tx
+        events = [
+            make_event('Deposit', 1, 0, targetChainId=2), make_event('Deposit', 1, 1, targetChainId=2),
+            make_event('Deposit', 2, 2, targetChainId=3), make_event('Deposit', 101, 3, targetChainId=2),
+        ]
+        self.assertEqual(self.signer.listen_deposits(10, 10, events=events), [11, 11])
+        # one `list` batch per target chain, the second deposit of a transaction is not listed
+        self.assertEqual([(chain_id, len(items)) for chain_id, _, items in self.batches], [(2, 2), (3, 1)])
+        self.assertEqual(self.outcomes.last(events[1]), 'error: multiple deposits in one transaction')
+        self.assertEqual(self.outcomes.last(events[0]), 'listed')
+        self.assertEqual(self.outcomes.last(events[2]), 'listed')
+        self.assertEqual(
+            self.outcomes.last(events[3]), 'error: listing rejected by target bridge: token not registered'
+        )
+        # recorded as submitted before the batch was mined
+        self.assertEqual(self.outcomes.records[1], (events[0], f'submitted 2 0x{"02" * 32} listed'))
+
+    def test_transfers_read_in_one_batch_and_recorded_when_mined(self):
+        self.signer.name = Signer.TYPE_TRANSACTOR
+        self.signer.api = None
+        self.signer.bridge = Bridge()
+        hashes = [HexBytes(bytes([index]) * 32) for index in range(4)]
+        executed = []
+        results = {('requiredConfirmations', ()): 2}
+        for index, tx_hash in enumerate(hashes):
+            # 0 and 1 have enough confirmations, 1 is rejected by the bridge, 2 is already sent, 3 lacks one
+            results[('confirmedBy', (tx_hash,))] = [1] if index == 3 else [1, 2]
+            results[('confirmations', (tx_hash,))] = (0, 1, 1, index == 2)
+        self.signer.rpc_batch = lambda api, chain_id: Batch(results, executed)
+        transferred = []
+
+        def transfer(tx_hashes, on_submitted=None):
+            transferred.append(tx_hashes)
+            on_submitted(tx_hashes, HexBytes(b'\x03' * 32))
+            return tx_hashes[:1]
+        self.signer.transfer = transfer
+        # two validators confirmed the first transfer
+        events = [
+            make_event('Confirmed', 10, index, txHash=tx_hash)
+            for index, tx_hash in enumerate([hashes[0], *hashes])
+        ]
+        self.signer.listen_confirmations(10, 10, events=events)
+        self.assertEqual(len(executed[-1]), 8)
+        self.assertEqual(transferred, [[hashes[0], hashes[1]]])
+        self.assertEqual(
+            [self.outcomes.last(event) for event in events],
+            ['transfer sent', 'transfer sent', 'transfer rejected', 'not transferable', 'not transferable']
+        )
+
+
+    def test_submitted_events_resolved_by_receipts(self):
+        self.signer.api = None
+        self.signer.get_chain_api = lambda chain_id: None
+        mined, dropped, reverted = (HexBytes(bytes([index]) * 32) for index in (4, 5, 6))
+        events = [make_event('Deposit', index, index, targetChainId=2) for index in range(5)]
+        self.signer.record_submitted(events[:2], 2, mined, 'listed')
+        self.signer.record_submitted(events[2:3], 2, dropped, 'listed')
+        self.signer.record_submitted(events[3:4], 1, reverted, 'transfer sent')
+        executed = []
+        self.signer.rpc_batch = lambda api, chain_id: Batch({
+            ('receipt', mined.hex()): {'status': 1}, ('receipt', dropped.hex()): None,
+            ('receipt', reverted.hex()): {'status': 0},
+        }, executed)
+        # not mined transactions are sent again, the unhandled event is handled
+        self.assertEqual(self.signer.unprocessed(events), events[2:])
+        self.assertEqual([self.outcomes.last(event) for event in events[:2]], ['listed', 'listed'])
+        # one batch per chain, a transaction of several events is looked up once
+        self.assertEqual(sorted(len(calls) for calls in executed), [1, 2])
+        self.assertEqual(self.signer.unprocessed(events), events[2:])
+
+
+if __name__ == '__main__':
+    unittest.main()
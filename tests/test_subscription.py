@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+import unittest
+
+from websockets.sync.server import serve
+
+from src.workers.subscription import HeadSubscription
+
+
+class StubWebSocketRPC(object):
+    SUBSCRIPTION_ID = '0xcd0c3e8af590364c09d0fa6a1210faf5'
+
+    def __init__(self):
+        self.connections = []
+        self.server = serve(self.handle, '127.0.0.1', 0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'ws://127.0.0.1:{self.server.socket.getsockname()[1]}'
+
+    def handle(self, connection):
+        request = json.loads(connection.recv())
+        if request['method'] != 'eth_subscribe' or request['params'] != ['newHeads']:
+            connection.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'error': {'message': 'unsupported'}}))
+            return
+        connection.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': self.SUBSCRIPTION_ID}))
+        self.connections.append(connection)
+        # keep the connection open until the client or the test closes it
+        for _ in connection:
+            pass
+
+    def announce(self, number: int):
+        for connection in self.connections:
+            connection.send(json.dumps({
+                'jsonrpc': '2.0', 'method': 'eth_subscription',
+                'params': {'subscription': self.SUBSCRIPTION_ID, 'result': {'number': hex(number)}}
+            }))
+
+    def drop(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+
+    def shutdown(self):
+        self.drop()
+        self.server.shutdown()
+
+
+class HeadSubscriptionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StubWebSocketRPC()
+        self.subscription = HeadSubscription(self.server.url, reconnect_delay=0.1).start()
+        self.wait_connected()
+
+    def wait_connected(self):
+        deadline = time.monotonic() + 5
+        while not self.subscription.connected:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.subscription.stop()
+        self.server.shutdown()
+
+    def test_wakes_on_new_head(self):
+        threading.Timer(0.1, self.server.announce, (101,)).start()
+        started = time.monotonic()
+        self.assertEqual(self.subscription.wait_for_head(100, timeout=5), 101)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_waits_for_confirmation_depth(self):
+        self.server.announce(10)
+        self.assertIsNone(self.subscription.wait_for_head(12, timeout=0.3))
+        self.server.announce(11)
+        self.server.announce(12)
+        self.assertEqual(self.subscription.wait_for_head(12, timeout=5), 12)
+
+    def test_falls_back_when_dropped_and_reconnects(self):
+        self.server.drop()
+        started = time.monotonic()
+        # a dropped subscription does not block the caller, it polls instead
+        self.assertIsNone(self.subscription.wait_for_head(1, timeout=5))
+        self.assertLess(time.monotonic() - started, 1)
+
+        self.wait_connected()
+        threading.Timer(0.1, self.server.announce, (7,)).start()
+        self.assertEqual(self.subscription.wait_for_head(7, timeout=5), 7)
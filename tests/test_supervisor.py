@@ -0,0 +1,58 @@
+import os
+import unittest
+
+from src.workers.base import WorkerConfig
+from src.workers.supervisor import Supervisor
+
+
+class SupervisorConfigTestCase(unittest.TestCase):
+    def test_parse_config(self):
+        os.environ['SUPERVISOR_TEST_KEY'] = '0x' + '11' * 32
+        specs = Supervisor.parse_config({
+            'defaults': {'eth_block_confirmations': 12, 'poll_latency': 500},
+            'bridges': [
+                {'name': 'moonbeam', 'eth_rpc': 'http://a', 'eth_private_key': '${SUPERVISOR_TEST_KEY}',
+                 'roles': ['lister', 'validator']},
+                {'name': 'eth', 'eth_rpc': 'http://b', 'eth_block_confirmations': 64,
+                 'roles': ['transactor', 'webscanner']},
+            ]
+        })
+        self.assertEqual(
+            [(bridge, role) for bridge, role, _ in specs],
+            [('moonbeam', 'lister'), ('moonbeam', 'validator'), ('eth', 'transactor'), ('eth', 'webscanner')]
+        )
+        config = specs[0][2]
+        self.assertEqual(config.eth_private_key, '0x' + '11' * 32)
+        self.assertEqual(config.poll_latency, 0.5)
+        self.assertEqual(config.checkpoint_namespace, 'moonbeam')
+        self.assertTrue(config.share_logs)
+        self.assertEqual(specs[2][2].eth_block_confirmations, 64)
+        self.assertEqual(specs[2][2].eth_rpc_urls, ['http://b'])
+        # settings of one worker do not leak into the class defaults
+        self.assertFalse(WorkerConfig.share_logs)
+
+    def test_rejects_unknown_settings(self):
+        with self.assertRaises(Supervisor.SupervisorError):
+            Supervisor.parse_config({'bridges': [{'eth_rpcs': 'http://a', 'roles': ['validator']}]})
+        with self.assertRaises(Supervisor.SupervisorError):
+            Supervisor.parse_config({'bridges': [{'eth_rpc': 'http://a', 'roles': ['relayer']}]})
+        with self.assertRaises(Supervisor.SupervisorError):
+            Supervisor.parse_config({'bridges': []})
+
+    def test_values_converted_and_variables_required(self):
+        os.environ['SUPERVISOR_TEST_CONFIRMATIONS'] = '12'
+        os.environ.pop('SUPERVISOR_TEST_UNSET', None)
+        config = Supervisor.make_config({
+            'eth_block_confirmations': '${SUPERVISOR_TEST_CONFIRMATIONS}', 'rpc_timeout': 5, 'share_logs': 'false',
+            'poll_latency': '500', 'eth_ws_rpc': None
+        })
+        self.assertEqual((config.eth_block_confirmations, config.rpc_timeout), (12, 5.0))
+        self.assertIsInstance(config.rpc_timeout, float)
+        self.assertIs(config.share_logs, False)
+        self.assertEqual(config.poll_latency, 0.5)
+        self.assertIsNone(config.eth_ws_rpc)
+        with self.assertRaises(Supervisor.SupervisorError):
+            Supervisor.make_config({'eth_private_key': '${SUPERVISOR_TEST_UNSET}'})
+        for key, value in (('eth_block_confirmations', 'twelve'), ('tx_batch_size', 2.5), ('share_logs', 'maybe')):
+            with self.assertRaises(Supervisor.SupervisorError):
+                Supervisor.make_config({key: value})
@@ -0,0 +1,68 @@
+import unittest
+
+import web3
+
+from src import tracing
+
+
+class TracerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tracer = tracing.Tracer()
+        self.tracer.enable()
+
+    def test_disabled(self):
+        tracer = tracing.Tracer()
+        with tracer.span('event') as span:
+            tracer.record('rpc eth_call', 0.0)
+        self.assertIsNone(span)
+        self.assertEqual(len(tracer.roots), 0)
+        self.assertEqual(tracer.stats, {})
+
+    def test_nesting(self):
+        with self.tracer.span('blocks', range='1-10'):
+            with self.tracer.span('event', txHash='0x01'):
+                with self.tracer.span('call isConfirmed'):
+                    self.tracer.record('rpc eth_call', 0.0, endpoint='a')
+            with self.assertRaises(ValueError):
+                with self.tracer.span('event', txHash='0x02'):
+                    raise ValueError('reverted')
+        self.assertEqual(len(self.tracer.roots), 1)
+        blocks = self.tracer.roots[0]
+        self.assertEqual([span.attributes['txHash'] for span in blocks.children], ['0x01', '0x02'])
+        self.assertEqual(blocks.children[0].children[0].children[0].name, 'rpc eth_call')
+        self.assertEqual(blocks.children[1].error, 'ValueError: reverted')
+        self.assertEqual(self.tracer.stats['event'][0], 2)
+        self.assertEqual(self.tracer.stats['event'][3], 1)
+
+    def test_report(self):
+        with self.tracer.span('blocks', range='1-10'):
+            with self.tracer.span('event', txHash='0x01'):
+                self.tracer.record('rpc eth_getTransactionReceipt', 0.0, endpoint='a')
+        with self.tracer.span('event', txHash='0x02'):
+            pass
+        report = self.tracer.report(top=2, slowest=1)
+        lines = report.splitlines()
+        self.assertEqual(lines[0], 'Top 2 spans by total time')
+        # the receipt span is timed from 0.0 and the slowest by far
+        self.assertTrue(lines[2].endswith('rpc eth_getTransactionReceipt'))
+        waterfall = lines[lines.index('') + 2:]
+        self.assertEqual(len(waterfall), 2)
+        self.assertTrue(waterfall[0].endswith('event txHash=0x01'))
+        self.assertTrue(waterfall[1].endswith('  rpc eth_getTransactionReceipt endpoint=a'))
+
+    def test_rpc_middleware(self):
+        api = web3.Web3(web3.EthereumTesterProvider())
+        api.middleware_onion.add(tracing.rpc_middleware('tester'), 'tracing')
+        previous, tracing.TRACER = tracing.TRACER, self.tracer
+        try:
+            with self.tracer.span('event'):
+                api.eth.get_block('latest')
+        finally:
+            tracing.TRACER = previous
+        calls = [span.name for span in self.tracer.roots[0].children]
+        self.assertIn('rpc eth_getBlockByNumber', calls)
+        self.assertEqual(self.tracer.roots[0].children[-1].attributes['endpoint'], 'tester')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import time
+import unittest
+
+import web3
+import eth_account
+
+from src.workers.transactions import TransactionManager
+
+
+class ValueTransfer(object):
+    """Stands for a contract function, TransactionManager only needs build_transaction"""
+    def __init__(self, api: web3.Web3, to: str, gas: int = 21000):
+        self.api = api
+        self.to = to
+        self.gas = gas
+
+    def build_transaction(self, options: dict) -> dict:
+        tx = {
+            'to': self.to, 'value': 1, 'gas': self.gas, 'chainId': self.api.eth.chain_id,
+            'maxFeePerGas': 2 * 10 ** 9, 'maxPriorityFeePerGas': 10 ** 9, **options
+        }
+        tx.pop('from')
+        return tx
+
+
+class BatchContract(object):
+    """Stands for a ContractWrapper, every chunk becomes a call of the contract at `to`"""
+    def __init__(self, api: web3.Web3, to: str):
+        self.api = api
+        self.to = to
+
+    def split_batch(self, method_name: str, items: list, options: dict = None, batch_size: int = 50, **kwargs):
+        for i in range(0, len(items), batch_size):
+            yield items[i:i + batch_size], None
+
+    def make_tx(self, method_name: str, arguments: tuple = ()):
+        return ValueTransfer(self.api, self.to, gas=50000)
+
+
+# runtime code PUSH1 0 PUSH1 0 REVERT behind init code returning it
+REVERTING_CONTRACT = '0x600580600b6000396000f360006000fd'
+
+
+class TransactionManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.provider = web3.EthereumTesterProvider()
+        self.api = web3.Web3(self.provider)
+        self.account = eth_account.Account.create()
+        self.api.eth.send_transaction({'from': self.api.eth.accounts[0], 'to': self.account.address, 'value': 10 ** 20})
+        self.manager = TransactionManager(self.api, self.account, poll_latency=0.05, stuck_timeout=0.3)
+        self.function = ValueTransfer(self.api, self.api.eth.accounts[1])
+
+    def test_pipelines_with_local_nonces(self):
+        receipts = []
+        pending = [self.manager.submit(self.function, on_receipt=receipts.append) for _ in range(5)]
+        self.assertEqual([item.nonce for item in pending], [0, 1, 2, 3, 4])
+        self.manager.flush(10)
+        self.assertEqual([receipt['status'] for receipt in receipts], [1] * 5)
+        self.assertEqual(self.api.eth.get_transaction_count(self.account.address), 5)
+
+    def test_resyncs_nonce_when_idle(self):
+        self.manager.submit(self.function)
+        self.manager.flush(10)
+        # the account is used outside of the manager
+        signed = self.account.sign_transaction(self.function.build_transaction({'from': None, 'nonce': 1}))
+        self.api.eth.send_raw_transaction(signed.rawTransaction)
+        self.assertEqual(self.manager.submit(self.function).nonce, 2)
+        self.manager.flush(10)
+
+    def test_bumps_stuck_transaction(self):
+        self.provider.ethereum_tester.disable_auto_mine_transactions()
+        receipts = []
+        pending = self.manager.submit(self.function, on_receipt=receipts.append)
+        time.sleep(1)
+        self.assertGreater(len(pending.tx_hashes), 1)
+        self.assertGreater(pending.tx['maxFeePerGas'], 2 * 10 ** 9)
+
+        self.provider.ethereum_tester.mine_blocks(1)
+        self.manager.flush(10)
+        self.assertEqual(receipts[0]['transactionHash'], pending.tx_hashes[-1])
+
+    def deploy_reverting(self) -> str:
+        tx_hash = self.api.eth.send_transaction({'from': self.api.eth.accounts[0], 'data': REVERTING_CONTRACT})
+        return self.api.eth.wait_for_transaction_receipt(tx_hash)['contractAddress']
+
+    def test_batch_revert_is_an_error_without_on_revert(self):
+        contract = BatchContract(self.api, self.deploy_reverting())
+        included = []
+        pending = self.manager.submit_batch(contract, 'list', [1, 2, 3], batch_size=2, on_included=included.append)
+        with self.assertRaises(TransactionManager.TransactionError) as context:
+            self.manager.flush(10, pending=pending)
+        self.assertIn('list of (2) items reverted on-chain', context.exception.message)
+        self.assertEqual(included, [])
+
+    def test_batch_revert_is_bisected_with_on_revert(self):
+        contract = BatchContract(self.api, self.deploy_reverting())
+        reverted, submitted = [], []
+        pending = self.manager.submit_batch(
+            contract, 'list', [1, 2, 3, 4], batch_size=4, on_revert=lambda item, error: reverted.append(item),
+            on_submitted=lambda chunk, tx_hash: submitted.append(chunk)
+        )
+        self.manager.flush(10, pending=pending)
+        self.assertEqual(sorted(reverted), [1, 2, 3, 4])
+        # the chunk, its halves and their halves
+        self.assertEqual(len(pending), 7)
+        self.assertEqual(submitted[0], [1, 2, 3, 4])
+
+    def test_flush_waits_for_given_transactions_only(self):
+        contract = BatchContract(self.api, self.deploy_reverting())
+        failing = self.manager.submit_batch(contract, 'list', [1])
+        own = [self.manager.submit(self.function)]
+        self.manager.flush(10, pending=own)
+        self.assertTrue(own[0].done)
+        with self.assertRaises(TransactionManager.TransactionError):
+            self.manager.flush(10, pending=failing)